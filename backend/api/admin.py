@@ -31,4 +31,10 @@ custom_admin_site.register(SupportedTranscriptLanguage)
 custom_admin_site.register(ProjectSupportedTranscriptLanguage)
 custom_admin_site.register(ProjectClient)
 custom_admin_site.register(ClientJob)
-custom_admin_site.register(Transcript)
\ No newline at end of file
+custom_admin_site.register(Transcript)
+custom_admin_site.register(AudioUpload)
+custom_admin_site.register(NodeOutputCache)
+custom_admin_site.register(JobNodeOutput)
+custom_admin_site.register(NodeTrace)
+custom_admin_site.register(JobRun)
+custom_admin_site.register(BatchRun)
@@ -0,0 +1,24 @@
+# engine/events.py
+
+
+class ExecutionEvents:
+    """
+    Hooks called on the flow loop while a plan runs. The default
+    implementation ignores everything; subclass it to observe a run.
+    `transcript` is the transcript index for steps that run per transcript.
+    """
+    def node_started(self, step, inputs, transcript=None, key=None):
+        """
+        `key` is the memo key of AI and code nodes, computed once by the executor.
+        """
+
+    def node_token(self, step, text):
+        """
+        A piece of a node's output, for runners that can stream.
+        """
+
+    def node_finished(self, step, output, cached, transcript=None):
+        pass
+
+    def node_failed(self, step, error, transcript=None):
+        pass
@@ -0,0 +1,266 @@
+# engine/executor.py
+import asyncio
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from api.engine.events import ExecutionEvents
+from api.engine.loop import run_sync
+from api.engine.memo import get_memo, memo_key
+from api.engine.plan import BLOCKING_NODE_TYPES, get_plan
+from api.engine.runners import RUNNERS
+from api.engine.tracing import TracingEvents, start_trace
+from api.models import JobNodeOutput, ProjectClient
+from api.services.transcript_patches import current_contents
+
+
+# Joins the per-transcript results a merged step receives
+TRANSCRIPT_SEPARATOR = '\n\n---\n\n'
+
+
+def node_state_key(node_id, transcript=None):
+    """
+    Key of a node's entry in a job's node_state; per-transcript steps have one
+    entry per transcript.
+    """
+    return node_id if transcript is None else f'{node_id}@{transcript}'
+
+
+class NodeExecutionError(Exception):
+    """
+    Raised when a node fails while a plan is executed.
+    """
+    def __init__(self, step, message):
+        super().__init__(f"{step.label}: {message}")
+        self.step = step
+
+
+class ConcurrencyLimits:
+    """
+    Global and per-project caps on the number of blocking nodes running at once.
+    Coroutine runners are awaited on the loop, others go to its thread pool.
+    Must only be used from the flow loop.
+    """
+    def __init__(self, global_limit, project_limit):
+        self.project_limit = project_limit
+        self.global_semaphore = asyncio.Semaphore(global_limit)
+        self.project_semaphores = {}
+
+    async def run(self, project_id, func, *args):
+        project_semaphore = self.project_semaphores.get(project_id)
+        if project_semaphore is None:
+            project_semaphore = self.project_semaphores[project_id] = asyncio.Semaphore(self.project_limit)
+
+        async with project_semaphore, self.global_semaphore:
+            if asyncio.iscoroutinefunction(func):
+                return await func(*args)
+            return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+_limits = None
+
+
+def get_limits():
+    global _limits
+    if _limits is None:
+        _limits = ConcurrencyLimits(settings.FLOW_MAX_CONCURRENCY, settings.FLOW_MAX_PROJECT_CONCURRENCY)
+    return _limits
+
+
+async def execute_plan_async(plan, transcripts, events=None, node_state=None):
+    """
+    Run a plan, starting every step as soon as all of its inputs are ready.
+
+    Independent branches run concurrently, so the run takes roughly as long as
+    the slowest path through the flow. Steps in `plan.per_transcript` run once
+    per transcript, all transcripts at the same time; steps downstream of them
+    receive the per-transcript results joined in transcript order.
+
+    AI and code nodes whose content and inputs were seen before are served
+    from the node output memo instead of being run again. Progress is
+    reported to `events` (an ExecutionEvents).
+
+    `node_state` maps node id to (memo key, output) of a previous run of the
+    same job and is updated in place. A node whose key is unchanged reuses its
+    output; since keys cover the inputs, a change (a transcript or a node's
+    content) only dirties the nodes downstream of it. Once the run succeeds,
+    entries it did not produce (removed nodes, transcripts beyond the current
+    count) are dropped from `node_state`.
+    Returns a mapping of node id to output.
+    """
+    events = events or ExecutionEvents()
+    context = {'transcripts': transcripts, 'on_token': events.node_token}
+    # Per-transcript steps see a single transcript and do not stream
+    transcript_contexts = [{'transcripts': [transcript], 'on_token': None} for transcript in transcripts]
+    limits = get_limits()
+    memo = get_memo()
+    loop = asyncio.get_event_loop()
+    outputs = {}  # (node id, transcript index or None) -> output
+    tasks = {}
+    written = set()  # node_state keys produced by this run
+
+    def instances(source_id, index):
+        if source_id not in plan.per_transcript:
+            return [(source_id, None)]
+        if index is not None:
+            return [(source_id, index)]
+        return [(source_id, source_index) for source_index in range(len(transcripts))]
+
+    def input_text(source_id, index):
+        return TRANSCRIPT_SEPARATOR.join(outputs[instance] for instance in instances(source_id, index))
+
+    async def run_step(step, index):
+        if step.inputs:
+            await asyncio.gather(*(
+                tasks[instance] for source_id in set(step.inputs) for instance in instances(source_id, index)
+            ))
+        inputs = [(plan.steps_by_id[source_id].label, input_text(source_id, index)) for source_id in step.inputs]
+
+        runner = RUNNERS[step.type]
+        step_context = context if index is None else transcript_contexts[index]
+        key = memo_key(step, inputs) if step.type in BLOCKING_NODE_TYPES else None
+        events.node_started(step, inputs, index, key)
+        cached = False
+        try:
+            if key is not None:
+                state_key = node_state_key(step.node_id, index)
+                previous = node_state.get(state_key) if node_state is not None else None
+                if previous is not None and previous[0] == key:
+                    output = previous[1]
+                # The persistent tier queries the database, so keep it off the loop
+                elif memo.persistent:
+                    output = await loop.run_in_executor(None, memo.get, key)
+                else:
+                    output = memo.get(key)
+
+                cached = output is not None
+                if output is None:
+                    output = await limits.run(plan.project_id, runner, step, inputs, step_context)
+                    if memo.persistent:
+                        await loop.run_in_executor(None, memo.set, key, output)
+                    else:
+                        memo.set(key, output)
+                if node_state is not None:
+                    node_state[state_key] = (key, output)
+                    written.add(state_key)
+            else:
+                output = runner(step, inputs, step_context)
+        except Exception as e:
+            events.node_failed(step, str(e), index)
+            raise NodeExecutionError(step, str(e)) from e
+        outputs[(step.node_id, index)] = output
+        events.node_finished(step, output, cached, index)
+
+    # Steps are in topological order, so every input task exists before its dependents
+    for step in plan.steps:
+        for instance in instances(step.node_id, None):
+            tasks[instance] = asyncio.ensure_future(run_step(step, instance[1]))
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except Exception:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    if node_state is not None:
+        for state_key in set(node_state) - written:
+            del node_state[state_key]
+    return {step.node_id: input_text(step.node_id, None) for step in plan.steps}
+
+
+def execute_plan(plan, transcripts):
+    """
+    Blocking wrapper around execute_plan_async for use from Django views.
+    """
+    return run_sync(execute_plan_async(plan, transcripts))
+
+
+def get_job_project(job):
+    """
+    Return the project a client job belongs to (through its client user).
+    """
+    return ProjectClient.objects.select_related('project').get(client_id=job.user_id).project
+
+
+def prepare_job(job):
+    """
+    Return the execution plan and the transcript texts for a job.
+    """
+    plan = get_plan(get_job_project(job))
+    transcripts = current_contents(job.transcripts.order_by('created_at', 'id'))
+    return plan, transcripts
+
+
+def load_node_state(job_ids):
+    """
+    Stored node outputs of several jobs, as job id -> node_state
+    (see execute_plan_async).
+    """
+    states = {job_id: {} for job_id in job_ids}
+    rows = JobNodeOutput.objects.filter(job_id__in=job_ids).values_list('job_id', 'node_id', 'key', 'output')
+    for job_id, node_id, key, output in rows:
+        states[job_id][node_id] = (key, output)
+    return states
+
+
+def save_node_state(states, previous):
+    """
+    Write the node outputs that changed since `previous` (both job id ->
+    node_state) and delete the stored outputs that are no longer in `states`,
+    so a job keeps exactly the rows written by its latest run.
+    """
+    changed = [
+        JobNodeOutput(job_id=job_id, node_id=node_id, key=key, output=output)
+        for job_id, state in states.items()
+        for node_id, (key, output) in state.items()
+        if previous.get(job_id, {}).get(node_id, (None,))[0] != key
+    ]
+    if changed:
+        JobNodeOutput.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['job', 'node_id'], update_fields=['key', 'output', 'updated_at'],
+        )
+    removed = Q()
+    for job_id, state in states.items():
+        stale = set(previous.get(job_id, {})) - set(state)
+        if stale:
+            removed |= Q(job_id=job_id, node_id__in=stale)
+    if removed:
+        JobNodeOutput.objects.filter(removed).delete()
+
+
+def store_output(job, output, node_state, previous_state):
+    with transaction.atomic():
+        job.output_markdown = output
+        job.save(update_fields=['output_markdown', 'updated_at'])
+        save_node_state({job.id: node_state}, {job.id: previous_state})
+
+
+async def run_job_async(job, plan, transcripts, events=None):
+    """
+    Execute a prepared job on the flow loop and store its output, independently
+    of whoever is waiting for the result. Only nodes affected by changes since
+    the job's last run are executed.
+    """
+    loop = asyncio.get_event_loop()
+    previous_state = (await loop.run_in_executor(None, load_node_state, [job.id]))[job.id]
+    node_state = dict(previous_state)
+    events = start_trace(plan.project_id, job.id, events)
+    try:
+        outputs = await execute_plan_async(plan, transcripts, events, node_state)
+    finally:
+        if isinstance(events, TracingEvents):
+            await loop.run_in_executor(None, events.save)
+    output = outputs[plan.output_id]
+    await loop.run_in_executor(None, store_output, job, output, node_state, previous_state)
+    return output
+
+
+def run_job(job):
+    """
+    Execute the job's project flow against its transcripts and store the result
+    in `output_markdown`.
+    """
+    plan, transcripts = prepare_job(job)
+    run_sync(run_job_async(job, plan, transcripts))
+    return job
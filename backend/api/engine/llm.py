@@ -0,0 +1,118 @@
+# engine/llm.py
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+from django.conf import settings
+
+from api.engine.providers import RetryableProviderError, create_provider
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts up to `capacity`.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class LLMClient:
+    """
+    Front for an LLM provider used by AI nodes.
+
+    - Identical prompts already in flight share a single provider call
+      (streamed calls are never shared).
+    - At most `max_concurrency` calls run at once.
+    - Calls are paced by a token bucket (`requests_per_second`, `burst`).
+    - Retryable failures are retried with exponential backoff and full jitter.
+
+    Bound to the flow loop; use get_llm_client() from coroutines running there.
+    """
+    def __init__(self, provider, max_concurrency, requests_per_second=None, burst=1,
+                 max_retries=3, backoff_base=0.5, backoff_max=20):
+        self.provider = provider
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.bucket = TokenBucket(requests_per_second, burst) if requests_per_second else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.in_flight = {}
+
+    async def complete(self, messages, on_token=None):
+        """
+        Return the completion for `messages`. With `on_token`, the completion
+        is streamed and every piece is passed to it as it arrives.
+        """
+        if on_token is not None:
+            return await self._complete(messages, on_token)
+
+        key = hashlib.sha256(json.dumps(messages, sort_keys=True).encode('utf-8')).hexdigest()
+        future = self.in_flight.get(key)
+        if future is None:
+            future = self.in_flight[key] = asyncio.ensure_future(self._complete(messages))
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shield so one cancelled caller does not cancel the call for the others
+        return await asyncio.shield(future)
+
+    async def _stream(self, messages, on_token, streamed):
+        parts = []
+        async for piece in self.provider.stream(messages):
+            streamed[0] = True
+            parts.append(piece)
+            on_token(piece)
+        return ''.join(parts)
+
+    async def _complete(self, messages, on_token=None):
+        attempt = 0
+        streamed = [False]
+        while True:
+            async with self.semaphore:
+                if self.bucket is not None:
+                    await self.bucket.acquire()
+                try:
+                    if on_token is not None:
+                        return await self._stream(messages, on_token, streamed)
+                    return await self.provider.complete(messages)
+                except RetryableProviderError:
+                    # A stream that already produced output cannot be replayed
+                    if attempt >= self.max_retries or streamed[0]:
+                        raise
+            await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+            attempt += 1
+
+
+_client = None
+
+
+def get_llm_client():
+    """
+    Return the process-wide LLM client configured in FLOW_AI_CLIENT.
+    """
+    global _client
+    if _client is None:
+        config = settings.FLOW_AI_CLIENT
+        _client = LLMClient(
+            create_provider(),
+            max_concurrency=config['MAX_CONCURRENCY'],
+            requests_per_second=config.get('REQUESTS_PER_SECOND'),
+            burst=config.get('BURST', 1),
+            max_retries=config.get('MAX_RETRIES', 3),
+            backoff_base=config.get('BACKOFF_BASE', 0.5),
+            backoff_max=config.get('BACKOFF_MAX', 20),
+        )
+    return _client
@@ -0,0 +1,37 @@
+# engine/loop.py
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+_loop = None
+_lock = threading.Lock()
+
+
+def get_loop():
+    """
+    Return the process-wide event loop flows are executed on.
+
+    The loop runs forever in a daemon thread so that every job in the process
+    shares the same concurrency limits. Blocking node runners are dispatched
+    to its default thread pool.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(
+                max_workers=settings.FLOW_MAX_CONCURRENCY,
+                thread_name_prefix='flow-node',
+            ))
+            threading.Thread(target=loop.run_forever, name='flow-loop', daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def run_sync(coroutine):
+    """
+    Run a coroutine on the flow loop and block until it finishes.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_loop()).result()
@@ -0,0 +1,101 @@
+# engine/mapreduce.py
+import asyncio
+
+from django.conf import settings
+
+from api.engine.prompts import MESSAGE_OVERHEAD_TOKENS, PromptBudgetError, get_tokenizer
+
+PARTIAL_SEPARATOR = '\n\n---\n\n'
+
+
+def split_inputs(step, inputs):
+    """
+    Split the largest input of an AI node into overlapping chunks and return
+    one list of inputs per chunk; the other inputs are repeated in every chunk.
+    """
+    if not inputs:
+        return [inputs]
+
+    config = step.config
+    chunk_size = max(config['chunk_size'], 1)
+    overlap = min(config['chunk_overlap'], chunk_size - 1)
+
+    largest = max(range(len(inputs)), key=lambda index: len(inputs[index][1]))
+    label, text = inputs[largest]
+    chunks = get_tokenizer().split(text, chunk_size, overlap) or ['']
+
+    chunk_inputs = []
+    for chunk in chunks:
+        current = list(inputs)
+        current[largest] = (label, chunk)
+        chunk_inputs.append(current)
+    return chunk_inputs
+
+
+def group_partials(partials, reduce_prompt):
+    """
+    Group partial outputs into batches that fit one reduce request each.
+
+    Partials are capped at half of the room left by the reduce prompt, so every
+    batch holds at least two of them and each reduce round shrinks the list.
+    """
+    context = settings.FLOW_AI_CONTEXT
+    tokenizer = get_tokenizer()
+    separator_tokens = tokenizer.count(PARTIAL_SEPARATOR)
+    available = (
+        context['CONTEXT_WINDOW'] - context['RESERVED_OUTPUT_TOKENS']
+        - tokenizer.count(reduce_prompt) - MESSAGE_OVERHEAD_TOKENS
+    )
+    limit = max(available // 2 - separator_tokens, 1)
+
+    batches = [[]]
+    used = 0
+    for partial in partials:
+        tokens = tokenizer.count(partial)
+        if tokens > limit:
+            partial, tokens = tokenizer.truncate(partial, limit), limit
+        tokens += separator_tokens
+        if batches[-1] and used + tokens > available:
+            batches.append([])
+            used = 0
+        batches[-1].append(partial)
+        used += tokens
+    return batches
+
+
+async def run_map_reduce(step, inputs, run_single, complete):
+    """
+    Map: run the node's prompt over every chunk of its input, at most
+    `max_parallel_chunks` at a time, using `run_single(step, inputs)`.
+    Reduce: combine the partial outputs with the node's reduce prompt via
+    `complete(messages)`, in several rounds if they do not fit one request.
+    Without a reduce prompt the partial outputs are joined in order.
+
+    Raises PromptBudgetError when the reduce prompt leaves no room to combine
+    partials, i.e. a round would not shrink their number.
+    """
+    loop = asyncio.get_event_loop()
+    config = step.config
+    semaphore = asyncio.Semaphore(max(config['max_parallel_chunks'], 1))
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    chunk_inputs = await loop.run_in_executor(None, split_inputs, step, inputs)
+    partials = list(await asyncio.gather(*(limited(run_single(step, current)) for current in chunk_inputs)))
+
+    reduce_prompt = config['reduce_prompt']
+    if len(partials) == 1 or not reduce_prompt.strip():
+        return '\n\n'.join(partials)
+
+    while True:
+        batches = await loop.run_in_executor(None, group_partials, partials, reduce_prompt)
+        if len(batches) >= len(partials):
+            raise PromptBudgetError("The reduce prompt leaves too little room in the context window to combine partial outputs.")
+        partials = list(await asyncio.gather(*(
+            limited(complete([{'role': 'user', 'content': f"{reduce_prompt}\n\n{PARTIAL_SEPARATOR.join(batch)}"}]))
+            for batch in batches
+        )))
+        if len(partials) == 1:
+            return partials[0]
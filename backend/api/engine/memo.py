@@ -0,0 +1,124 @@
+# engine/memo.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from api.models import NodeOutputCache
+
+
+def memo_key(step, inputs):
+    """
+    Content address of a node run: node type and content plus its resolved inputs.
+    Two runs with the same key produce the same output, whatever node or job they belong to.
+    """
+    inputs_hash = hashlib.sha256(json.dumps(inputs).encode('utf-8')).hexdigest()
+    return hashlib.sha256(f'{step.type}:{step.content_hash}:{inputs_hash}'.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by entry count and by total size of the values.
+    """
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        value_size = len(value.encode('utf-8'))
+        if value_size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.encode('utf-8'))
+            self._entries[key] = value
+            self.size += value_size
+
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.encode('utf-8'))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class NodeOutputMemo:
+    """
+    Two-tier memo of node outputs: an in-process LRU in front of an optional
+    NodeOutputCache table shared by every worker. Rows older than `ttl_days`
+    are ignored and removed by prune_node_outputs().
+    """
+    def __init__(self, max_entries, max_bytes, persistent=False, ttl_days=7):
+        self.memory = LRUCache(max_entries, max_bytes)
+        self.persistent = persistent
+        self.ttl = timedelta(days=ttl_days)
+
+    def get(self, key):
+        output = self.memory.get(key)
+        if output is None and self.persistent:
+            output = (
+                NodeOutputCache.objects.filter(key=key, created_at__gte=timezone.now() - self.ttl)
+                .values_list('output', flat=True).first()
+            )
+            if output is not None:
+                self.memory.set(key, output)
+        return output
+
+    def set(self, key, output):
+        self.memory.set(key, output)
+        if self.persistent:
+            NodeOutputCache.objects.bulk_create([NodeOutputCache(key=key, output=output)], ignore_conflicts=True)
+
+
+_memo = None
+
+
+def get_memo():
+    """
+    Return the process-wide node output memo configured in FLOW_MEMO.
+    """
+    global _memo
+    if _memo is None:
+        config = settings.FLOW_MEMO
+        _memo = NodeOutputMemo(
+            config['MAX_ENTRIES'], config['MAX_BYTES'], config.get('PERSISTENT', False), config['PERSISTENT_TTL_DAYS'],
+        )
+    return _memo
+
+
+def prune_node_outputs():
+    """
+    Delete persistent memo rows older than FLOW_MEMO['PERSISTENT_TTL_DAYS'],
+    then the oldest rows beyond FLOW_MEMO['PERSISTENT_MAX_ROWS']. Returns the
+    number deleted.
+    """
+    config = settings.FLOW_MEMO
+    cutoff = timezone.now() - timedelta(days=config['PERSISTENT_TTL_DAYS'])
+    deleted, _ = NodeOutputCache.objects.filter(created_at__lt=cutoff).delete()
+
+    excess = NodeOutputCache.objects.count() - config['PERSISTENT_MAX_ROWS']
+    if excess > 0:
+        oldest = list(NodeOutputCache.objects.order_by('created_at', 'id').values_list('id', flat=True)[:excess])
+        deleted += NodeOutputCache.objects.filter(id__in=oldest).delete()[0]
+    return deleted
@@ -0,0 +1,200 @@
+# engine/plan.py
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+
+from api.models import Edge
+from api.services.flow_persistence import stored_nodes
+
+# Node types whose runners wait on I/O or subprocesses; they count against
+# the concurrency limits and are memoized
+BLOCKING_NODE_TYPES = {'ai_node', 'code_node'}
+
+
+class FlowValidationError(Exception):
+    """
+    Raised when a flow cannot be compiled into an execution plan.
+    """
+
+
+class PlanStep:
+    """
+    A single node in an execution plan.
+
+    `inputs` lists the ids of upstream steps in edge order and `config` holds
+    the node content needed to run it (prompt and examples, code or template).
+    `content_hash` identifies the node's type and content, independent of its id.
+    `aggregates` marks the node that merges per-transcript results.
+    """
+    def __init__(self, pk, node_id, type, label, inputs, config, aggregates=False):
+        self.pk = pk
+        self.node_id = node_id
+        self.type = type
+        self.label = label
+        self.inputs = inputs
+        self.config = config
+        self.aggregates = aggregates
+        content = json.dumps({'type': type, 'config': config}, sort_keys=True)
+        self.content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def __repr__(self):
+        return f"<PlanStep {self.type}: {self.label}>"
+
+
+class ExecutionPlan:
+    """
+    A project's flow compiled into topologically ordered steps.
+
+    When the flow has aggregating nodes, `per_transcript` holds the ids of the
+    steps that are not downstream of one: they run once per transcript, and
+    later steps see their results merged. Otherwise it is empty and every step
+    runs once over all transcripts.
+    """
+    def __init__(self, project_id, version, steps):
+        self.project_id = project_id
+        self.version = version
+        self.steps = steps
+        self.steps_by_id = {step.node_id: step for step in steps}
+        self.input_id = next(step.node_id for step in steps if step.type == 'input_node')
+        self.output_id = next(step.node_id for step in steps if step.type == 'output_node')
+
+        self.per_transcript = set()
+        if any(step.aggregates for step in steps):
+            merged = {self.output_id}
+            for step in steps:
+                if step.aggregates or any(source_id in merged for source_id in step.inputs):
+                    merged.add(step.node_id)
+            self.per_transcript = {step.node_id for step in steps if step.node_id not in merged}
+
+    def __repr__(self):
+        return f"<ExecutionPlan project={self.project_id} v{self.version} steps={len(self.steps)}>"
+
+
+def _node_config(node):
+    if node.type == 'ai_node':
+        ai_data = node.ai_data
+        return {
+            'prompt': ai_data.prompt,
+            'execution_mode': ai_data.execution_mode,
+            'chunk_size': ai_data.chunk_size,
+            'chunk_overlap': ai_data.chunk_overlap,
+            'max_parallel_chunks': ai_data.max_parallel_chunks,
+            'reduce_prompt': ai_data.reduce_prompt,
+            'examples': [
+                {'input': example.input_text, 'output': example.output_text}
+                for example in ai_data.examples.all()
+            ],
+        }
+    if node.type == 'code_node':
+        return {'code': node.code_data.code}
+    if node.type == 'template_node':
+        return {'template': node.template_data.template}
+    return {}
+
+
+def compile_plan(project):
+    """
+    Compile the stored flow of a project into an ExecutionPlan.
+
+    Only nodes the output depends on are kept. Raises FlowValidationError for
+    missing or duplicated input/output nodes, edges into the input or out of
+    the output node, nodes without inputs and cycles.
+    """
+    nodes = {node.id: node for node in stored_nodes(project)}
+    edges = list(Edge.objects.filter(project=project).order_by('created_at', 'id'))
+
+    by_type = {}
+    for node in nodes.values():
+        by_type.setdefault(node.type, []).append(node)
+    for node_type, name in (('input_node', 'input'), ('output_node', 'output')):
+        if len(by_type.get(node_type, [])) != 1:
+            raise FlowValidationError(f"A flow needs exactly one {name} node.")
+    output_node = by_type['output_node'][0]
+
+    inputs = {node_id: [] for node_id in nodes}
+    for edge in edges:
+        source, target = nodes.get(edge.source_id), nodes.get(edge.target_id)
+        if source is None or target is None:
+            raise FlowValidationError(f"Edge {edge.edge_internal_id} points to a node outside this flow.")
+        if target.type == 'input_node':
+            raise FlowValidationError(f"Edge {edge.edge_internal_id} leads into the input node.")
+        if source.type == 'output_node':
+            raise FlowValidationError(f"Edge {edge.edge_internal_id} leaves the output node.")
+        inputs[target.id].append(source.id)
+
+    # Keep only the nodes the output depends on
+    required = set()
+    stack = [output_node.id]
+    while stack:
+        node_id = stack.pop()
+        if node_id in required:
+            continue
+        required.add(node_id)
+        stack.extend(inputs[node_id])
+
+    for node_id in required:
+        node = nodes[node_id]
+        if node.type != 'input_node' and not inputs[node_id]:
+            raise FlowValidationError(f"Node '{node.label}' is not connected to any input.")
+
+    # Kahn's algorithm over the required subgraph
+    pending = {node_id: len(set(inputs[node_id])) for node_id in required}
+    dependents = {node_id: [] for node_id in required}
+    for node_id in required:
+        for source_id in set(inputs[node_id]):
+            dependents[source_id].append(node_id)
+
+    ready = sorted(node_id for node_id, count in pending.items() if count == 0)
+    order = []
+    while ready:
+        node_id = ready.pop(0)
+        order.append(node_id)
+        for dependent_id in dependents[node_id]:
+            pending[dependent_id] -= 1
+            if pending[dependent_id] == 0:
+                ready.append(dependent_id)
+
+    if len(order) != len(required):
+        cyclic = sorted(nodes[node_id].label for node_id in required if node_id not in order)
+        raise FlowValidationError(f"The flow contains a cycle through: {', '.join(cyclic)}.")
+
+    steps = []
+    for node_id in order:
+        node = nodes[node_id]
+        try:
+            config = _node_config(node)
+        except ObjectDoesNotExist:
+            raise FlowValidationError(f"Node '{node.label}' has no saved content.")
+        steps.append(PlanStep(
+            pk=node.id,
+            node_id=node.node_internal_id,
+            type=node.type,
+            label=node.label,
+            inputs=[nodes[source_id].node_internal_id for source_id in inputs[node_id]],
+            config=config,
+            aggregates=node.aggregates_transcripts and node.type not in ('input_node', 'output_node'),
+        ))
+
+    return ExecutionPlan(project.id, project.flow_version, steps)
+
+
+def plan_cache_key(project_id, version):
+    return f'flow-plan:{project_id}:{version}'
+
+
+def get_plan(project):
+    """
+    Return the execution plan for the project's current flow version.
+
+    Plans are cached per flow version, so they are only recompiled after the
+    flow changes.
+    """
+    key = plan_cache_key(project.id, project.flow_version)
+    plan = cache.get(key)
+    if plan is None:
+        plan = compile_plan(project)
+        cache.set(key, plan, settings.FLOW_CACHE_TIMEOUT)
+    return plan
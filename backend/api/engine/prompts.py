@@ -0,0 +1,184 @@
+# engine/prompts.py
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from api.engine.templates import VARIABLE_PATTERN, get_template
+
+try:
+    import tiktoken
+except ImportError:  # Optional; falls back to an approximate local tokenizer
+    tiktoken = None
+
+# Tokens added by the chat format around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Prepared prompts kept per process
+PREPARED_CACHE_SIZE = 1024
+
+
+class PromptBudgetError(Exception):
+    """
+    Raised when a prompt cannot fit the context window even without examples.
+    """
+
+
+class Tokenizer:
+    """
+    Counts and splits text in tokens. Uses tiktoken when installed, otherwise
+    treats every word and punctuation mark as one token (an overestimate for
+    English, which keeps budgets on the safe side).
+    """
+    FALLBACK_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+    def __init__(self, encoding_name):
+        self.encoding = tiktoken.get_encoding(encoding_name) if tiktoken else None
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return sum(1 for _ in self.FALLBACK_PATTERN.finditer(text))
+
+    def truncate(self, text, max_tokens):
+        chunks = self.split(text, max_tokens)
+        return chunks[0] if chunks else ''
+
+    def split(self, text, max_tokens, overlap=0):
+        """
+        Split text into chunks of at most `max_tokens`, each repeating the last
+        `overlap` tokens of the previous one.
+        """
+        step = max(max_tokens - overlap, 1)
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return [
+                self.encoding.decode(tokens[start:start + max_tokens])
+                for start in range(0, len(tokens), step)
+                if start == 0 or start + overlap < len(tokens)
+            ]
+
+        # Cut on token boundaries so no word is split in half
+        starts = [match.start() for match in self.FALLBACK_PATTERN.finditer(text)]
+        chunks = []
+        for index in range(0, len(starts), step):
+            if index and index + overlap >= len(starts):
+                break
+            end = index + max_tokens
+            chunks.append(text[starts[index]:starts[end] if end < len(starts) else len(text)])
+        return chunks
+
+
+_tokenizer = None
+
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = Tokenizer(settings.FLOW_AI_CONTEXT['TOKENIZER_ENCODING'])
+    return _tokenizer
+
+
+class PreparedPrompt:
+    """
+    The parts of an AI node's request that do not depend on the job: the
+    compiled prompt and the few-shot messages with their token counts.
+    """
+    def __init__(self, step, tokenizer, max_example_tokens):
+        self.prompt = step.config['prompt']
+        self.template = get_template(self.prompt)
+        self.referenced = set(VARIABLE_PATTERN.findall(self.prompt))
+
+        self.examples = []  # (messages, tokens) per example, in order
+        for example in step.config['examples']:
+            messages = [
+                {'role': 'user', 'content': tokenizer.truncate(example['input'], max_example_tokens)},
+                {'role': 'assistant', 'content': tokenizer.truncate(example['output'], max_example_tokens)},
+            ]
+            tokens = sum(tokenizer.count(message['content']) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+            self.examples.append((messages, tokens))
+
+    def render(self, inputs):
+        """
+        Render the user message; inputs the prompt does not reference are appended.
+        """
+        rendered = self.template.render_to_string(dict(inputs))
+        unreferenced = [text for label, text in inputs if label not in self.referenced]
+        if unreferenced:
+            rendered = '\n\n'.join([rendered] + unreferenced).strip()
+        return rendered
+
+
+_prepared = OrderedDict()
+_prepared_lock = threading.Lock()
+
+
+def get_prepared_prompt(step):
+    """
+    Return the PreparedPrompt of an AI node, built once per node content.
+    """
+    with _prepared_lock:
+        prepared = _prepared.get(step.content_hash)
+        if prepared is not None:
+            _prepared.move_to_end(step.content_hash)
+            return prepared
+
+    prepared = PreparedPrompt(step, get_tokenizer(), settings.FLOW_AI_CONTEXT['MAX_EXAMPLE_TOKENS'])
+    with _prepared_lock:
+        _prepared[step.content_hash] = prepared
+        if len(_prepared) > PREPARED_CACHE_SIZE:
+            _prepared.popitem(last=False)
+    return prepared
+
+
+def _fit_examples(prepared, budget):
+    """
+    Keep examples in order while they fit in `budget` tokens.
+    """
+    messages = []
+    for example_messages, tokens in prepared.examples:
+        if tokens > budget:
+            break
+        messages.extend(example_messages)
+        budget -= tokens
+    return messages
+
+
+def budget_requests(step, inputs):
+    """
+    Build the chat requests for an AI node so that each fits the context window.
+
+    The rendered prompt always goes in full when it fits, with as many
+    examples as the remaining budget allows. When the prompt itself is too
+    long, the largest input is split into chunks and one request is built per
+    chunk, without examples.
+    """
+    config = settings.FLOW_AI_CONTEXT
+    tokenizer = get_tokenizer()
+    prepared = get_prepared_prompt(step)
+    budget = config['CONTEXT_WINDOW'] - config['RESERVED_OUTPUT_TOKENS']
+
+    user_message = prepared.render(inputs)
+    message_tokens = tokenizer.count(user_message) + MESSAGE_OVERHEAD_TOKENS
+    if message_tokens <= budget:
+        messages = _fit_examples(prepared, budget - message_tokens)
+        return [messages + [{'role': 'user', 'content': user_message}]]
+
+    if not inputs:
+        raise PromptBudgetError("The prompt alone does not fit the context window.")
+
+    # Chunk the largest input; everything else stays in every request
+    largest = max(range(len(inputs)), key=lambda index: len(inputs[index][1]))
+    label, text = inputs[largest]
+    without = list(inputs)
+    without[largest] = (label, '')
+    available = budget - tokenizer.count(prepared.render(without)) - MESSAGE_OVERHEAD_TOKENS
+    if available < config['MIN_CHUNK_TOKENS']:
+        raise PromptBudgetError("The prompt leaves too little room in the context window for its input.")
+
+    requests = []
+    for chunk in tokenizer.split(text, available):
+        chunk_inputs = list(inputs)
+        chunk_inputs[largest] = (label, chunk)
+        requests.append([{'role': 'user', 'content': prepared.render(chunk_inputs)}])
+    return requests
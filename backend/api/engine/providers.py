@@ -0,0 +1,90 @@
+# engine/providers.py
+import json
+
+import httpx
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class ProviderError(Exception):
+    """
+    Raised when an LLM provider call fails.
+    """
+
+
+class RetryableProviderError(ProviderError):
+    """
+    A failure worth retrying: rate limiting, server errors, dropped connections.
+    """
+
+
+class OpenAIChatProvider:
+    """
+    Async client for OpenAI-compatible `/chat/completions` endpoints.
+
+    Keeps a pool of persistent HTTP connections for the lifetime of the
+    process instead of opening one per request. Must be used from the flow loop.
+    """
+    def __init__(self, base_url, api_key='', model='gpt-4o-mini', timeout=120, max_connections=20):
+        self.model = model
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/'),
+            headers={'Authorization': f'Bearer {api_key}'} if api_key else {},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def complete(self, messages):
+        try:
+            response = await self.client.post('/chat/completions', json={'model': self.model, 'messages': messages})
+        except httpx.TransportError as e:
+            raise RetryableProviderError(f"LLM request failed: {e}")
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableProviderError(f"LLM request failed with status {response.status_code}.")
+        if response.status_code >= 400:
+            raise ProviderError(f"LLM request failed with status {response.status_code}: {response.text[:200]}")
+
+        try:
+            return response.json()['choices'][0]['message']['content']
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise ProviderError("LLM response did not contain a completion.")
+
+    async def stream(self, messages):
+        """
+        Yield the completion piece by piece as the provider produces it.
+        """
+        payload = {'model': self.model, 'messages': messages, 'stream': True}
+        try:
+            async with self.client.stream('POST', '/chat/completions', json=payload) as response:
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise RetryableProviderError(f"LLM request failed with status {response.status_code}.")
+                if response.status_code >= 400:
+                    body = await response.aread()
+                    raise ProviderError(f"LLM request failed with status {response.status_code}: {body[:200]!r}")
+
+                async for line in response.aiter_lines():
+                    if not line.startswith('data:'):
+                        continue
+                    data = line[len('data:'):].strip()
+                    if data == '[DONE]':
+                        break
+                    try:
+                        delta = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                    except (ValueError, KeyError, IndexError, TypeError):
+                        raise ProviderError("LLM stream contained an invalid event.")
+                    if delta:
+                        yield delta
+        except httpx.TransportError as e:
+            raise RetryableProviderError(f"LLM request failed: {e}")
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def create_provider():
+    """
+    Build the provider configured in FLOW_AI_PROVIDER.
+    """
+    config = settings.FLOW_AI_PROVIDER
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
@@ -0,0 +1,57 @@
+# engine/runners.py
+import asyncio
+
+from api.engine.llm import get_llm_client
+from api.engine.mapreduce import run_map_reduce
+from api.engine.prompts import budget_requests
+from api.engine.sandbox import run_code
+from api.engine.templates import get_template
+from api.models import AINode
+
+
+def join_inputs(inputs):
+    return '\n\n'.join(text for _, text in inputs)
+
+
+def run_input_node(step, inputs, context):
+    return '\n\n'.join(context['transcripts'])
+
+
+def run_output_node(step, inputs, context):
+    return join_inputs(inputs)
+
+
+async def complete_prompt(step, inputs, on_token=None):
+    # Tokenizing large inputs is CPU work, keep it off the loop
+    requests = await asyncio.get_event_loop().run_in_executor(None, budget_requests, step, inputs)
+    client = get_llm_client()
+    if on_token is not None and len(requests) == 1:
+        return await client.complete(requests[0], on_token=lambda text: on_token(step, text))
+
+    # Oversized inputs are split into several requests; their answers are joined in order
+    answers = await asyncio.gather(*(client.complete(messages) for messages in requests))
+    return '\n\n'.join(answers)
+
+
+async def run_ai_node(step, inputs, context):
+    if step.config['execution_mode'] == AINode.MAP_REDUCE:
+        return await run_map_reduce(step, inputs, complete_prompt, get_llm_client().complete)
+    return await complete_prompt(step, inputs, context.get('on_token'))
+
+
+def run_code_node(step, inputs, context):
+    return run_code(step.config['code'], dict(inputs))
+
+
+def run_template_node(step, inputs, context):
+    template = get_template(step.config['template'])
+    return template.render_to_string(dict(inputs))
+
+
+RUNNERS = {
+    'input_node': run_input_node,
+    'output_node': run_output_node,
+    'ai_node': run_ai_node,
+    'code_node': run_code_node,
+    'template_node': run_template_node,
+}
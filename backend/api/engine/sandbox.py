@@ -0,0 +1,145 @@
+# engine/sandbox.py
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+
+from django.conf import settings
+
+from api.engine import sandbox_worker
+
+# Seconds a worker may take on top of FLOW_CODE_TIMEOUT before it is considered stuck
+WORKER_GRACE_SECONDS = 5
+
+
+class CodeExecutionError(Exception):
+    """
+    Raised when user code in a code node fails or times out.
+    """
+
+
+class CodeWorker:
+    """
+    A worker process running sandbox_worker.serve(), talking over a pipe.
+    """
+    def __init__(self, config):
+        # Spawned workers start from a clean interpreter instead of inheriting
+        # the Django process (threads, DB connections) through fork
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=sandbox_worker.serve,
+            args=(child_conn, config['CPU_SECONDS'], config['MEMORY_MB'], settings.FLOW_CODE_TIMEOUT, config['USER']),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.calls = 0
+
+    def wait_ready(self):
+        self.conn.recv()
+
+    def call(self, code_hash, code, payload):
+        self.calls += 1
+        self.conn.send((code_hash, code, payload))
+        if not self.conn.poll(settings.FLOW_CODE_TIMEOUT + WORKER_GRACE_SECONDS):
+            raise TimeoutError()
+        return self.conn.recv()
+
+    def kill(self):
+        # The worker leads its own process group; take down a running call with it
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (AttributeError, ProcessLookupError, PermissionError):
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class CodeWorkerPool:
+    """
+    Pre-warmed code node workers. Each call takes an idle worker; a worker
+    that stops responding is killed and replaced on its own, without
+    affecting calls running on the other workers.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.idle = queue.Queue()
+        workers = [CodeWorker(config) for _ in range(config['WORKERS'])]
+        # Pre-warm: wait until every worker is up before taking real work
+        for worker in workers:
+            worker.wait_ready()
+            self.idle.put(worker)
+
+    def replace(self, worker):
+        worker.kill()
+        replacement = CodeWorker(self.config)
+        replacement.wait_ready()
+        self.idle.put(replacement)
+
+    def run(self, code_hash, code, payload):
+        worker = self.idle.get()
+        try:
+            response = worker.call(code_hash, code, payload)
+        except TimeoutError:
+            self.replace(worker)
+            raise CodeExecutionError(f"Code ran longer than {settings.FLOW_CODE_TIMEOUT} seconds.")
+        except (EOFError, OSError):
+            self.replace(worker)
+            raise CodeExecutionError("The code node worker stopped unexpectedly.")
+        except BaseException:
+            # The response may still arrive; this worker's pipe is no longer usable
+            self.replace(worker)
+            raise
+
+        if worker.calls >= self.config['MAX_TASKS_PER_WORKER']:
+            self.replace(worker)
+        else:
+            self.idle.put(worker)
+        return response
+
+    def close(self):
+        # Stops the idle workers; calls still running keep theirs
+        while True:
+            try:
+                self.idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+
+_pool = None
+_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide code node worker pool, starting it if needed.
+
+    Workers are recycled after FLOW_CODE_POOL['MAX_TASKS_PER_WORKER'] calls.
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = CodeWorkerPool(settings.FLOW_CODE_POOL)
+        return _pool
+
+
+def run_code(code, input_data):
+    """
+    Run a code node's `process_data(input_data)` on the worker pool.
+
+    Each call runs in its own child of a worker, limited to
+    FLOW_CODE_POOL['CPU_SECONDS'] of CPU time and FLOW_CODE_POOL['MEMORY_MB']
+    of address space; FLOW_CODE_TIMEOUT bounds the wall-clock time (e.g. for
+    code that sleeps or blocks). A call that hits a limit fails alone.
+    Workers start with an empty environment and, when the server runs as
+    root, as FLOW_CODE_POOL['USER'].
+    """
+    code_hash = hashlib.sha256(code.encode('utf-8')).hexdigest()
+    response = json.loads(get_pool().run(code_hash, code, json.dumps(input_data)))
+    if 'error' in response:
+        raise CodeExecutionError(response['error'])
+    return response['output']
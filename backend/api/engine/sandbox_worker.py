@@ -0,0 +1,200 @@
+# engine/sandbox_worker.py
+# Runs inside the code node worker processes. Deliberately free of Django
+# imports so that spawning a worker stays cheap.
+import ctypes
+import json
+import os
+import select
+import signal
+import sys
+import time
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; limits are skipped there
+    resource = None
+
+# Compiled code objects keyed by code hash
+COMPILED_CACHE_SIZE = 256
+# Extra CPU seconds between the soft limit (SIGXCPU) and the hard limit (SIGKILL),
+# for code that catches the signal and keeps running
+CPU_HARD_LIMIT_GRACE = 1
+# Files a call may have open at once
+MAX_OPEN_FILES = 64
+# prctl() option that controls who may read /proc/<pid>/ of a process
+PR_SET_DUMPABLE = 4
+_compiled = OrderedDict()
+
+
+class CPUTimeExceeded(BaseException):
+    # A BaseException, so user code catching Exception does not swallow it
+    pass
+
+
+def _on_cpu_limit(signum, frame):
+    raise CPUTimeExceeded()
+
+
+def isolate(user):
+    """
+    Drop what the worker inherited from the Django process before any user
+    code runs: the environment (API keys, database password, secret key),
+    root privileges, if it has them, in favour of `user`, and access to its
+    /proc entries, where the original environment can still be read.
+    """
+    os.environ.clear()
+    if user and hasattr(os, 'getuid') and os.getuid() == 0:
+        import pwd
+        entry = pwd.getpwnam(user)
+        os.setgroups([])
+        os.setgid(entry.pw_gid)
+        os.setuid(entry.pw_uid)
+    if sys.platform.startswith('linux'):
+        # Set after setuid(), which may reset it
+        ctypes.CDLL(None).prctl(PR_SET_DUMPABLE, 0, 0, 0, 0)
+
+
+def serve(conn, cpu_seconds, memory_mb, timeout, user=None):
+    """
+    Worker main loop: receive (code hash, code, JSON input) tasks on `conn`
+    and send back a JSON response for each, until the connection closes.
+    The worker runs as `user` when started as root.
+    """
+    if hasattr(os, 'setsid'):
+        # Own process group, so the parent can kill the worker together with a running call
+        os.setsid()
+    isolate(user)
+    conn.send('ready')
+    while True:
+        try:
+            code_hash, code, payload = conn.recv()
+        except EOFError:
+            return
+        conn.send(run_isolated(code_hash, code, payload, cpu_seconds, memory_mb, timeout))
+
+
+def _compile(code_hash, code):
+    compiled = _compiled.get(code_hash)
+    if compiled is not None:
+        _compiled.move_to_end(code_hash)
+        return compiled
+
+    compiled = compile(code, '<code node>', 'exec')
+    _compiled[code_hash] = compiled
+    if len(_compiled) > COMPILED_CACHE_SIZE:
+        _compiled.popitem(last=False)
+    return compiled
+
+
+def _close_inherited_fds(keep):
+    """
+    Close every descriptor but stdio and `keep`, so user code cannot reach the
+    worker's connection to Django.
+    """
+    try:
+        fds = [int(fd) for fd in os.listdir('/proc/self/fd')]
+    except OSError:
+        fds = range(3, 1024)
+    for fd in fds:
+        if fd > 2 and fd != keep:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def _limit(cpu_seconds, memory_mb):
+    """
+    Cap the current process: `cpu_seconds` of CPU time before SIGXCPU, killed
+    shortly after, `memory_mb` of address space, MAX_OPEN_FILES open files and
+    no new processes.
+    """
+    if resource is None:
+        return
+    resource.setrlimit(resource.RLIMIT_NOFILE, (MAX_OPEN_FILES, MAX_OPEN_FILES))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if cpu_seconds:
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + CPU_HARD_LIMIT_GRACE))
+
+
+def run(compiled, payload, cpu_seconds):
+    """
+    Call the node's process_data() on the JSON-encoded input.
+
+    Returns a JSON string with either `output` or `error`, so only plain
+    strings cross the process boundary.
+    """
+    stdout, sys.stdout = sys.stdout, sys.stderr  # keep user prints off the worker's stdout
+    try:
+        namespace = {'__name__': '__flow_node__'}
+        exec(compiled, namespace)
+        result = namespace['process_data'](json.loads(payload))
+        response = {'output': result if isinstance(result, str) else json.dumps(result, default=str)}
+    except CPUTimeExceeded:
+        response = {'error': f'Code used more than {cpu_seconds} seconds of CPU time.'}
+    except MemoryError:
+        response = {'error': 'Code ran out of memory.'}
+    except Exception as e:
+        response = {'error': f'{type(e).__name__}: {e}'}
+    finally:
+        sys.stdout = stdout
+    return json.dumps(response)
+
+
+def run_isolated(code_hash, code, payload, cpu_seconds, memory_mb, timeout):
+    """
+    Run one call in a child forked from this worker. The child starts with a
+    fresh CPU budget and is killed after `timeout` seconds, so a runaway call
+    never affects the worker or later calls.
+    """
+    try:
+        compiled = _compile(code_hash, code)
+    except SyntaxError as e:
+        return json.dumps({'error': f'SyntaxError: {e}'})
+
+    if not hasattr(os, 'fork'):
+        return run(compiled, payload, cpu_seconds)
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            _close_inherited_fds(write_fd)
+            _limit(cpu_seconds, memory_mb)
+            response = run(compiled, payload, cpu_seconds).encode('utf-8')
+            with os.fdopen(write_fd, 'wb') as pipe:
+                pipe.write(response)
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    chunks = []
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    with os.fdopen(read_fd, 'rb') as pipe:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([pipe], [], [], remaining)[0]:
+                timed_out = True
+                os.kill(pid, signal.SIGKILL)
+                break
+            chunk = os.read(pipe.fileno(), 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    _, status = os.waitpid(pid, 0)
+
+    if timed_out:
+        return json.dumps({'error': f'Code ran longer than {timeout} seconds.'})
+    if chunks and os.WIFEXITED(status):
+        return b''.join(chunks).decode('utf-8')
+    if os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGKILL:
+        # The hard CPU limit, reached by code that ignored SIGXCPU
+        return json.dumps({'error': f'Code used more than {cpu_seconds} seconds of CPU time.'})
+    return json.dumps({'error': 'Code stopped unexpectedly.'})
@@ -0,0 +1,95 @@
+# engine/streaming.py
+import json
+
+from api.engine.events import ExecutionEvents
+
+OUTPUT_SEPARATOR = '\n\n'
+
+
+class OutputAssembler:
+    """
+    Rebuilds the output node's text incrementally from the nodes feeding it.
+
+    The output is its inputs joined in order, so text is released only for the
+    first unfinished input; later inputs are held back until every input before
+    them has finished, so the deltas concatenate to the final output.
+    """
+    def __init__(self, plan):
+        self.sources = plan.steps_by_id[plan.output_id].inputs
+        self.partial = {}
+        self.finished = {}
+        self.head = 0
+        self.released = ''  # text of the head input already sent
+
+    def token(self, node_id, text):
+        if node_id in self.sources and node_id not in self.finished:
+            self.partial[node_id] = self.partial.get(node_id, '') + text
+        return self._advance()
+
+    def finish(self, node_id, output):
+        if node_id in self.sources:
+            self.finished[node_id] = output
+        return self._advance()
+
+    def _advance(self):
+        deltas = []
+        while self.head < len(self.sources):
+            node_id = self.sources[self.head]
+            done = node_id in self.finished
+            text = self.finished[node_id] if done else self.partial.get(node_id, '')
+            # Sent text cannot be taken back; if a node's final output does not
+            # extend what was streamed, the client relies on the `done` event
+            if text.startswith(self.released) and len(text) > len(self.released):
+                deltas.append(text[len(self.released):])
+                self.released = text
+            if not done:
+                break
+            self.head += 1
+            self.released = ''
+            if self.head < len(self.sources):
+                deltas.append(OUTPUT_SEPARATOR)
+        return ''.join(deltas)
+
+
+class StreamingEvents(ExecutionEvents):
+    """
+    Forwards node progress and output deltas from the flow loop to a queue
+    owned by another event loop (the one serving the HTTP response).
+    """
+    def __init__(self, plan, loop, queue):
+        self.plan = plan
+        self.loop = loop
+        self.queue = queue
+        self.assembler = OutputAssembler(plan)
+
+    def put(self, event, data):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (event, data))
+
+    def node_event(self, step, status, transcript, **extra):
+        data = {'id': step.node_id, 'label': step.label, 'type': step.type, 'status': status, **extra}
+        if transcript is not None:
+            data['transcript'] = transcript
+        self.put('node', data)
+
+    def node_started(self, step, inputs, transcript=None, key=None):
+        self.node_event(step, 'started', transcript)
+
+    def node_token(self, step, text):
+        delta = self.assembler.token(step.node_id, text)
+        if delta:
+            self.put('output', {'delta': delta})
+
+    def node_finished(self, step, output, cached, transcript=None):
+        self.node_event(step, 'finished', transcript, cached=cached)
+        # Per-transcript results only reach the output merged, in the `done` event
+        if transcript is None:
+            delta = self.assembler.finish(step.node_id, output)
+            if delta:
+                self.put('output', {'delta': delta})
+
+
+def format_event(event, data):
+    """
+    Encode one Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,79 @@
+# engine/templates.py
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+# Matches {{Label}} references to upstream nodes in prompts and templates
+VARIABLE_PATTERN = re.compile(r'\{\{\s*(.+?)\s*\}\}')
+
+# Compiled templates kept per process
+TEMPLATE_CACHE_SIZE = 1024
+
+
+class CompiledTemplate:
+    """
+    A template parsed once into literal chunks and {{Label}} lookups.
+    """
+    def __init__(self, source):
+        self.source = source
+        ops = []
+        position = 0
+        for match in VARIABLE_PATTERN.finditer(source):
+            # (literal text before the variable, variable name, raw reference)
+            ops.append((source[position:match.start()], match.group(1), match.group(0)))
+            position = match.end()
+        ops.append((source[position:], None, None))
+        self.ops = tuple(ops)
+
+    def render(self, variables, write):
+        """
+        Stream the rendered template into `write`, chunk by chunk.
+        Unknown references are written as they are.
+        """
+        for literal, name, raw in self.ops:
+            if literal:
+                write(literal)
+            if name is not None:
+                write(variables.get(name, raw))
+
+    def render_to_string(self, variables):
+        chunks = []
+        self.render(variables, chunks.append)
+        return ''.join(chunks)
+
+
+class TemplateCache:
+    """
+    LRU of compiled templates keyed by content hash. An edited template has a
+    new hash, so entries never go stale and are only evicted by size.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, source):
+        content_hash = hashlib.sha256(source.encode('utf-8')).hexdigest()
+        with self._lock:
+            template = self._templates.get(content_hash)
+            if template is not None:
+                self._templates.move_to_end(content_hash)
+                return template
+        # Compiled outside the lock; a concurrent miss compiles the same source twice at worst
+        template = CompiledTemplate(source)
+        with self._lock:
+            self._templates[content_hash] = template
+            if len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        return template
+
+
+template_cache = TemplateCache(TEMPLATE_CACHE_SIZE)
+
+
+def get_template(source):
+    """
+    Return the compiled form of a template, compiling it on first use.
+    """
+    return template_cache.get(source)
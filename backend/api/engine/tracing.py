@@ -0,0 +1,79 @@
+# engine/tracing.py
+import random
+import time
+import uuid
+
+from django.conf import settings
+
+from api.engine.events import ExecutionEvents
+from api.models import NodeTrace
+
+# Longest error message kept in a trace row
+MAX_TRACE_ERROR = 500
+
+
+def payload_bytes(text):
+    return len(text.encode('utf-8'))
+
+
+class TracingEvents(ExecutionEvents):
+    """
+    Records a NodeTrace per node execution and forwards every event to
+    `events`. Call save() once the run is over.
+    """
+    def __init__(self, project_id, job_id=None, events=None):
+        self.project_id = project_id
+        self.job_id = job_id
+        self.events = events or ExecutionEvents()
+        self.trace_id = uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self.running = {}  # (node id, transcript) -> (start, input bytes, output key)
+        self.traces = []
+
+    def node_started(self, step, inputs, transcript=None, key=None):
+        # Outputs are referenced by content address instead of being stored
+        input_bytes = sum(payload_bytes(text) for _, text in inputs)
+        self.running[(step.node_id, transcript)] = (time.perf_counter(), input_bytes, key or '')
+        self.events.node_started(step, inputs, transcript, key)
+
+    def node_token(self, step, text):
+        self.events.node_token(step, text)
+
+    def record(self, step, transcript, **fields):
+        started, input_bytes, key = self.running.pop((step.node_id, transcript))
+        now = time.perf_counter()
+        self.traces.append(NodeTrace(
+            trace_id=self.trace_id,
+            project_id=self.project_id,
+            job_id=self.job_id,
+            node_id=step.node_id,
+            node_type=step.type,
+            transcript=transcript,
+            offset_ms=int((started - self.start) * 1000),
+            duration_ms=int((now - started) * 1000),
+            input_bytes=input_bytes,
+            output_key=key,
+            **fields,
+        ))
+
+    def node_finished(self, step, output, cached, transcript=None):
+        self.record(step, transcript, output_bytes=payload_bytes(output), cached=cached)
+        self.events.node_finished(step, output, cached, transcript)
+
+    def node_failed(self, step, error, transcript=None):
+        self.record(step, transcript, error=error[:MAX_TRACE_ERROR])
+        self.events.node_failed(step, error, transcript)
+
+    def save(self):
+        NodeTrace.objects.bulk_create(self.traces)
+
+
+def start_trace(project_id, job_id=None, events=None):
+    """
+    Wrap `events` in a TracingEvents if this run is sampled for tracing,
+    otherwise return them unchanged.
+    """
+    config = settings.FLOW_TRACES
+    if not config['ENABLED'] or random.random() >= config['SAMPLE_RATE']:
+        return events
+    return TracingEvents(project_id, job_id, events)
@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Project, User
+from api.serializers import ProjectFlowSerializer
+from api.services.flow_persistence import replace_flow, sync_flow, prefetch_flow
+
+NODE_TYPES = ['ai_node', 'code_node', 'template_node']
+
+# Queries allowed to serialize a whole flow: nodes, examples and edges
+FLOW_LOAD_QUERY_BUDGET = 3
+
+
+def build_flow(size):
+    """
+    Build a synthetic flow payload: input -> `size` content nodes -> output.
+    """
+    nodes = [
+        {'id': 'input', 'type': 'input_node', 'data': {'label': 'Transcripts'}, 'position': {'x': 0, 'y': 0}},
+        {'id': 'output', 'type': 'output_node', 'data': {'label': 'Output'}, 'position': {'x': 800, 'y': 0}},
+    ]
+    edges = []
+    for index in range(size):
+        node_id = f'node_{index}'
+        nodes.append({
+            'id': node_id,
+            'type': NODE_TYPES[index % len(NODE_TYPES)],
+            'position': {'x': 400, 'y': index * 100},
+            'data': {
+                'label': f'Node {index}',
+                'prompt': 'Summarize {{Transcripts}}',
+                'examples': [{'name': 'Example', 'input': 'in', 'output': 'out'}],
+                'code': 'def process_data(input_data):\n    return input_data',
+                'template': '# Report\n\n{{Transcripts}}',
+            },
+        })
+        edges.append({'id': f'in_{index}', 'source': 'input', 'target': node_id})
+        edges.append({'id': f'out_{index}', 'source': node_id, 'target': 'output'})
+    return {'nodes': nodes, 'edges': edges}
+
+
+class Command(BaseCommand):
+    help = 'Measure flow save/load time and query count for flows of different sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+
+    def measure(self, func, *args):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func(*args)
+            elapsed = time.perf_counter() - start
+        return elapsed * 1000, len(queries)
+
+    def load(self, project):
+        # Start from a clean instance so nothing is served from a previous prefetch
+        project = Project.objects.get(pk=project.pk)
+        return ProjectFlowSerializer(prefetch_flow(project)).data
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'nodes':>6}  {'scenario':<14}{'ms':>10}{'queries':>9}")
+
+        # Everything runs inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            creator = User.objects.create_user(email='flow-benchmark@example.com', role='creator')
+            for size in options['sizes']:
+                project = Project.objects.create(name='Benchmark', url_name=f'benchmark-{size}', creator=creator)
+                flow = build_flow(size)
+                edited = build_flow(size)
+                edited['nodes'][2]['data']['prompt'] = 'Edited prompt'
+
+                scenarios = [
+                    ('replace', replace_flow, flow),
+                    ('sync (no-op)', sync_flow, flow),
+                    ('sync (1 edit)', sync_flow, edited),
+                ]
+                for name, func, payload in scenarios:
+                    ms, queries = self.measure(func, project, payload)
+                    self.stdout.write(f'{size:>6}  {name:<14}{ms:>10.1f}{queries:>9}')
+
+                ms, queries = self.measure(self.load, project)
+                self.stdout.write(f"{size:>6}  {'load':<14}{ms:>10.1f}{queries - 1:>9}")
+                if queries - 1 > FLOW_LOAD_QUERY_BUDGET:
+                    raise CommandError(
+                        f'Loading a {size} node flow took {queries - 1} queries '
+                        f'(budget: {FLOW_LOAD_QUERY_BUDGET})'
+                    )
+
+            transaction.set_rollback(True)
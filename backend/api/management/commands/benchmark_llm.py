@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.engine.llm import get_llm_client
+from api.engine.loop import run_sync
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Load-test the configured LLM client (e.g. against run_mock_llm) and report throughput and tail latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--distinct', type=int, default=None,
+                            help='Number of distinct prompts; fewer than --requests exercises coalescing')
+
+    async def load_test(self, total, distinct):
+        client = get_llm_client()
+        latencies = []
+
+        async def call(index):
+            start = time.perf_counter()
+            await client.complete([{'role': 'user', 'content': f'Benchmark prompt {index % distinct}'}])
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(call(index) for index in range(total)), return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        errors = [result for result in results if isinstance(result, Exception)]
+        return elapsed, latencies, errors
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        distinct = options['distinct'] or total
+        elapsed, latencies, errors = run_sync(self.load_test(total, distinct))
+
+        self.stdout.write(f"requests     {total} ({distinct} distinct), {len(errors)} failed")
+        self.stdout.write(f"elapsed      {elapsed:.2f} s")
+        self.stdout.write(f"throughput   {len(latencies) / elapsed:.1f} req/s")
+        if latencies:
+            for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                self.stdout.write(f"{name:<13}{percentile(latencies, fraction) * 1000:.0f} ms")
+            self.stdout.write(f"{'max':<13}{max(latencies) * 1000:.0f} ms")
+        if errors:
+            self.stdout.write(f"first error  {errors[0]}")
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.engine.templates import VARIABLE_PATTERN, get_template
+
+TEMPLATE = """# Meeting report
+
+## Summary
+{{Summary}}
+
+## Action items
+{{Action items}}
+
+## Transcript
+{{Transcripts}}
+"""
+
+
+def render_by_parsing(template, variables):
+    """
+    Baseline: scan the template for references on every render.
+    """
+    return VARIABLE_PATTERN.sub(lambda match: variables.get(match.group(1), match.group(0)), template)
+
+
+class Command(BaseCommand):
+    help = 'Render one template node against many jobs, parsing per job vs. compiling once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=10000)
+        parser.add_argument('--transcript-size', type=int, default=20000, help='Characters per transcript')
+
+    def handle(self, *args, **options):
+        jobs = [
+            {
+                'Summary': f'Summary of job {index}. ' * 20,
+                'Action items': f'- Follow up on item {index}\n' * 10,
+                'Transcripts': ('word ' * (options['transcript_size'] // 5)) + str(index),
+            }
+            for index in range(options['jobs'])
+        ]
+
+        start = time.perf_counter()
+        for variables in jobs:
+            render_by_parsing(TEMPLATE, variables)
+        parsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for variables in jobs:
+            get_template(TEMPLATE).render_to_string(variables)
+        compiled = time.perf_counter() - start
+
+        count = options['jobs']
+        self.stdout.write(f"{'mode':<18}{'total s':>10}{'jobs/s':>12}")
+        self.stdout.write(f"{'parse per job':<18}{parsed:>10.3f}{count / parsed:>12.0f}")
+        self.stdout.write(f"{'compiled once':<18}{compiled:>10.3f}{count / compiled:>12.0f}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.services.transcript_patches import compact_transcripts
+
+
+class Command(BaseCommand):
+    help = 'Fold the stored edits of transcripts into their content.'
+
+    def handle(self, *args, **options):
+        compacted = compact_transcripts()
+        self.stdout.write(f"Compacted the edits of {compacted} transcripts")
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.engine.memo import prune_node_outputs
+
+
+class Command(BaseCommand):
+    help = 'Delete expired rows of the persistent node output memo and cap the table at FLOW_MEMO["PERSISTENT_MAX_ROWS"].'
+
+    def handle(self, *args, **options):
+        deleted = prune_node_outputs()
+        config = settings.FLOW_MEMO
+        self.stdout.write(
+            f"Deleted {deleted} memoized node outputs (TTL {config['PERSISTENT_TTL_DAYS']} days, "
+            f"cap {config['PERSISTENT_MAX_ROWS']} rows)"
+        )
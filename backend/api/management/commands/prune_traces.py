@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.services.traces import prune_traces
+
+
+class Command(BaseCommand):
+    help = 'Delete node execution traces older than FLOW_TRACES["TTL_DAYS"].'
+
+    def handle(self, *args, **options):
+        deleted = prune_traces()
+        self.stdout.write(f"Deleted {deleted} traces older than {settings.FLOW_TRACES['TTL_DAYS']} days")
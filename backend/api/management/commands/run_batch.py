@@ -0,0 +1,75 @@
+import os
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.models import BatchRun, Project
+from api.services.batch_runs import BatchLeaseLost, create_batch, extend_batch_leases, fail_batch, run_batch
+
+
+class Command(BaseCommand):
+    help = "Run a project's flow over its client jobs in this process, reporting progress and throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('--job-ids', type=int, nargs='+')
+        parser.add_argument('--created-after', help='ISO datetime')
+        parser.add_argument('--created-before', help='ISO datetime')
+        parser.add_argument('--missing-output', action='store_true', help='Only jobs without an output yet')
+        parser.add_argument('--chunk-size', type=int, default=100)
+
+    def report(self, batch):
+        self.stdout.write(
+            f"{batch.processed}/{batch.total} jobs ({batch.failed} failed), {batch.jobs_per_second} jobs/s"
+        )
+
+    def heartbeat(self, batch, worker_id, stopping):
+        # Renew the lease independently of chunk progress, so slow chunks do not lose it
+        interval = settings.FLOW_JOB_QUEUE['VISIBILITY_TIMEOUT'] / 3
+        try:
+            while not stopping.wait(interval):
+                extend_batch_leases(worker_id, [batch.id])
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(id=options['project_id'])
+        except Project.DoesNotExist:
+            raise CommandError(f"Project {options['project_id']} does not exist.")
+
+        filters = {
+            'job_ids': options['job_ids'],
+            'created_after': options['created_after'],
+            'created_before': options['created_before'],
+            'missing_output': options['missing_output'],
+        }
+        filters = {name: value for name, value in filters.items() if value}
+
+        # Run here rather than in a worker; the batch is created already leased
+        # to this process, so workers never see it queued
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        batch = create_batch(project, None, filters, options['chunk_size'], worker_id=worker_id)
+
+        self.stdout.write(f"Batch {batch.id}: {batch.total} jobs")
+        stopping = threading.Event()
+        heartbeat = threading.Thread(target=self.heartbeat, args=(batch, worker_id, stopping), daemon=True)
+        heartbeat.start()
+        try:
+            run_batch(batch, worker_id, on_progress=self.report)
+        except BatchLeaseLost as e:
+            raise CommandError(str(e))
+        except Exception as e:
+            fail_batch(batch, worker_id, str(e))
+            raise
+        finally:
+            stopping.set()
+            heartbeat.join()
+
+        batch.refresh_from_db()
+        self.report(batch)
+        if batch.status == BatchRun.FAILED:
+            raise CommandError(batch.error)
@@ -0,0 +1,114 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from api.engine.memo import prune_node_outputs
+from api.services.batch_runs import BatchLeaseLost, claim_batch, extend_batch_leases, fail_batch, run_batch
+from api.services.job_queue import claim_runs, execute_run, extend_leases
+from api.services.traces import prune_traces
+from api.services.transcript_patches import compact_transcripts
+from api.transcription.uploads import prune_uploads
+
+
+class Command(BaseCommand):
+    help = 'Execute queued job runs and batches, up to --concurrency at a time. Stops gracefully on SIGINT/SIGTERM.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Runs executed at once by this worker')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds between polls when idle')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def process(self, run, worker_id):
+        try:
+            execute_run(run, worker_id)
+            self.stdout.write(f"Run {run.id} of job {run.job_id} finished")
+        finally:
+            # Worker threads are reused; do not keep a connection per thread open
+            connection.close()
+
+    def process_batch(self, batch, worker_id):
+        try:
+            run_batch(batch, worker_id)
+            self.stdout.write(f"Batch {batch.id} finished: {batch.processed} jobs, {batch.failed} failed")
+        except BatchLeaseLost as e:
+            # Not ours to fail; the worker that took it over carries on
+            self.stderr.write(str(e))
+        except Exception as e:
+            fail_batch(batch, worker_id, str(e))
+            self.stderr.write(f"Batch {batch.id} failed (attempt {batch.attempts} of {batch.max_attempts}): {e}")
+        finally:
+            connection.close()
+
+    def renew(self, worker_id, keys):
+        extend_leases(worker_id, [item_id for kind, item_id in keys if kind == 'run'])
+        extend_batch_leases(worker_id, [item_id for kind, item_id in keys if kind == 'batch'])
+
+    def handle(self, *args, **options):
+        config = settings.FLOW_JOB_QUEUE
+        concurrency = options['concurrency']
+        poll_interval = options['poll_interval'] or config['POLL_INTERVAL']
+        heartbeat_interval = config['VISIBILITY_TIMEOUT'] / 3
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+        stopping = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopping.set())
+
+        self.stdout.write(f"Worker {worker_id} running up to {concurrency} jobs")
+        active = {}  # ('run' | 'batch', id) -> future
+        last_heartbeat = time.monotonic()
+        last_prune = None
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job-run') as executor:
+            while not stopping.is_set():
+                active = {key: future for key, future in active.items() if not future.done()}
+
+                close_old_connections()
+                claimed = claim_runs(worker_id, concurrency - len(active))
+                for run in claimed:
+                    active[('run', run.id)] = executor.submit(self.process, run, worker_id)
+                # Batches take a free slot only when no single runs are waiting
+                if not claimed and len(active) < concurrency:
+                    batch = claim_batch(worker_id)
+                    if batch is not None:
+                        claimed = [batch]
+                        active[('batch', batch.id)] = executor.submit(self.process_batch, batch, worker_id)
+
+                if active and time.monotonic() - last_heartbeat >= heartbeat_interval:
+                    self.renew(worker_id, list(active))
+                    last_heartbeat = time.monotonic()
+
+                if last_prune is None or time.monotonic() - last_prune >= settings.FLOW_TRACES['PRUNE_INTERVAL']:
+                    pruned = prune_traces()
+                    if pruned:
+                        self.stdout.write(f"Pruned {pruned} expired traces")
+                    pruned = prune_node_outputs()
+                    if pruned:
+                        self.stdout.write(f"Pruned {pruned} memoized node outputs")
+                    expired = prune_uploads()
+                    if expired:
+                        self.stdout.write(f"Discarded {expired} expired audio uploads")
+                    compacted = compact_transcripts()
+                    if compacted:
+                        self.stdout.write(f"Compacted the edits of {compacted} transcripts")
+                    last_prune = time.monotonic()
+
+                if options['once'] and not active:
+                    break
+                if not claimed:
+                    stopping.wait(poll_interval)
+
+            if active:
+                self.stdout.write(f"Waiting for {len(active)} running jobs to finish")
+            # Leases of unfinished runs keep being renewed until they are done
+            while any(not future.done() for future in active.values()):
+                time.sleep(min(poll_interval, heartbeat_interval))
+                if time.monotonic() - last_heartbeat >= heartbeat_interval:
+                    self.renew(worker_id, [key for key, future in active.items() if not future.done()])
+                    last_heartbeat = time.monotonic()
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible `/chat/completions` stand-in. The answer and latency are
+    derived from a hash of the request, so the same prompt always gets the
+    same response after the same delay. Streamed requests get the same answer
+    as Server-Sent Events, one word at a time. `/audio/transcriptions` answers
+    with a fixed text derived from the uploaded bytes.
+    """
+    protocol_version = 'HTTP/1.1'  # keep connections alive like a real provider
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.endswith('/audio/transcriptions'):
+            digest = hashlib.sha256(body).hexdigest()
+            time.sleep(self.server.latency_ms / 1000)
+            return self.respond(200, {'text': f"[mock transcription {digest[:12]}] {len(body)} bytes of audio"})
+        if not self.path.endswith('/chat/completions'):
+            return self.respond(404, {'error': {'message': 'Not found'}})
+        if random.random() < self.server.error_rate:
+            return self.respond(429, {'error': {'message': 'Rate limited (simulated)'}})
+
+        try:
+            request = json.loads(body)
+            messages = request['messages']
+        except (ValueError, KeyError):
+            return self.respond(400, {'error': {'message': 'Invalid request'}})
+
+        digest = hashlib.sha256(body).hexdigest()
+        jitter = int(digest[:8], 16) / 0xFFFFFFFF * self.server.jitter_ms
+        time.sleep((self.server.latency_ms + jitter) / 1000)
+
+        prompt = messages[-1].get('content', '') if messages else ''
+        content = f"[mock {digest[:12]}] {prompt[:self.server.echo_chars]}"
+        if request.get('stream'):
+            return self.stream(digest, content)
+        self.respond(200, {
+            'id': f'mock-{digest[:24]}',
+            'object': 'chat.completion',
+            'model': 'mock',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        })
+
+    def respond(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, digest, content):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for index, piece in enumerate(re.findall(r'\S+\s*|\s+', content)):
+            if index:
+                time.sleep(self.server.token_ms / 1000)
+            self.write_event({
+                'id': f'mock-{digest[:24]}',
+                'object': 'chat.completion.chunk',
+                'model': 'mock',
+                'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}],
+            })
+        self.write_event('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_event(self, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        event = f'data: {data}\n\n'.encode('utf-8')
+        self.wfile.write(f'{len(event):x}\r\n'.encode('ascii') + event + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+    help = 'Run a local OpenAI-compatible LLM stand-in with deterministic responses and configurable latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=200, help='Base latency of every response')
+        parser.add_argument('--jitter-ms', type=float, default=100, help='Extra latency, fixed per prompt')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+        parser.add_argument('--echo-chars', type=int, default=200, help='Characters of the prompt echoed back')
+        parser.add_argument('--token-ms', type=float, default=20, help='Delay between streamed words')
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer((options['host'], options['port']), MockLLMHandler)
+        server.daemon_threads = True
+        server.latency_ms = options['latency_ms']
+        server.jitter_ms = options['jitter_ms']
+        server.error_rate = options['error_rate']
+        server.echo_chars = options['echo_chars']
+        server.token_ms = options['token_ms']
+        server.verbose = options['verbosity'] > 1
+
+        self.stdout.write(f"Mock LLM listening on http://{options['host']}:{options['port']}/v1")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
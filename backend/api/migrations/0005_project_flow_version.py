@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_clientjob_transcript_projectclient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='flow_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='transcript',
+            name='job',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transcripts', to='api.clientjob'),
+        ),
+    ]
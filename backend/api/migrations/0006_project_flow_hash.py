@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_project_flow_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='flow_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_nodeoutputcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ainode',
+            name='chunk_overlap',
+            field=models.PositiveIntegerField(default=200, help_text='Tokens repeated between chunks'),
+        ),
+        migrations.AddField(
+            model_name='ainode',
+            name='chunk_size',
+            field=models.PositiveIntegerField(default=2000, help_text='Tokens per chunk'),
+        ),
+        migrations.AddField(
+            model_name='ainode',
+            name='execution_mode',
+            field=models.CharField(choices=[('single', 'Single request'), ('map_reduce', 'Map-reduce over chunks')], default='single', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='ainode',
+            name='max_parallel_chunks',
+            field=models.PositiveIntegerField(default=4),
+        ),
+        migrations.AddField(
+            model_name='ainode',
+            name='reduce_prompt',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
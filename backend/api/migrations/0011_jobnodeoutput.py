@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_batchrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobNodeOutput',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node_id', models.CharField(max_length=255)),
+                ('key', models.CharField(max_length=64)),
+                ('output', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='node_outputs', to='api.clientjob')),
+            ],
+            options={
+                'unique_together': {('job', 'node_id')},
+            },
+        ),
+    ]
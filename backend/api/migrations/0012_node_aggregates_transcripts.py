@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_jobnodeoutput'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='aggregates_transcripts',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_node_aggregates_transcripts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trace_id', models.CharField(db_index=True, max_length=32)),
+                ('node_id', models.CharField(max_length=100)),
+                ('node_type', models.CharField(max_length=20)),
+                ('transcript', models.PositiveIntegerField(blank=True, null=True)),
+                ('offset_ms', models.PositiveIntegerField()),
+                ('duration_ms', models.PositiveIntegerField()),
+                ('input_bytes', models.PositiveIntegerField(default=0)),
+                ('output_bytes', models.PositiveIntegerField(default=0)),
+                ('cached', models.BooleanField(default=False)),
+                ('output_key', models.CharField(blank=True, max_length=64)),
+                ('error', models.CharField(blank=True, max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='node_traces', to='api.clientjob')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='node_traces', to='api.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['project', 'created_at'], name='api_nodetra_project_0442ab_idx'), models.Index(fields=['created_at'], name='api_nodetra_created_15ecb1_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_audioupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcript',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_transcript_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nodeoutputcache',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
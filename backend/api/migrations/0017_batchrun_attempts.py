@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_nodeoutputcache_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchrun',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='batchrun',
+            name='max_attempts',
+            field=models.PositiveIntegerField(default=3),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_batchrun_attempts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='audioupload',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('finalizing', 'Finalizing'), ('completed', 'Completed'), ('failed', 'Failed')], default='uploading', max_length=10),
+        ),
+    ]
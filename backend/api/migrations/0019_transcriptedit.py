@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_content_version(apps, schema_editor):
+    # Existing content is complete: it is at the transcript's current version
+    Transcript = apps.get_model('api', 'Transcript')
+    Transcript.objects.update(content_version=models.F('version'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_audioupload_finalizing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcript',
+            name='content_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(set_content_version, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='TranscriptEdit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('operations', models.JSONField(blank=True, null=True)),
+                ('diff', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('transcript', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='edits', to='api.transcript')),
+            ],
+            options={
+                'unique_together': {('transcript', 'version')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_transcriptedit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='layout_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
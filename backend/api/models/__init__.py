@@ -2,4 +2,5 @@
 from .users import User
 from .projects import Project, SupportedTranscriptLanguage, ProjectSupportedTranscriptLanguage
 from .flow import Node, Edge, AINode, Example, CodeNode, TemplateNode
-from .client import ClientJob, Transcript, ProjectClient
\ No newline at end of file
+from .client import ClientJob, Transcript, TranscriptEdit, ProjectClient, AudioUpload
+from .execution import NodeOutputCache, JobNodeOutput, NodeTrace, JobRun, BatchRun
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from api.models.users import User
 from api.models.projects import Project
@@ -26,4 +28,64 @@ class Transcript(models.Model):
     job = models.ForeignKey(ClientJob, on_delete=models.CASCADE, related_name='transcripts')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    content = models.TextField()
\ No newline at end of file
+    content = models.TextField()
+    # Incremented on every content change; patches must name the version they edit
+    version = models.PositiveIntegerField(default=1)
+    # Version `content` is at; the edits after it are stored as TranscriptEdits
+    content_version = models.PositiveIntegerField(default=1)
+
+class TranscriptEdit(models.Model):
+    """
+    A patch of a transcript, appended instead of rewriting its content.
+    Edits past the transcript's content_version are replayed when it is read
+    and folded into the content every TRANSCRIPT_EDITS['COMPACT_EVERY'] edits
+    and by the pruning pass of run_job_worker.
+    """
+    transcript = models.ForeignKey(Transcript, on_delete=models.CASCADE, related_name='edits')
+    # The transcript version this edit produced
+    version = models.PositiveIntegerField()
+    operations = models.JSONField(null=True, blank=True)
+    diff = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('transcript', 'version')
+
+    def __str__(self):
+        return f"Edit {self.version} of transcript {self.transcript_id}"
+
+class AudioUpload(models.Model):
+    """
+    A resumable, chunked audio upload that ends up as a Transcript of a job.
+    Chunks are stored on disk under AUDIO_UPLOADS['ROOT'] until finalized.
+    """
+    UPLOADING = 'uploading'
+    FINALIZING = 'finalizing'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (FINALIZING, 'Finalizing'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='audio_uploads')
+    job = models.ForeignKey(ClientJob, on_delete=models.CASCADE, related_name='audio_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    language = models.CharField(max_length=10, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UPLOADING)
+    transcript = models.ForeignKey(Transcript, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.filename} for job {self.job_id} ({self.status})"
+
+    @property
+    def chunk_count(self):
+        return max((self.size + self.chunk_size - 1) // self.chunk_size, 1)
@@ -0,0 +1,155 @@
+from django.db import models
+from django.utils import timezone
+
+class NodeOutputCache(models.Model):
+    """
+    Persistent tier of the node output memo, keyed by content address.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    output = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Node output {self.key[:12]}"
+
+class JobNodeOutput(models.Model):
+    """
+    Last output of an AI or code node for a job, with the memo key of the run
+    that produced it (node content plus inputs). A re-run reuses the output
+    while the key is unchanged, so only nodes downstream of an edit run again.
+    """
+    job = models.ForeignKey('api.ClientJob', on_delete=models.CASCADE, related_name='node_outputs')
+    node_id = models.CharField(max_length=255)
+    key = models.CharField(max_length=64)
+    output = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('job', 'node_id')
+
+    def __str__(self):
+        return f"Output of {self.node_id} for job {self.job_id}"
+
+
+class NodeTrace(models.Model):
+    """
+    Timing of one node execution within a job run; the rows of a run share a
+    `trace_id`. Kept compact: outputs are referenced by their memo key instead
+    of being copied, and rows expire after FLOW_TRACES['TTL_DAYS'].
+    """
+    trace_id = models.CharField(max_length=32, db_index=True)
+    project = models.ForeignKey('api.Project', on_delete=models.CASCADE, related_name='node_traces')
+    job = models.ForeignKey('api.ClientJob', on_delete=models.SET_NULL, null=True, blank=True, related_name='node_traces')
+    node_id = models.CharField(max_length=100)
+    node_type = models.CharField(max_length=20)
+    # Transcript index for nodes run once per transcript
+    transcript = models.PositiveIntegerField(null=True, blank=True)
+    # Start relative to the beginning of the run
+    offset_ms = models.PositiveIntegerField()
+    duration_ms = models.PositiveIntegerField()
+    input_bytes = models.PositiveIntegerField(default=0)
+    output_bytes = models.PositiveIntegerField(default=0)
+    cached = models.BooleanField(default=False)
+    output_key = models.CharField(max_length=64, blank=True)
+    error = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"Trace {self.trace_id[:8]}: {self.node_id} ({self.duration_ms} ms)"
+
+
+class JobRun(models.Model):
+    """
+    One queued execution of a client job. The table is the job queue: workers
+    claim rows with SELECT ... FOR UPDATE SKIP LOCKED and hold them for a
+    visibility timeout, renewed while the run is in progress.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    job = models.ForeignKey('api.ClientJob', on_delete=models.CASCADE, related_name='runs')
+    # Denormalized from the job's client so runs can be balanced across projects
+    project = models.ForeignKey('api.Project', on_delete=models.CASCADE, related_name='job_runs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Not claimable before this time (used to delay retries)
+    available_at = models.DateTimeField()
+    # Lease of the worker running it; expired leases are claimed again
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return f"Run {self.id} of job {self.job_id} ({self.status})"
+
+class BatchRun(models.Model):
+    """
+    Execution of a project's flow over a filtered set of its client jobs.
+    Jobs are processed in id order; `cursor` is the last job done, so a batch
+    picked up again after its worker stopped resumes where it left off.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    project = models.ForeignKey('api.Project', on_delete=models.CASCADE, related_name='batch_runs')
+    created_by = models.ForeignKey('api.User', on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Job filters, see services.batch_runs.filter_jobs
+    filters = models.JSONField(default=dict, blank=True)
+    chunk_size = models.PositiveIntegerField(default=100)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    cursor = models.BigIntegerField(default=0)
+    # Claims so far; a batch whose worker keeps dying fails after max_attempts
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Batch {self.id} of project {self.project_id} ({self.status})"
+
+    @property
+    def jobs_per_second(self):
+        if self.started_at is None or not self.processed:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.processed / elapsed, 2) if elapsed > 0 else 0.0
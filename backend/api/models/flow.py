@@ -19,6 +19,9 @@ class Node(models.Model):
     label = models.CharField(max_length=255)
     position_x = models.FloatField()
     position_y = models.FloatField()
+    # Merges the per-transcript results of its inputs; nodes upstream of an
+    # aggregating node run once per transcript, in parallel
+    aggregates_transcripts = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -48,10 +51,25 @@ class AINode(models.Model):
     """
     Additional data for AI nodes.
     """
+    SINGLE = 'single'
+    MAP_REDUCE = 'map_reduce'
+    EXECUTION_MODES = [
+        (SINGLE, 'Single request'),
+        (MAP_REDUCE, 'Map-reduce over chunks'),
+    ]
+
     node = models.OneToOneField(Node, on_delete=models.CASCADE, related_name='ai_data')
     prompt = models.TextField()
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Map-reduce: the input is split into overlapping chunks that are processed
+    # in parallel with `prompt`, then the partial outputs are combined with `reduce_prompt`
+    execution_mode = models.CharField(max_length=20, choices=EXECUTION_MODES, default=SINGLE)
+    chunk_size = models.PositiveIntegerField(default=2000, help_text="Tokens per chunk")
+    chunk_overlap = models.PositiveIntegerField(default=200, help_text="Tokens repeated between chunks")
+    max_parallel_chunks = models.PositiveIntegerField(default=4)
+    reduce_prompt = models.TextField(blank=True, default='')
+
     def __str__(self):
         return f"AI Node: {self.node.label}"
     
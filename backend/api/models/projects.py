@@ -54,6 +54,14 @@ class Project(models.Model):
         help_text="Main brand color for the project interface"
     )
 
+    # Bumped on every flow write; used for ETags and to key cached flow data
+    flow_version = models.PositiveIntegerField(default=0)
+    # Hash of the last saved flow payload; identical autosaves are skipped
+    flow_hash = models.CharField(max_length=64, blank=True, default='')
+    # Bumped when only node positions change; part of the ETag, but not of the
+    # flow version the execution plan is cached under
+    layout_version = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return self.name
     
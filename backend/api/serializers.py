@@ -1,8 +1,10 @@
 from rest_framework import serializers
-from api.models import Project, Node, Edge, AINode, CodeNode, TemplateNode, Example, SupportedTranscriptLanguage, ProjectSupportedTranscriptLanguage, User, ClientJob, Transcript
-from django.db import transaction
+from api.models import Project, Node, Edge, AINode, CodeNode, TemplateNode, Example, SupportedTranscriptLanguage, ProjectSupportedTranscriptLanguage, User, ClientJob, Transcript, JobRun, BatchRun, AudioUpload
+from django.conf import settings
+from django.db import models, transaction
 from django.db.utils import IntegrityError
 from django.utils import timezone
+from api.services.transcript_patches import current_contents
 
 class ExampleSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,7 +16,7 @@ class AINodeDataSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = AINode
-        fields = ['prompt', 'examples']
+        fields = ['prompt', 'examples', 'execution_mode', 'chunk_size', 'chunk_overlap', 'max_parallel_chunks', 'reduce_prompt']
 
 class CodeNodeDataSerializer(serializers.ModelSerializer):
     class Meta:
@@ -39,18 +41,20 @@ class NodeSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         # Get the base representation
         ret = super().to_representation(instance)
-        print('ret', ret)
         
         # Format data based on node type
         node_data = {
             'label': instance.label,
             'examples': [],
-            'id': ret['id']
+            'id': ret['id'],
+            'aggregate': instance.aggregates_transcripts,
         }
 
         # Add AI node data
         if instance.type == 'ai_node':
             node_data['prompt'] = ret['ai_data']['prompt']
+            for field in ('execution_mode', 'chunk_size', 'chunk_overlap', 'max_parallel_chunks', 'reduce_prompt'):
+                node_data[field] = ret['ai_data'][field]
             for example in ret['ai_data']['examples']:
                 node_data['examples'].append({
                     'name': example['name'],
@@ -242,13 +246,45 @@ class ProjectSupportedTranscriptLanguageSerializer(serializers.ModelSerializer):
         model = ProjectSupportedTranscriptLanguage
         fields = ['id', 'language', 'language_id']
 
+class TranscriptListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Resolve the pending edits of all transcripts at once, not one transcript at a time
+        transcripts = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        stale = [transcript for transcript in transcripts if transcript.version > transcript.content_version]
+        for transcript, content in zip(stale, current_contents(stale)):
+            transcript.content = content
+            transcript.content_version = transcript.version
+        return super().to_representation(transcripts)
+
 class TranscriptSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
 
     class Meta:
         model = Transcript
-        fields = ['id', 'created_at', 'updated_at', 'content']
-        read_only_fields = ['created_at', 'updated_at']
+        fields = ['id', 'created_at', 'updated_at', 'content', 'version']
+        read_only_fields = ['created_at', 'updated_at', 'version']
+        list_serializer_class = TranscriptListSerializer
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.version > instance.content_version:
+            # Patches since the content was last compacted are stored as edits
+            data['content'] = current_contents([instance])[0]
+        return data
+
+class TranscriptPatchSerializer(serializers.Serializer):
+    """
+    An edit of a transcript: text `operations` or a unified `diff`, made
+    against `version`; see services.transcript_patches.
+    """
+    version = serializers.IntegerField(min_value=1)
+    operations = serializers.ListField(child=serializers.DictField(), required=False)
+    diff = serializers.CharField(required=False, trim_whitespace=False)
+
+    def validate(self, data):
+        if ('operations' in data) == ('diff' in data):
+            raise serializers.ValidationError('Send either operations or a diff.')
+        return data
 
 class ClientJobDetailedSerializer(serializers.ModelSerializer):
     transcripts = TranscriptSerializer(many=True, required=False)
@@ -259,43 +295,56 @@ class ClientJobDetailedSerializer(serializers.ModelSerializer):
         read_only_fields = ['updated_at', 'created_at']
 
     def update(self, instance, validated_data):
-        # Extract transcripts data
         transcripts_data = validated_data.pop('transcripts', None)
-        
-        # Update the job instance
-        instance = super().update(instance, validated_data)
-        
-        # Update transcripts
-        if transcripts_data is None:
-            return instance
-        
-        incoming_transcript_ids = []
-        print('TRANSCRIPTS', transcripts_data, flush=True)
-        for transcript_data in transcripts_data:
-            transcript_id = transcript_data.get('id', None)
-            if transcript_id:
-                # Update existing transcript
-                transcript = Transcript.objects.get(id=transcript_id)
-                transcript.content = transcript_data.get('content', transcript.content)
-                transcript.updated_at = timezone.now()
-                transcript.save()
-            else:
-                # Create new transcript
-                transcript = Transcript.objects.create(job=instance, content=transcript_data['content'])
-            incoming_transcript_ids.append(transcript.id)
-        
-        # Delete transcripts that are in the database but not in the request
-        existing_transcripts = Transcript.objects.filter(job=instance)
-        existing_transcript_ids = [transcript.id for transcript in existing_transcripts]
-        print('EXISTING', existing_transcript_ids, flush=True)
-        print('INCOMING', incoming_transcript_ids, flush=True)
-        ids_to_remove = set(existing_transcript_ids) - set(incoming_transcript_ids)
-        for transcript_id in ids_to_remove:
-            Transcript.objects.filter(id=transcript_id).delete()
-        
-        instance.save()
+
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if transcripts_data is not None:
+                self._sync_transcripts(instance, transcripts_data)
         return instance
-    
+
+    def _sync_transcripts(self, job, transcripts_data):
+        """
+        Make the job's transcripts match `transcripts_data`: entries with an id
+        update that transcript, entries without one are created and transcripts
+        left out are deleted. Runs a fixed number of queries, and unchanged
+        transcripts are not written.
+        The transcripts stay locked until the update commits, so a patch
+        arriving in the meantime conflicts instead of being overwritten.
+        """
+        existing = {transcript.id: transcript for transcript in Transcript.objects.select_for_update().filter(job=job)}
+
+        unknown = sorted({data['id'] for data in transcripts_data if data.get('id')} - set(existing))
+        if unknown:
+            raise serializers.ValidationError({
+                'transcripts': f"Transcripts {', '.join(map(str, unknown))} do not belong to this job."
+            })
+
+        now = timezone.now()
+        contents = dict(zip(existing, current_contents(existing.values())))
+        changed, created, kept = [], [], set()
+        for data in transcripts_data:
+            transcript = existing.get(data.get('id'))
+            if transcript is None:
+                created.append(Transcript(job=job, content=data.get('content', '')))
+                continue
+            kept.add(transcript.id)
+            if 'content' in data and data['content'] != contents[transcript.id]:
+                # The whole content is replaced, pending edits included
+                transcript.content = data['content']
+                transcript.updated_at = now
+                transcript.version += 1
+                transcript.content_version = transcript.version
+                changed.append(transcript)
+
+        if changed:
+            Transcript.objects.bulk_update(changed, ['content', 'updated_at', 'version', 'content_version'])
+        if created:
+            Transcript.objects.bulk_create(created)
+        removed = set(existing) - kept
+        if removed:
+            Transcript.objects.filter(id__in=removed).delete()
+
 class ClientJobSerializer(serializers.ModelSerializer):
     class Meta:
         model = ClientJob
@@ -303,4 +352,68 @@ class ClientJobSerializer(serializers.ModelSerializer):
         read_only_fields = ['updated_at', 'created_at']
         extra_kwargs = {
             'user': {'write_only': True}
-        }
\ No newline at end of file
+        }
+
+class JobRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = JobRun
+        fields = ['id', 'job', 'status', 'attempts', 'max_attempts', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+class BatchRunSerializer(serializers.ModelSerializer):
+    jobs_per_second = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = BatchRun
+        fields = ['id', 'project', 'status', 'filters', 'chunk_size', 'total', 'processed', 'failed',
+                  'jobs_per_second', 'attempts', 'max_attempts', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+class BatchRunCreateSerializer(serializers.Serializer):
+    """
+    Filters selecting the jobs of a batch; see services.batch_runs.filter_jobs.
+    """
+    job_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    missing_output = serializers.BooleanField(required=False, default=False)
+    chunk_size = serializers.IntegerField(required=False, default=100, min_value=1, max_value=1000)
+
+    def get_filters(self):
+        filters = {name: value for name, value in self.validated_data.items() if name != 'chunk_size' and value}
+        for name in ('created_after', 'created_before'):
+            if name in filters:
+                filters[name] = filters[name].isoformat()
+        return filters
+
+class AudioUploadSerializer(serializers.ModelSerializer):
+    chunk_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = AudioUpload
+        fields = ['id', 'job', 'filename', 'size', 'chunk_size', 'chunk_count', 'language', 'status',
+                  'transcript', 'error', 'created_at', 'updated_at']
+        read_only_fields = ['status', 'transcript', 'error', 'created_at', 'updated_at']
+        extra_kwargs = {
+            'chunk_size': {'required': False},
+        }
+
+    def validate_job(self, job):
+        if job.user != self.context['request'].user:
+            raise serializers.ValidationError('You do not have permission to upload to this job.')
+        return job
+
+    def validate_size(self, size):
+        limit = settings.AUDIO_UPLOADS['MAX_SIZE']
+        if not 0 < size <= limit:
+            raise serializers.ValidationError(f'Uploads must be between 1 and {limit} bytes.')
+        return size
+
+    def validate_chunk_size(self, chunk_size):
+        if not 64 * 1024 <= chunk_size <= settings.AUDIO_UPLOADS['MAX_CHUNK_SIZE']:
+            raise serializers.ValidationError('Chunk size is out of range.')
+        return chunk_size
+
+    def create(self, validated_data):
+        validated_data.setdefault('chunk_size', settings.AUDIO_UPLOADS['CHUNK_SIZE'])
+        return super().create(validated_data)
@@ -0,0 +1,222 @@
+# services/batch_runs.py
+import asyncio
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.engine.executor import execute_plan_async, load_node_state, save_node_state
+from api.engine.loop import run_sync
+from api.engine.plan import FlowValidationError, get_plan
+from api.engine.tracing import TracingEvents, start_trace
+from api.models import BatchRun, ClientJob, NodeTrace, Transcript
+from api.services.transcript_patches import current_contents
+
+
+class BatchLeaseLost(Exception):
+    """
+    Raised when a batch's lease expired and another worker took the batch over.
+    """
+    def __init__(self, batch):
+        super().__init__(f"Batch {batch.id} was taken over by another worker.")
+        self.batch = batch
+
+
+def filter_jobs(project, filters):
+    """
+    Client jobs of a project matching batch filters:
+    `job_ids`, `created_after`, `created_before` (ISO datetimes) and
+    `missing_output` (only jobs without an output yet).
+    """
+    jobs = ClientJob.objects.filter(user__projectclient__project=project)
+    if filters.get('job_ids'):
+        jobs = jobs.filter(id__in=filters['job_ids'])
+    if filters.get('created_after'):
+        jobs = jobs.filter(created_at__gte=parse_datetime(filters['created_after']))
+    if filters.get('created_before'):
+        jobs = jobs.filter(created_at__lt=parse_datetime(filters['created_before']))
+    if filters.get('missing_output'):
+        jobs = jobs.filter(Q(output_markdown__isnull=True) | Q(output_markdown=''))
+    return jobs
+
+
+def lease_until():
+    return timezone.now() + timedelta(seconds=settings.FLOW_JOB_QUEUE['VISIBILITY_TIMEOUT'])
+
+
+def create_batch(project, user, filters, chunk_size=100, worker_id=None):
+    """
+    Queue a batch for the workers, or, with `worker_id`, create it already
+    leased to that worker so no other worker can claim it.
+    """
+    fields = {}
+    if worker_id:
+        fields = {
+            'status': BatchRun.RUNNING,
+            'attempts': 1,
+            'locked_by': worker_id,
+            'locked_until': lease_until(),
+            'started_at': timezone.now(),
+        }
+    return BatchRun.objects.create(
+        project=project,
+        created_by=user,
+        filters=filters,
+        chunk_size=chunk_size,
+        total=filter_jobs(project, filters).count(),
+        max_attempts=settings.FLOW_JOB_QUEUE['MAX_ATTEMPTS'],
+        **fields,
+    )
+
+
+def claim_batch(worker_id):
+    """
+    Lease the oldest queued batch, or one whose worker let its lease expire.
+    Expired batches that used up their attempts are failed instead.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # An expired lease counts as a failed attempt
+        BatchRun.objects.filter(status=BatchRun.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')).update(
+            status=BatchRun.FAILED, error='The worker running this batch stopped responding.',
+            locked_by='', locked_until=None, finished_at=now,
+        )
+        batch = (
+            BatchRun.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=BatchRun.QUEUED) | Q(status=BatchRun.RUNNING, locked_until__lt=now))
+            .order_by('id')
+            .first()
+        )
+        if batch is None:
+            return None
+        BatchRun.objects.filter(id=batch.id).update(
+            status=BatchRun.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_by=worker_id,
+            locked_until=lease_until(),
+            started_at=Coalesce('started_at', now),
+        )
+    batch.refresh_from_db()
+    return batch
+
+
+def extend_batch_leases(worker_id, batch_ids):
+    return BatchRun.objects.filter(id__in=batch_ids, status=BatchRun.RUNNING, locked_by=worker_id).update(locked_until=lease_until())
+
+
+def fail_batch(batch, worker_id, error):
+    """
+    Record a failed attempt; the batch is queued again, resuming from its
+    cursor, until it runs out of attempts.
+    """
+    fields = {'error': error, 'locked_by': '', 'locked_until': None}
+    if batch.attempts < batch.max_attempts:
+        fields['status'] = BatchRun.QUEUED
+    else:
+        fields.update(status=BatchRun.FAILED, finished_at=timezone.now())
+    BatchRun.objects.filter(id=batch.id, status=BatchRun.RUNNING, locked_by=worker_id).update(**fields)
+
+
+def load_transcripts(job_ids):
+    """
+    Transcript texts of several jobs, as job id -> list.
+    """
+    transcripts = defaultdict(list)
+    rows = list(Transcript.objects.filter(job_id__in=job_ids).order_by('created_at', 'id'))
+    for row, content in zip(rows, current_contents(rows)):
+        transcripts[row.job_id].append(content)
+    return transcripts
+
+
+async def execute_chunk(plan, transcript_lists, node_states, events):
+    """
+    Run one plan over several jobs at once; failures are returned, not raised.
+    """
+    return await asyncio.gather(
+        *(execute_plan_async(plan, transcripts, job_events, node_state)
+          for transcripts, node_state, job_events in zip(transcript_lists, node_states, events)),
+        return_exceptions=True,
+    )
+
+
+def run_batch(batch, worker_id, on_progress=None):
+    """
+    Execute a claimed batch chunk by chunk.
+
+    The plan is compiled once for the whole batch and node outputs go through
+    the jobs' stored outputs and the shared memo, so nodes whose content and
+    inputs did not change are not run again.
+    Jobs are read `chunk_size` at a time by id, outputs of a chunk are written
+    with one bulk update, and progress is saved after every chunk.
+    `on_progress(batch)` is called after each chunk. The caller keeps the
+    lease alive with extend_batch_leases() while this runs; if it is lost
+    anyway, the chunk in progress is rolled back and BatchLeaseLost raised.
+    """
+    try:
+        plan = get_plan(batch.project)
+    except FlowValidationError as e:
+        owned = BatchRun.objects.filter(id=batch.id, locked_by=worker_id).update(
+            status=BatchRun.FAILED, error=str(e), locked_by='', locked_until=None, finished_at=timezone.now(),
+        )
+        if not owned:
+            raise BatchLeaseLost(batch)
+        return
+
+    jobs = filter_jobs(batch.project, batch.filters).order_by('id').only('id')
+    while True:
+        chunk = list(jobs.filter(id__gt=batch.cursor)[:batch.chunk_size])
+        if not chunk:
+            break
+
+        job_ids = [job.id for job in chunk]
+        transcripts = load_transcripts(job_ids)
+        previous = load_node_state(job_ids)
+        states = {job_id: dict(state) for job_id, state in previous.items()}
+        events = [start_trace(plan.project_id, job_id) for job_id in job_ids]
+        results = run_sync(execute_chunk(
+            plan, [transcripts[job_id] for job_id in job_ids], [states[job_id] for job_id in job_ids], events,
+        ))
+        traces = [trace for job_events in events if isinstance(job_events, TracingEvents) for trace in job_events.traces]
+
+        now = timezone.now()
+        updated = []
+        for job, result in zip(chunk, results):
+            if isinstance(result, Exception):
+                batch.failed += 1
+                batch.error = f"Job {job.id}: {result}"
+                del states[job.id]
+                continue
+            job.output_markdown = result[plan.output_id]
+            job.updated_at = now
+            updated.append(job)
+
+        batch.cursor = chunk[-1].id
+        batch.processed += len(chunk)
+        with transaction.atomic():
+            ClientJob.objects.bulk_update(updated, ['output_markdown', 'updated_at'])
+            save_node_state(states, previous)
+            NodeTrace.objects.bulk_create(traces)
+            owned = BatchRun.objects.filter(id=batch.id, locked_by=worker_id).update(
+                cursor=batch.cursor,
+                processed=batch.processed,
+                failed=batch.failed,
+                error=batch.error,
+            )
+            if not owned:
+                transaction.set_rollback(True)
+                raise BatchLeaseLost(batch)
+        if on_progress is not None:
+            on_progress(batch)
+
+    batch.status = BatchRun.SUCCEEDED
+    batch.finished_at = timezone.now()
+    owned = BatchRun.objects.filter(id=batch.id, locked_by=worker_id).update(
+        status=batch.status, locked_by='', locked_until=None, finished_at=batch.finished_at,
+    )
+    if not owned:
+        raise BatchLeaseLost(batch)
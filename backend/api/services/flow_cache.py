@@ -0,0 +1,83 @@
+# services/flow_cache.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.http import parse_etags, quote_etag
+
+from api.models import Project
+from api.serializers import ProjectFlowSerializer
+from api.services.flow_persistence import prefetch_flow
+
+
+def flow_cache_key(project_id, version, layout_version):
+    return f'flow:{project_id}:{version}:{layout_version}'
+
+
+def flow_etag(project):
+    """
+    Strong ETag identifying the current version of a project's flow and layout.
+    """
+    return quote_etag(f'{project.id}-{project.flow_version}.{project.layout_version}')
+
+
+def etag_matches(header, etag):
+    """
+    Check an If-Match / If-None-Match header value against an ETag.
+    """
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def get_flow_representation(project):
+    """
+    Return the serialized flow for the project's current version.
+
+    The representation is cached per version, so repeated reads of an
+    unchanged flow never touch the node tables.
+    """
+    key = flow_cache_key(project.id, project.flow_version, project.layout_version)
+    data = cache.get(key)
+    if data is None:
+        data = ProjectFlowSerializer(prefetch_flow(project)).data
+        cache.set(key, data, settings.FLOW_CACHE_TIMEOUT)
+    return data
+
+
+def bump_flow_version(project, flow_hash=''):
+    """
+    Move the project to a new flow version and drop the cached representation.
+
+    `flow_hash` is the hash of the payload that produced the new version, or
+    empty when the stored flow no longer matches any submitted payload.
+    """
+    previous = flow_cache_key(project.id, project.flow_version, project.layout_version)
+    Project.objects.filter(pk=project.pk).update(flow_version=F('flow_version') + 1, flow_hash=flow_hash)
+    project.refresh_from_db(fields=['flow_version', 'flow_hash'])
+    cache.delete(previous)
+    return project.flow_version
+
+
+def bump_layout_version(project, positions):
+    """
+    Move the project to a new layout version after its node positions changed.
+
+    The flow version, and with it the cached execution plan, stays the same.
+    A cached representation is carried over to the new layout version with
+    `positions` (node id -> (x, y)) patched in, so it is not serialized again.
+    """
+    previous = flow_cache_key(project.id, project.flow_version, project.layout_version)
+    # Positions are part of the payload hash, so the last saved payload no longer matches
+    Project.objects.filter(pk=project.pk).update(layout_version=F('layout_version') + 1, flow_hash='')
+    project.refresh_from_db(fields=['layout_version', 'flow_hash'])
+
+    data = cache.get(previous)
+    if data is not None:
+        for node in data['nodes']:
+            if node['id'] in positions:
+                x, y = positions[node['id']]
+                node['position'] = {'x': x, 'y': y}
+        cache.set(flow_cache_key(project.id, project.flow_version, project.layout_version), data, settings.FLOW_CACHE_TIMEOUT)
+        cache.delete(previous)
+    return project.layout_version
@@ -0,0 +1,401 @@
+# services/flow_persistence.py
+import hashlib
+import json
+
+from django.db import transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+
+from api.models import Node, Edge, AINode, CodeNode, Example, TemplateNode
+
+# AI node settings that travel in the node data next to the prompt
+AI_NODE_SETTINGS = ('execution_mode', 'chunk_size', 'chunk_overlap', 'max_parallel_chunks', 'reduce_prompt')
+
+# Maps a node type to its content model and the reverse accessor on Node
+CONTENT_MODELS = {
+    'ai_node': (AINode, 'ai_data'),
+    'code_node': (CodeNode, 'code_data'),
+    'template_node': (TemplateNode, 'template_data'),
+}
+
+
+def parse_node(node_data):
+    """
+    Normalize a node from the editor payload into the fields we persist.
+    """
+    position = node_data.get('position') or {}
+    data = node_data.get('data') or {}
+    ai_settings = {
+        field: data.get(field, AINode._meta.get_field(field).default)
+        for field in AI_NODE_SETTINGS
+    }
+    return {
+        **ai_settings,
+        'node_internal_id': str(node_data['id']),
+        'type': node_data['type'],
+        'label': data.get('label', ''),
+        'position_x': position.get('x', 0),
+        'position_y': position.get('y', 0),
+        'aggregates_transcripts': bool(data.get('aggregate', False)),
+        'prompt': data.get('prompt', ''),
+        'code': data.get('code', ''),
+        'template': data.get('template', ''),
+        'examples': [
+            {
+                'name': example.get('name', ''),
+                'input_text': example.get('input', ''),
+                'output_text': example.get('output', ''),
+            }
+            for example in data.get('examples', [])
+        ],
+    }
+
+
+def parse_edge(edge_data):
+    """
+    Normalize an edge from the editor payload into the fields we persist.
+    """
+    source_id = str(edge_data['source'])
+    target_id = str(edge_data['target'])
+    return {
+        'edge_internal_id': str(edge_data.get('id', f"xy-edge__{source_id}-{target_id}")),
+        'source': source_id,
+        'target': target_id,
+    }
+
+
+def flow_hash(flow_data):
+    """
+    Hash the canonical form of a flow payload.
+
+    Only the fields we persist are hashed, so editor-only state (selection,
+    measured sizes, ...) does not make an otherwise identical flow look changed.
+    """
+    canonical = {
+        'nodes': [parse_node(node_data) for node_data in flow_data.get('nodes', [])],
+        'edges': [parse_edge(edge_data) for edge_data in flow_data.get('edges', [])],
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _content_row(node):
+    """
+    Return the content row (AINode, CodeNode or TemplateNode) of a node, if any.
+    """
+    if node.type not in CONTENT_MODELS:
+        return None
+    _, accessor = CONTENT_MODELS[node.type]
+    try:
+        return getattr(node, accessor)
+    except CONTENT_MODELS[node.type][0].DoesNotExist:
+        return None
+
+
+def bulk_create_nodes(project, parsed_nodes):
+    """
+    Insert nodes together with their content rows and examples.
+
+    Runs a constant number of INSERT statements regardless of the number of
+    nodes; the primary keys returned by `bulk_create` are used to wire up the
+    content rows in memory.
+    """
+    nodes = Node.objects.bulk_create([
+        Node(
+            project=project,
+            node_internal_id=parsed['node_internal_id'],
+            type=parsed['type'],
+            label=parsed['label'],
+            position_x=parsed['position_x'],
+            position_y=parsed['position_y'],
+            aggregates_transcripts=parsed['aggregates_transcripts'],
+        )
+        for parsed in parsed_nodes
+    ])
+    bulk_create_content(list(zip(nodes, parsed_nodes)))
+    return nodes
+
+
+def bulk_create_content(pairs):
+    """
+    Create the content rows (and examples) for a list of (Node, parsed) pairs.
+    """
+    ai_pairs = [
+        (AINode(node=node, prompt=parsed['prompt'], **{field: parsed[field] for field in AI_NODE_SETTINGS}), parsed)
+        for node, parsed in pairs if node.type == 'ai_node'
+    ]
+    ai_nodes = AINode.objects.bulk_create([ai_node for ai_node, _ in ai_pairs])
+    Example.objects.bulk_create([
+        Example(ai_node=ai_node, **example)
+        for ai_node, (_, parsed) in zip(ai_nodes, ai_pairs)
+        for example in parsed['examples']
+    ])
+    CodeNode.objects.bulk_create([
+        CodeNode(node=node, code=parsed['code'])
+        for node, parsed in pairs if node.type == 'code_node'
+    ])
+    TemplateNode.objects.bulk_create([
+        TemplateNode(node=node, template=parsed['template'])
+        for node, parsed in pairs if node.type == 'template_node'
+    ])
+
+
+def _sync_examples(ai_node, incoming):
+    """
+    Update examples in place by position, creating or deleting the surplus.
+    """
+    existing = list(ai_node.examples.all())
+    to_create = []
+
+    for index, example_data in enumerate(incoming):
+        if index >= len(existing):
+            to_create.append(Example(ai_node=ai_node, **example_data))
+            continue
+
+        example = existing[index]
+        changed = [
+            field for field, value in example_data.items()
+            if getattr(example, field) != value
+        ]
+        if changed:
+            for field in changed:
+                setattr(example, field, example_data[field])
+            example.save(update_fields=changed)
+
+    if to_create:
+        Example.objects.bulk_create(to_create)
+
+    surplus = [example.id for example in existing[len(incoming):]]
+    if surplus:
+        Example.objects.filter(id__in=surplus).delete()
+
+
+def _sync_content(node, parsed):
+    """
+    Bring the content row of an existing node in line with the payload.
+    """
+    content = _content_row(node)
+    if content is None:
+        return False
+
+    if node.type == 'ai_node':
+        changed = [
+            field for field in ('prompt',) + AI_NODE_SETTINGS
+            if getattr(content, field) != parsed[field]
+        ]
+        if changed:
+            for field in changed:
+                setattr(content, field, parsed[field])
+            content.save(update_fields=changed + ['updated_at'])
+        _sync_examples(content, parsed['examples'])
+    elif node.type == 'code_node':
+        if content.code != parsed['code']:
+            content.code = parsed['code']
+            content.save(update_fields=['code', 'updated_at'])
+    elif node.type == 'template_node':
+        if content.template != parsed['template']:
+            content.template = parsed['template']
+            content.save(update_fields=['template', 'updated_at'])
+    return True
+
+
+def _raw_delete(queryset):
+    return queryset._raw_delete(queryset.db)
+
+
+def delete_nodes(nodes):
+    """
+    Delete the nodes of a queryset together with their content rows, examples
+    and edges, in a fixed number of statements.
+
+    QuerySet.delete() collects the rows first and deletes them in batches of
+    100, so its statement count grows with the flow; these deletes go child
+    tables first, as the cascades would.
+    """
+    _raw_delete(Example.objects.filter(ai_node__node__in=nodes))
+    for model, _ in CONTENT_MODELS.values():
+        _raw_delete(model.objects.filter(node__in=nodes))
+    _raw_delete(Edge.objects.filter(Q(source__in=nodes) | Q(target__in=nodes)))
+    _raw_delete(nodes)
+
+
+def _delete_content(node):
+    """
+    Drop the content row of a node whose type is changing.
+    """
+    content = _content_row(node)
+    if content is not None:
+        content.delete()
+
+
+def flow_nodes():
+    """
+    Queryset of nodes with their content rows joined in.
+    """
+    return Node.objects.select_related('ai_data', 'code_data', 'template_data')
+
+
+def flow_examples():
+    """
+    Queryset of examples in the order the editor submitted them.
+    """
+    return Example.objects.order_by('id')
+
+
+def stored_nodes(project):
+    """
+    Queryset of a project's nodes with all content rows and examples loaded.
+    """
+    return flow_nodes().filter(project=project).prefetch_related(
+        Prefetch('ai_data__examples', queryset=flow_examples())
+    )
+
+
+def prefetch_flow(project):
+    """
+    Load a project's nodes, content rows, examples and edges in a fixed
+    number of queries so ProjectFlowSerializer never hits the database lazily.
+    """
+    prefetch_related_objects(
+        [project],
+        Prefetch('nodes', queryset=flow_nodes().order_by('created_at', 'id')),
+        Prefetch('nodes__ai_data__examples', queryset=flow_examples()),
+        Prefetch('edges', queryset=Edge.objects.select_related('source', 'target')),
+    )
+    return project
+
+
+def sync_flow(project, flow_data):
+    """
+    Diff the submitted flow against the stored one and write only what changed.
+
+    Nodes are matched on `node_internal_id` and edges on `edge_internal_id`
+    (falling back to the source/target pair), so row ids stay stable between
+    saves and unchanged rows are never touched.
+    """
+    incoming_nodes = [parse_node(node_data) for node_data in flow_data.get('nodes', [])]
+    incoming_edges = [parse_edge(edge_data) for edge_data in flow_data.get('edges', [])]
+
+    with transaction.atomic():
+        existing_nodes = {}
+        stale_node_ids = []
+        for node in stored_nodes(project):
+            # Duplicated internal ids can only come from old data; keep the first one
+            if node.node_internal_id in existing_nodes:
+                stale_node_ids.append(node.id)
+            else:
+                existing_nodes[node.node_internal_id] = node
+
+        incoming_ids = {parsed['node_internal_id'] for parsed in incoming_nodes}
+        stale_node_ids.extend(
+            node.id for internal_id, node in existing_nodes.items()
+            if internal_id not in incoming_ids
+        )
+        if stale_node_ids:
+            delete_nodes(Node.objects.filter(id__in=stale_node_ids))
+
+        nodes_map = {}  # internal id -> Node, used to resolve edges
+        new_nodes = []
+        needs_content = []
+        for parsed in incoming_nodes:
+            node = existing_nodes.get(parsed['node_internal_id'])
+            if node is None:
+                new_nodes.append(parsed)
+                continue
+
+            type_changed = node.type != parsed['type']
+            if type_changed:
+                _delete_content(node)
+
+            changed = [
+                field for field in ('type', 'label', 'position_x', 'position_y', 'aggregates_transcripts')
+                if getattr(node, field) != parsed[field]
+            ]
+            if changed:
+                for field in changed:
+                    setattr(node, field, parsed[field])
+                node.save(update_fields=changed + ['updated_at'])
+
+            if type_changed or not _sync_content(node, parsed):
+                needs_content.append((node, parsed))
+            nodes_map[node.node_internal_id] = node
+
+        bulk_create_content(needs_content)
+        for node in bulk_create_nodes(project, new_nodes):
+            nodes_map[node.node_internal_id] = node
+
+        _sync_edges(project, incoming_edges, nodes_map)
+
+    return project
+
+
+def _sync_edges(project, incoming_edges, nodes_map):
+    """
+    Diff the submitted edges against the stored ones.
+    """
+    existing_edges = list(Edge.objects.filter(project=project))
+    by_internal_id = {edge.edge_internal_id: edge for edge in existing_edges}
+    by_pair = {(edge.source_id, edge.target_id): edge for edge in existing_edges}
+
+    matched = {}  # edge pk -> (Edge, source Node, target Node, internal id)
+    to_create = []
+    for parsed in incoming_edges:
+        source_node = nodes_map.get(parsed['source'])
+        target_node = nodes_map.get(parsed['target'])
+        if not (source_node and target_node):  # Only keep edges whose nodes exist
+            continue
+
+        edge = by_internal_id.get(parsed['edge_internal_id'])
+        if edge is None or edge.id in matched:
+            edge = by_pair.get((source_node.id, target_node.id))
+        if edge is None or edge.id in matched:
+            to_create.append((parsed['edge_internal_id'], source_node, target_node))
+            continue
+        matched[edge.id] = (edge, source_node, target_node, parsed['edge_internal_id'])
+
+    stale_edge_ids = [edge.id for edge in existing_edges if edge.id not in matched]
+    if stale_edge_ids:
+        Edge.objects.filter(id__in=stale_edge_ids).delete()
+
+    for edge, source_node, target_node, internal_id in matched.values():
+        if (edge.source_id, edge.target_id, edge.edge_internal_id) != (source_node.id, target_node.id, internal_id):
+            edge.source = source_node
+            edge.target = target_node
+            edge.edge_internal_id = internal_id
+            edge.save(update_fields=['source', 'target', 'edge_internal_id'])
+
+    Edge.objects.bulk_create([
+        Edge(project=project, edge_internal_id=internal_id, source=source_node, target=target_node)
+        for internal_id, source_node, target_node in to_create
+    ])
+
+
+def replace_flow(project, flow_data):
+    """
+    Delete the stored flow and rewrite it from the payload.
+
+    Used for imports and first saves; the old rows are removed with one
+    DELETE per table and every table is written with a single `bulk_create`,
+    so the statement count does not grow with the flow size.
+    """
+    parsed_nodes = [parse_node(node_data) for node_data in flow_data.get('nodes', [])]
+    parsed_edges = [parse_edge(edge_data) for edge_data in flow_data.get('edges', [])]
+
+    with transaction.atomic():
+        # Clear existing nodes and edges
+        delete_nodes(Node.objects.filter(project=project))
+        _raw_delete(Edge.objects.filter(project=project))
+
+        nodes_map = {node.node_internal_id: node for node in bulk_create_nodes(project, parsed_nodes)}
+        Edge.objects.bulk_create([
+            Edge(
+                project=project,
+                edge_internal_id=parsed['edge_internal_id'],
+                source=nodes_map[parsed['source']],
+                target=nodes_map[parsed['target']],
+            )
+            for parsed in parsed_edges
+            # Only create edge if both nodes exist
+            if parsed['source'] in nodes_map and parsed['target'] in nodes_map
+        ])
+
+    return project
@@ -0,0 +1,159 @@
+# services/job_queue.py
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from api.engine.executor import get_job_project, prepare_job, run_job_async
+from api.engine.loop import run_sync
+from api.engine.plan import FlowValidationError
+from api.models import ClientJob, JobRun
+
+
+def enqueue_run(job):
+    """
+    Queue a run of a job and return it. A run that is still waiting is reused,
+    so repeated requests do not pile up duplicate work.
+    """
+    project = get_job_project(job)
+    with transaction.atomic():
+        # Concurrent requests for the job wait here, then find the run the first one queued
+        ClientJob.objects.select_for_update().only('id').get(pk=job.pk)
+        waiting = JobRun.objects.filter(job=job, status=JobRun.QUEUED).first()
+        if waiting is not None:
+            return waiting
+        return JobRun.objects.create(
+            job=job,
+            project=project,
+            max_attempts=settings.FLOW_JOB_QUEUE['MAX_ATTEMPTS'],
+            available_at=timezone.now(),
+        )
+
+
+def _fair_order(candidates, running):
+    """
+    Order claimable runs so that projects take turns: the next run always comes
+    from the project with the fewest runs in progress, oldest run first.
+    """
+    by_project = OrderedDict()
+    for run in candidates:
+        by_project.setdefault(run.project_id, []).append(run)
+    load = {project_id: running.get(project_id, 0) for project_id in by_project}
+
+    ordered = []
+    while by_project:
+        # Ties go to the project whose oldest run has waited longest (insertion order)
+        project_id = min(by_project, key=lambda project_id: load[project_id])
+        runs = by_project[project_id]
+        ordered.append(runs.pop(0))
+        load[project_id] += 1
+        if not runs:
+            del by_project[project_id]
+    return ordered
+
+
+def claim_runs(worker_id, limit):
+    """
+    Lease up to `limit` runs to a worker: queued runs that are due, and runs
+    whose previous worker let its lease expire. Rows locked by other workers
+    are skipped rather than waited on.
+
+    Candidates are the oldest `limit` claimable runs of each project, so a
+    project with a deep backlog cannot crowd the others out of the scan.
+    """
+    if limit <= 0:
+        return []
+
+    config = settings.FLOW_JOB_QUEUE
+    now = timezone.now()
+    claimable = Q(status=JobRun.QUEUED, available_at__lte=now) | Q(status=JobRun.RUNNING, locked_until__lt=now)
+    oldest_per_project = (
+        JobRun.objects.filter(claimable)
+        .annotate(rank=Window(RowNumber(), partition_by=[F('project_id')], order_by=[F('available_at').asc(), F('id').asc()]))
+        .filter(rank__lte=limit)
+        .order_by('rank', 'available_at', 'id')
+        .values('id')[:config['CLAIM_SCAN']]
+    )
+    with transaction.atomic():
+        # Row locks cannot be combined with window functions; lock in an outer query
+        candidates = list(
+            JobRun.objects.select_for_update(skip_locked=True)
+            .filter(claimable, id__in=[row['id'] for row in oldest_per_project])
+            .order_by('available_at', 'id')
+            .only('id', 'project_id', 'status', 'attempts', 'max_attempts')
+        )
+
+        # An expired lease counts as a failed attempt
+        exhausted = [run.id for run in candidates if run.status == JobRun.RUNNING and run.attempts >= run.max_attempts]
+        if exhausted:
+            JobRun.objects.filter(id__in=exhausted).update(
+                status=JobRun.FAILED, error='The worker running this job stopped responding.',
+                locked_by='', locked_until=None, finished_at=now,
+            )
+        candidates = [run for run in candidates if run.id not in exhausted]
+        if not candidates:
+            return []
+
+        running = dict(
+            JobRun.objects.filter(status=JobRun.RUNNING, locked_until__gte=now, project_id__in={run.project_id for run in candidates})
+            .values_list('project_id').annotate(count=Count('id'))
+        )
+        claimed = [run.id for run in _fair_order(candidates, running)[:limit]]
+        JobRun.objects.filter(id__in=claimed).update(
+            status=JobRun.RUNNING,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=config['VISIBILITY_TIMEOUT']),
+            attempts=F('attempts') + 1,
+            started_at=now,
+        )
+
+    runs = JobRun.objects.select_related('job').in_bulk(claimed)
+    return [runs[run_id] for run_id in claimed]
+
+
+def extend_leases(worker_id, run_ids):
+    """
+    Renew the leases of runs a worker is still executing.
+    """
+    locked_until = timezone.now() + timedelta(seconds=settings.FLOW_JOB_QUEUE['VISIBILITY_TIMEOUT'])
+    return JobRun.objects.filter(id__in=run_ids, status=JobRun.RUNNING, locked_by=worker_id).update(locked_until=locked_until)
+
+
+def complete_run(run, worker_id):
+    JobRun.objects.filter(id=run.id, status=JobRun.RUNNING, locked_by=worker_id).update(
+        status=JobRun.SUCCEEDED, error='', locked_by='', locked_until=None, finished_at=timezone.now(),
+    )
+
+
+def fail_run(run, worker_id, error, retry=True):
+    """
+    Record a failed attempt; the run is queued again with exponential backoff
+    until it runs out of attempts.
+    """
+    now = timezone.now()
+    fields = {'error': error, 'locked_by': '', 'locked_until': None}
+    if retry and run.attempts < run.max_attempts:
+        delay = settings.FLOW_JOB_QUEUE['RETRY_DELAY'] * 2 ** (run.attempts - 1)
+        fields.update(status=JobRun.QUEUED, available_at=now + timedelta(seconds=delay))
+    else:
+        fields.update(status=JobRun.FAILED, finished_at=now)
+    JobRun.objects.filter(id=run.id, status=JobRun.RUNNING, locked_by=worker_id).update(**fields)
+
+
+def execute_run(run, worker_id):
+    """
+    Execute a claimed run and record its outcome. Invalid flows are not retried.
+    """
+    try:
+        plan, transcripts = prepare_job(run.job)
+        run_sync(run_job_async(run.job, plan, transcripts))
+    except FlowValidationError as e:
+        fail_run(run, worker_id, str(e), retry=False)
+    except Exception as e:
+        fail_run(run, worker_id, str(e))
+    else:
+        complete_run(run, worker_id)
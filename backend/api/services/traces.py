@@ -0,0 +1,109 @@
+# services/traces.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.utils import timezone
+
+from api.engine.plan import FlowValidationError, get_plan
+from api.models import NodeTrace
+
+
+def prune_traces():
+    """
+    Delete traces older than FLOW_TRACES['TTL_DAYS']. Returns the number deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.FLOW_TRACES['TTL_DAYS'])
+    deleted, _ = NodeTrace.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def node_stats(project, trace_ids):
+    """
+    Per-node statistics over the given runs, slowest first.
+    """
+    rows = (
+        NodeTrace.objects.filter(project=project, trace_id__in=trace_ids)
+        .values('node_id', 'node_type')
+        .annotate(
+            executions=Count('id'),
+            avg_ms=Avg('duration_ms'),
+            max_ms=Max('duration_ms'),
+            total_ms=Sum('duration_ms'),
+            cache_hits=Count('id', filter=Q(cached=True)),
+            errors=Count('id', filter=~Q(error='')),
+            avg_input_bytes=Avg('input_bytes'),
+            avg_output_bytes=Avg('output_bytes'),
+        )
+        .order_by('-avg_ms')
+    )
+    return [
+        {**row, 'avg_ms': round(row['avg_ms']), 'avg_input_bytes': round(row['avg_input_bytes']),
+         'avg_output_bytes': round(row['avg_output_bytes'])}
+        for row in rows
+    ]
+
+
+def critical_path(plan, run_ms):
+    """
+    Longest path from the input to the output node, weighting every step by
+    its average time per run (`run_ms`, node id -> ms).
+    """
+    best = {}  # node id -> (path ms, previous node id)
+    for step in plan.steps:
+        before = max(((best[source_id][0], source_id) for source_id in step.inputs), default=(0, None))
+        best[step.node_id] = (before[0] + run_ms.get(step.node_id, 0), before[1])
+
+    path = []
+    node_id = plan.output_id
+    while node_id is not None:
+        path.append(node_id)
+        node_id = best[node_id][1]
+    path.reverse()
+    return {
+        'total_ms': round(best[plan.output_id][0]),
+        'nodes': [
+            {'id': node_id, 'label': plan.steps_by_id[node_id].label, 'ms': round(run_ms.get(node_id, 0))}
+            for node_id in path
+        ],
+    }
+
+
+def trace_summary(project, runs=50, slowest=10):
+    """
+    Slowest nodes and the critical path of the current flow, over the
+    project's last `runs` traced runs.
+    """
+    recent = (
+        NodeTrace.objects.filter(project=project)
+        .values('trace_id').annotate(started=Max('created_at')).order_by('-started')[:runs]
+    )
+    trace_ids = [row['trace_id'] for row in recent]
+    stats = node_stats(project, trace_ids)
+
+    try:
+        plan = get_plan(project)
+    except FlowValidationError:
+        plan = None
+
+    labels = {step.node_id: step.label for step in plan.steps} if plan else {}
+    for row in stats:
+        row['label'] = labels.get(row['node_id'])
+
+    path = None
+    if plan and trace_ids:
+        # Per-transcript nodes run in parallel; a run waits for the slowest copy
+        per_run = (
+            NodeTrace.objects.filter(project=project, trace_id__in=trace_ids)
+            .values('trace_id', 'node_id').annotate(ms=Max('duration_ms'))
+        )
+        totals = {}
+        for row in per_run:
+            totals.setdefault(row['node_id'], []).append(row['ms'])
+        path = critical_path(plan, {node_id: sum(values) / len(values) for node_id, values in totals.items()})
+
+    return {
+        'runs': len(trace_ids),
+        'slowest_nodes': stats[:slowest],
+        'critical_path': path,
+    }
@@ -0,0 +1,246 @@
+# services/transcript_patches.py
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.models import Transcript, TranscriptEdit
+
+# Most operations accepted in a single patch
+MAX_OPERATIONS = 1000
+# Transcripts compacted per query by compact_transcripts
+COMPACT_BATCH_SIZE = 100
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+# Lines with their '\n'; unlike str.splitlines, other line separators are kept as text
+LINE = re.compile(r'[^\n]*\n|[^\n]+')
+
+
+class PatchError(Exception):
+    """
+    Raised when a patch is malformed or does not apply to the transcript.
+    """
+
+
+class VersionConflict(Exception):
+    """
+    Raised when the transcript changed since the version a patch was made against.
+    """
+    def __init__(self, version):
+        super().__init__(f"The transcript is at version {version}.")
+        self.version = version
+
+
+def _integer(operation, name, index):
+    value = operation.get(name)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise PatchError(f"Operation {index}: '{name}' must be a non-negative integer.")
+    return value
+
+
+def apply_operations(content, operations):
+    """
+    Apply text operations in order, each against the result of the previous:
+    {'op': 'insert', 'offset': n, 'text': '...'} or
+    {'op': 'delete', 'offset': n, 'length': n}. Offsets count characters.
+    """
+    if len(operations) > MAX_OPERATIONS:
+        raise PatchError(f"A patch may contain at most {MAX_OPERATIONS} operations.")
+
+    for index, operation in enumerate(operations):
+        kind = operation.get('op')
+        offset = _integer(operation, 'offset', index)
+        if offset > len(content):
+            raise PatchError(f"Operation {index}: offset {offset} is past the end of the transcript ({len(content)}).")
+        if kind == 'insert':
+            text = operation.get('text')
+            if not isinstance(text, str):
+                raise PatchError(f"Operation {index}: 'text' must be a string.")
+            content = content[:offset] + text + content[offset:]
+        elif kind == 'delete':
+            length = _integer(operation, 'length', index)
+            if offset + length > len(content):
+                raise PatchError(f"Operation {index}: deletes past the end of the transcript.")
+            content = content[:offset] + content[offset + length:]
+        else:
+            raise PatchError(f"Operation {index}: 'op' must be 'insert' or 'delete'.")
+    return content
+
+
+def parse_unified_diff(diff):
+    """
+    Parse the hunks of a unified diff into (old start, old lines, new lines).
+    File headers and other lines outside hunks are ignored.
+    """
+    hunks = []
+    old_left = new_left = 0
+    old_lines = new_lines = last = None
+    for line in LINE.findall(diff):
+        if old_left or new_left:
+            tag, text = line[:1], line[1:]
+            if tag == '\\':
+                # "\ No newline at end of file" applies to the previous line
+                last[-1] = last[-1].rstrip('\r\n')
+                continue
+            if tag in (' ', '\n'):
+                text = text if tag == ' ' else '\n'
+                old_lines.append(text)
+                new_lines.append(text)
+                old_left -= 1
+                new_left -= 1
+                last = new_lines
+            elif tag == '-':
+                old_lines.append(text)
+                old_left -= 1
+                last = old_lines
+            elif tag == '+':
+                new_lines.append(text)
+                new_left -= 1
+                last = new_lines
+            else:
+                raise PatchError(f"Unexpected line in hunk: {line[:40]!r}.")
+            if old_left < 0 or new_left < 0:
+                raise PatchError("A hunk has more lines than its header states.")
+            continue
+
+        if line.startswith('\\') and last is not None:
+            last[-1] = last[-1].rstrip('\r\n')
+            continue
+
+        match = HUNK_HEADER.match(line)
+        if match:
+            old_start = int(match.group(1))
+            old_left = int(match.group(2)) if match.group(2) is not None else 1
+            new_left = int(match.group(4)) if match.group(4) is not None else 1
+            old_lines, new_lines, last = [], [], None
+            hunks.append((old_start, old_lines, new_lines))
+
+    if old_left or new_left:
+        raise PatchError("The diff ends in the middle of a hunk.")
+    if not hunks:
+        raise PatchError("The diff contains no hunks.")
+    return hunks
+
+
+def apply_unified_diff(content, diff):
+    """
+    Apply a unified diff to `content`. Hunks must match exactly; there is no fuzz.
+    """
+    source = LINE.findall(content)
+    result = []
+    position = 0
+    for old_start, old_lines, new_lines in parse_unified_diff(diff):
+        # A hunk that only adds lines names the line it follows
+        start = old_start - 1 if old_lines else old_start
+        if start < position:
+            raise PatchError(f"Hunk at line {old_start} overlaps the previous one.")
+        if source[start:start + len(old_lines)] != old_lines:
+            raise PatchError(f"Hunk at line {old_start} does not match the transcript.")
+        result.extend(source[position:start])
+        result.extend(new_lines)
+        position = start + len(old_lines)
+    result.extend(source[position:])
+    return ''.join(result)
+
+
+def replay(content, edits):
+    for edit in edits:
+        if edit.operations is not None:
+            content = apply_operations(content, edit.operations)
+        else:
+            content = apply_unified_diff(content, edit.diff)
+    return content
+
+
+def current_contents(transcripts):
+    """
+    The text of each transcript: its stored content with the edits made since
+    replayed. The edits of all the transcripts are loaded in one query, and
+    none are when no transcript has pending edits.
+    """
+    transcripts = list(transcripts)
+    while True:
+        pending = {transcript.id: transcript for transcript in transcripts if transcript.version > transcript.content_version}
+        if not pending:
+            return [transcript.content for transcript in transcripts]
+
+        query = Q()
+        for transcript in pending.values():
+            query |= Q(transcript_id=transcript.id, version__gt=transcript.content_version, version__lte=transcript.version)
+        edits = defaultdict(list)
+        for edit in TranscriptEdit.objects.filter(query).order_by('version'):
+            edits[edit.transcript_id].append(edit)
+
+        stale = [
+            transcript.id for transcript in pending.values()
+            if len(edits[transcript.id]) != transcript.version - transcript.content_version
+        ]
+        if not stale:
+            return [
+                replay(transcript.content, edits[transcript.id]) if transcript.id in pending else transcript.content
+                for transcript in transcripts
+            ]
+        # The missing edits were folded into the content after it was read; read it again
+        fresh = Transcript.objects.in_bulk(stale)
+        for transcript in pending.values():
+            if transcript.id in stale and transcript.id not in fresh:
+                # Deleted meanwhile; its stored content is all there is
+                fresh[transcript.id] = Transcript(id=transcript.id, content=transcript.content)
+        transcripts = [fresh.get(transcript.id, transcript) for transcript in transcripts]
+
+
+def patch_transcript(transcript, version, operations=None, diff=None):
+    """
+    Apply operations or a unified diff made against `version` of a transcript
+    and store the patch as the next version, which is returned.
+
+    The patch is appended as a TranscriptEdit rather than rewriting the
+    content, so an edit writes only its own size; every
+    TRANSCRIPT_EDITS['COMPACT_EVERY'] edits the content is brought up to date.
+    Concurrency is optimistic: nothing is locked while the patch is applied,
+    and it is only stored if no other edit landed in the meantime.
+    Raises VersionConflict and PatchError.
+    """
+    if transcript.version != version:
+        raise VersionConflict(transcript.version)
+
+    current = current_contents([transcript])[0]
+    if diff is not None:
+        content = apply_unified_diff(current, diff)
+    else:
+        content = apply_operations(current, operations)
+    if content == current:
+        return transcript.version
+
+    with transaction.atomic():
+        updated = Transcript.objects.filter(id=transcript.id, version=version).update(
+            version=version + 1, updated_at=timezone.now(),
+        )
+        if not updated:
+            raise VersionConflict(Transcript.objects.filter(id=transcript.id).values_list('version', flat=True).first())
+        TranscriptEdit.objects.create(transcript_id=transcript.id, version=version + 1, operations=operations, diff=diff or '')
+
+    if version + 1 - transcript.content_version >= settings.TRANSCRIPT_EDITS['COMPACT_EVERY']:
+        Transcript.objects.filter(id=transcript.id, version=version + 1).update(content=content, content_version=version + 1)
+    return version + 1
+
+
+def compact_transcripts():
+    """
+    Fold the pending edits of all transcripts into their content and delete
+    the edits folded in. Returns the number of transcripts compacted.
+    """
+    compacted = 0
+    ids = list(Transcript.objects.filter(version__gt=F('content_version')).values_list('id', flat=True))
+    for start in range(0, len(ids), COMPACT_BATCH_SIZE):
+        transcripts = list(Transcript.objects.filter(id__in=ids[start:start + COMPACT_BATCH_SIZE]))
+        for transcript, content in zip(transcripts, current_contents(transcripts)):
+            # Skipped if edited meanwhile; the next pass picks it up
+            compacted += Transcript.objects.filter(id=transcript.id, version=transcript.version).update(
+                content=content, content_version=transcript.version,
+            )
+    TranscriptEdit.objects.filter(version__lte=F('transcript__content_version')).delete()
+    return compacted
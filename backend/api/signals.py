@@ -30,4 +30,4 @@ def create_default_nodes(sender, instance, created, **kwargs):
             label='Output',
             position_x=800,
             position_y=100,
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,1200 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from datetime import timedelta
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.engine import sandbox_worker
+from api.engine.events import ExecutionEvents
+from api.engine.executor import ConcurrencyLimits, execute_plan_async, save_node_state
+from api.engine.llm import LLMClient
+from api.engine.mapreduce import PARTIAL_SEPARATOR, run_map_reduce
+from api.engine.memo import NodeOutputMemo, prune_node_outputs
+from api.engine.providers import OpenAIChatProvider, ProviderError, RetryableProviderError
+from api.engine.plan import ExecutionPlan, FlowValidationError, PlanStep, get_plan, plan_cache_key
+from api.engine.sandbox import CodeWorkerPool
+from api.engine.streaming import OutputAssembler
+from api.engine.tracing import TracingEvents, start_trace
+from api.engine.templates import TemplateCache
+from api.engine.prompts import MESSAGE_OVERHEAD_TOKENS, PromptBudgetError, budget_requests, get_prepared_prompt, get_tokenizer
+from api.management.commands.benchmark_flow_save import FLOW_LOAD_QUERY_BUDGET, build_flow
+from api.management.commands.run_mock_llm import MockLLMHandler
+from api.models import AINode, BatchRun, ClientJob, Edge, Example, JobNodeOutput, JobRun, Node, NodeOutputCache, NodeTrace, Project, ProjectClient, Transcript, TranscriptEdit, User
+from api.serializers import ClientJobDetailedSerializer, ProjectFlowSerializer
+from api.services.flow_persistence import prefetch_flow, replace_flow, sync_flow
+from api.services.flow_cache import bump_flow_version
+from api.services.batch_runs import BatchLeaseLost, claim_batch, create_batch, run_batch
+from api.services.job_queue import claim_runs, enqueue_run
+from api.services.traces import prune_traces, trace_summary
+from api.services.transcript_patches import VersionConflict, compact_transcripts, current_contents, patch_transcript
+from api.transcription import backends
+from api.transcription.backends import FakeTranscriber, TranscriptionError, get_transcriber
+from api.transcription.batching import BatchScheduler, DirectScheduler
+from api.transcription.segments import transcribe_file
+
+# Queries for a save that changes nothing, and for one that edits a single prompt
+SYNC_NOOP_QUERIES = 5
+SYNC_ONE_EDIT_QUERIES = 6
+# Queries to replace a stored flow with a small one, whatever the stored flow's size
+REPLACE_QUERIES = 15
+
+
+class FlowQueryBudgetTests(TestCase):
+    """
+    Loading and saving a flow must take the same number of queries whatever
+    its size.
+    """
+    SIZES = [5, 60]
+
+    def setUp(self):
+        self.creator = User.objects.create_user(email='creator@example.com', role='creator')
+
+    def create_project(self, size):
+        project = Project.objects.create(name='Flow', url_name=f'flow-{size}', creator=self.creator)
+        replace_flow(project, build_flow(size))
+        return project
+
+    def test_load(self):
+        for size in self.SIZES:
+            with self.subTest(size=size):
+                project = Project.objects.get(pk=self.create_project(size).pk)
+                with self.assertNumQueries(FLOW_LOAD_QUERY_BUDGET):
+                    data = ProjectFlowSerializer(prefetch_flow(project)).data
+                self.assertEqual(len(data['nodes']), size + 2)
+
+    def test_identical_save(self):
+        for size in self.SIZES:
+            with self.subTest(size=size):
+                project = self.create_project(size)
+                with self.assertNumQueries(SYNC_NOOP_QUERIES):
+                    sync_flow(project, build_flow(size))
+
+    def test_one_edit_save(self):
+        for size in self.SIZES:
+            with self.subTest(size=size):
+                project = self.create_project(size)
+                edited = build_flow(size)
+                edited['nodes'][2]['data']['prompt'] = 'Edited prompt'
+                with self.assertNumQueries(SYNC_ONE_EDIT_QUERIES):
+                    sync_flow(project, edited)
+                self.assertEqual(project.nodes.get(node_internal_id='node_0').ai_data.prompt, 'Edited prompt')
+
+    def test_replace(self):
+        # Past 100 nodes, cascading deletes would run in batches
+        for size in self.SIZES + [150]:
+            with self.subTest(size=size):
+                project = self.create_project(size)
+                with self.assertNumQueries(REPLACE_QUERIES):
+                    replace_flow(project, build_flow(5))
+                self.assertEqual(project.nodes.count(), 7)
+                self.assertEqual(project.edges.count(), 10)
+
+
+class FlowSyncTests(TestCase):
+    def setUp(self):
+        self.creator = User.objects.create_user(email='creator@example.com', role='creator')
+        self.project = Project.objects.create(name='Flow', url_name='flow', creator=self.creator)
+        replace_flow(self.project, build_flow(4))
+
+    def rows(self):
+        nodes = {node.node_internal_id: (node.id, node.updated_at) for node in self.project.nodes.all()}
+        edges = {edge.edge_internal_id: edge.id for edge in self.project.edges.all()}
+        return nodes, edges
+
+    def test_unchanged_rows_keep_their_ids(self):
+        nodes, edges = self.rows()
+        examples = set(Example.objects.filter(ai_node__node__project=self.project).values_list('id', flat=True))
+
+        flow = build_flow(4)
+        flow['nodes'][3]['data']['code'] = 'def process_data(input_data):\n    return input_data[:1]'
+        # node_3 is removed, node_4 added and node_2 is fed from node_0 instead of the input
+        flow['nodes'] = [node for node in flow['nodes'] if node['id'] != 'node_3']
+        flow['nodes'].append({'id': 'node_4', 'type': 'code_node', 'position': {'x': 1, 'y': 1},
+                              'data': {'label': 'Node 4', 'code': 'def process_data(input_data):\n    return 1'}})
+        flow['edges'] = [edge for edge in flow['edges'] if 'node_3' not in (edge['source'], edge['target'])]
+        flow['edges'].append({'id': 'out_4', 'source': 'node_4', 'target': 'output'})
+        next(edge for edge in flow['edges'] if edge['id'] == 'in_2')['source'] = 'node_0'
+        sync_flow(self.project, flow)
+
+        saved_nodes, saved_edges = self.rows()
+        self.assertEqual(set(saved_nodes), {'input', 'output', 'node_0', 'node_1', 'node_2', 'node_4'})
+        for internal_id in ('input', 'output', 'node_0', 'node_1', 'node_2'):
+            self.assertEqual(saved_nodes[internal_id][0], nodes[internal_id][0])
+        # Only content changed, so the node rows themselves were not written
+        for internal_id in ('input', 'output', 'node_0', 'node_2'):
+            self.assertEqual(saved_nodes[internal_id][1], nodes[internal_id][1])
+        self.assertEqual(Node.objects.get(id=nodes['node_1'][0]).code_data.code, 'def process_data(input_data):\n    return input_data[:1]')
+
+        self.assertNotIn('in_3', saved_edges)
+        for internal_id in ('in_0', 'in_1', 'in_2', 'out_0', 'out_1', 'out_2'):
+            self.assertEqual(saved_edges[internal_id], edges[internal_id])
+        self.assertEqual(Edge.objects.get(edge_internal_id='in_2', project=self.project).source_id, nodes['node_0'][0])
+        # node_3's example went with it; node_0's was kept as is
+        saved_examples = set(Example.objects.filter(ai_node__node__project=self.project).values_list('id', flat=True))
+        self.assertEqual(len(saved_examples), 1)
+        self.assertLess(saved_examples, examples)
+
+    def test_type_change_replaces_the_content(self):
+        nodes, _ = self.rows()
+        flow = build_flow(4)
+        flow['nodes'][2]['type'] = 'template_node'
+        sync_flow(self.project, flow)
+
+        node = Node.objects.get(id=nodes['node_0'][0])
+        self.assertEqual(node.template_data.template, '# Report\n\n{{Transcripts}}')
+        self.assertFalse(AINode.objects.filter(node=node).exists())
+
+
+class FlowVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.creator = User.objects.create_user(email='creator@example.com', role='creator')
+        self.project = Project.objects.create(name='Flow', url_name='flow', creator=self.creator)
+        self.api = APIClient()
+        self.api.force_authenticate(self.creator)
+        self.url = reverse('project-flow', kwargs={'project_id': self.project.id})
+        self.etag = self.api.post(self.url, build_flow(3), format='json')['ETag']
+
+    def test_conditional_get(self):
+        response = self.api.get(self.url)
+        self.assertEqual((response.status_code, response['ETag']), (200, self.etag))
+        # Only the project is read to answer a revalidation
+        with self.assertNumQueries(1):
+            response = self.api.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, self.etag))
+
+        edited = build_flow(3)
+        edited['nodes'][2]['data']['prompt'] = 'Edited prompt'
+        etag = self.api.post(self.url, edited, format='json')['ETag']
+        self.assertNotEqual(etag, self.etag)
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual((response.status_code, response['ETag']), (200, etag))
+
+    def test_if_match(self):
+        edited = build_flow(3)
+        edited['nodes'][2]['data']['prompt'] = 'Edited prompt'
+        response = self.api.post(self.url, edited, format='json', HTTP_IF_MATCH=self.etag)
+        self.assertEqual(response.status_code, 200)
+
+        # A save based on the version before is refused and leaves the flow alone
+        stale = build_flow(3)
+        stale['nodes'][2]['data']['prompt'] = 'Stale prompt'
+        response = self.api.post(self.url, stale, format='json', HTTP_IF_MATCH=self.etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response['ETag'], self.api.get(self.url)['ETag'])
+        self.assertEqual(self.project.nodes.get(node_internal_id='node_0').ai_data.prompt, 'Edited prompt')
+
+        response = self.api.post(self.url, stale, format='json', HTTP_IF_MATCH='*')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).flow_version, 3)
+
+    def test_identical_save_is_skipped(self):
+        # Matched on the payload hash: the project is read, the node tables are not touched
+        with self.assertNumQueries(1):
+            response = self.api.post(self.url, build_flow(3), format='json')
+        self.assertEqual((response.status_code, response['ETag']), (200, self.etag))
+        self.assertEqual(len(response.json()['nodes']), 5)
+
+        # Positions are part of the payload, so after a layout change the same payload is saved again
+        self.api.post(reverse('project-flow-layout', kwargs={'project_id': self.project.id}),
+                      {'positions': [{'id': 'node_0', 'x': 1, 'y': 1}]}, format='json')
+        response = self.api.post(self.url, build_flow(3), format='json')
+        self.assertEqual(Project.objects.get(pk=self.project.pk).flow_version, 2)
+        self.assertEqual(self.project.nodes.get(node_internal_id='node_0').position_x, 400)
+
+
+class FlowLayoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.creator = User.objects.create_user(email='creator@example.com', role='creator')
+        self.project = Project.objects.create(name='Flow', url_name='flow', creator=self.creator)
+        replace_flow(self.project, build_flow(3))
+        self.api = APIClient()
+        self.api.force_authenticate(self.creator)
+        self.flow_url = reverse('project-flow', kwargs={'project_id': self.project.id})
+        self.layout_url = reverse('project-flow-layout', kwargs={'project_id': self.project.id})
+
+    def test_layout_keeps_the_plan_and_patches_the_cached_flow(self):
+        etag = self.api.get(self.flow_url)['ETag']
+        plan = get_plan(self.project)
+
+        response = self.api.post(self.layout_url, {'positions': [{'id': 'node_0', 'x': 5, 'y': 6}]}, format='json')
+        self.assertEqual(response.json(), {'updated': 1})
+        self.assertNotEqual(response['ETag'], etag)
+
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertEqual((project.flow_version, project.layout_version), (plan.version, 1))
+        self.assertIsNotNone(cache.get(plan_cache_key(project.id, project.flow_version)))
+        # Served from the patched cache entry: only the project is read
+        with self.assertNumQueries(1):
+            data = self.api.get(self.flow_url).json()
+        node = next(node for node in data['nodes'] if node['id'] == 'node_0')
+        self.assertEqual(node['position'], {'x': 5.0, 'y': 6.0})
+
+    def test_stale_if_match(self):
+        etag = self.api.get(self.flow_url)['ETag']
+        self.api.post(self.layout_url, {'positions': [{'id': 'node_0', 'x': 1, 'y': 1}]}, format='json')
+        response = self.api.post(
+            self.layout_url, {'positions': [{'id': 'node_0', 'x': 2, 'y': 2}]}, format='json', HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 412)
+
+    def test_malformed_payload(self):
+        for payload in ([{'id': 'node_0', 'x': 1, 'y': 1}], {}, {'positions': {'id': 'node_0'}},
+                        {'positions': ['node_0']}, {'positions': [{'id': 'node_0', 'x': 'left', 'y': 1}]}):
+            with self.subTest(payload=payload):
+                self.assertEqual(self.api.post(self.layout_url, payload, format='json').status_code, 400)
+
+
+def flow_payload(nodes, edges):
+    """
+    A flow payload from (id, type) nodes and (source, target) edges.
+    """
+    return {
+        'nodes': [
+            {'id': node_id, 'type': node_type, 'position': {'x': 0, 'y': 0},
+             'data': {'label': node_id, 'code': 'def process_data(input_data):\n    return input_data'}}
+            for node_id, node_type in nodes
+        ],
+        'edges': [{'id': f'{source}-{target}', 'source': source, 'target': target} for source, target in edges],
+    }
+
+
+class PlanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        creator = User.objects.create_user(email='creator@example.com', role='creator')
+        self.project = Project.objects.create(name='Flow', url_name='flow', creator=creator)
+
+    def save(self, nodes, edges):
+        replace_flow(self.project, flow_payload(nodes, edges))
+        bump_flow_version(self.project)
+
+    def test_plan_is_cached_per_flow_version(self):
+        self.save([('input', 'input_node'), ('a', 'code_node'), ('output', 'output_node')],
+                  [('input', 'a'), ('a', 'output')])
+        plan = get_plan(self.project)
+        with self.assertNumQueries(0):
+            self.assertEqual([step.node_id for step in get_plan(self.project).steps], ['input', 'a', 'output'])
+
+        self.save([('input', 'input_node'), ('b', 'code_node'), ('output', 'output_node')],
+                  [('input', 'b'), ('b', 'output')])
+        self.assertEqual(get_plan(self.project).version, plan.version + 1)
+        self.assertEqual([step.node_id for step in get_plan(self.project).steps], ['input', 'b', 'output'])
+
+    def test_steps_are_ordered_and_unused_nodes_dropped(self):
+        self.save(
+            [('output', 'output_node'), ('b', 'code_node'), ('a', 'code_node'), ('unused', 'code_node'), ('input', 'input_node')],
+            [('a', 'b'), ('input', 'a'), ('b', 'output'), ('input', 'unused'), ('a', 'output')],
+        )
+        plan = get_plan(self.project)
+        self.assertEqual([step.node_id for step in plan.steps], ['input', 'a', 'b', 'output'])
+        self.assertEqual(plan.steps_by_id['output'].inputs, ['b', 'a'])
+        # Identical content hashes the same whatever the node
+        self.assertEqual(plan.steps_by_id['a'].content_hash, plan.steps_by_id['b'].content_hash)
+
+    def test_invalid_flows(self):
+        invalid = {
+            'exactly one output': ([('input', 'input_node'), ('a', 'code_node')], [('input', 'a')]),
+            'cycle through: a, b': (
+                [('input', 'input_node'), ('a', 'code_node'), ('b', 'code_node'), ('output', 'output_node')],
+                [('input', 'output'), ('a', 'b'), ('b', 'a'), ('b', 'output')],
+            ),
+            "'a' is not connected": ([('input', 'input_node'), ('a', 'code_node'), ('output', 'output_node')], [('a', 'output')]),
+            'leaves the output': (
+                [('input', 'input_node'), ('a', 'code_node'), ('output', 'output_node')],
+                [('input', 'output'), ('output', 'a')],
+            ),
+        }
+        for message, (nodes, edges) in invalid.items():
+            with self.subTest(message):
+                self.save(nodes, edges)
+                with self.assertRaisesRegex(FlowValidationError, message):
+                    get_plan(self.project)
+
+
+class ConcurrencyTests(SimpleTestCase):
+    def test_limits(self):
+        active = {'all': 0, 1: 0, 2: 0}
+        peaks = {'all': 0, 1: 0, 2: 0}
+
+        async def work(project_id):
+            for key in ('all', project_id):
+                active[key] += 1
+                peaks[key] = max(peaks[key], active[key])
+            await asyncio.sleep(0.02)
+            for key in ('all', project_id):
+                active[key] -= 1
+            return project_id
+
+        async def main():
+            limits = ConcurrencyLimits(global_limit=3, project_limit=2)
+            results = await asyncio.gather(*(limits.run(project_id, work, project_id) for project_id in [1, 2] * 4))
+            # Plain functions run in the loop's thread pool under the same limits
+            results.append(await limits.run(1, threading.current_thread))
+            return results
+
+        results = asyncio.run(main())
+        self.assertEqual(results[:8], [1, 2] * 4)
+        self.assertIsNot(results[8], threading.current_thread())
+        self.assertEqual(peaks, {'all': 3, 1: 2, 2: 2})
+
+    def test_independent_branches_run_concurrently(self):
+        def step(node_id, node_type, inputs):
+            return PlanStep(pk=node_id, node_id=node_id, type=node_type, label=node_id, inputs=inputs, config={'code': node_id})
+
+        plan = ExecutionPlan(1, 1, [
+            step('input', 'input_node', []),
+            step('a', 'code_node', ['input']),
+            step('b', 'code_node', ['input']),
+            step('output', 'output_node', ['a', 'b']),
+        ])
+
+        def run_code_node(step, inputs, context):
+            time.sleep(0.3)
+            return f'{step.node_id}({inputs[0][1]})'
+
+        async def main():
+            with mock.patch('api.engine.executor.get_limits', return_value=ConcurrencyLimits(4, 4)):
+                return await execute_plan_async(plan, ['text'])
+
+        with mock.patch.dict('api.engine.executor.RUNNERS', {'code_node': run_code_node}), \
+                mock.patch('api.engine.executor.get_memo', return_value=NodeOutputMemo(100, 1024 * 1024)):
+            started = time.perf_counter()
+            outputs = asyncio.run(main())
+            elapsed = time.perf_counter() - started
+        self.assertEqual(outputs['output'], 'a(text)\n\nb(text)')
+        # Sequential branches would take 0.6 s
+        self.assertLess(elapsed, 0.5)
+
+
+class TranscriptFanOutTests(SimpleTestCase):
+    def setUp(self):
+        def step(node_id, node_type, inputs, aggregates=False):
+            return PlanStep(pk=node_id, node_id=node_id, type=node_type, label=node_id, inputs=inputs,
+                            config={'code': node_id}, aggregates=aggregates)
+
+        # summary runs once per transcript, merge once over all summaries
+        self.plan = ExecutionPlan(1, 1, [
+            step('input', 'input_node', []),
+            step('summary', 'code_node', ['input']),
+            step('merge', 'code_node', ['summary'], aggregates=True),
+            step('output', 'output_node', ['merge']),
+        ])
+        self.calls = []
+
+    def execute(self, transcripts, node_state):
+        def run_code_node(step, inputs, context):
+            self.calls.append((step.node_id, inputs[0][1]))
+            return f'{step.node_id}({inputs[0][1]})'
+
+        async def main():
+            with mock.patch('api.engine.executor.get_limits', return_value=ConcurrencyLimits(8, 8)):
+                return await execute_plan_async(self.plan, transcripts, node_state=node_state)
+
+        with mock.patch.dict('api.engine.executor.RUNNERS', {'code_node': run_code_node}), \
+                mock.patch('api.engine.executor.get_memo', return_value=NodeOutputMemo(100, 1024 * 1024)):
+            return asyncio.run(main())
+
+    def test_transcripts_run_separately_and_are_merged(self):
+        self.assertEqual(self.plan.per_transcript, {'input', 'summary'})
+        node_state = {}
+        outputs = self.execute(['one', 'two', 'three'], node_state)
+        self.assertEqual(outputs['output'], 'merge(summary(one)\n\n---\n\nsummary(two)\n\n---\n\nsummary(three))')
+        self.assertEqual(sorted(self.calls[:3]), [('summary', 'one'), ('summary', 'three'), ('summary', 'two')])
+        self.assertEqual(sorted(node_state), ['merge', 'summary@0', 'summary@1', 'summary@2'])
+
+        # Only the changed transcript is summarized again; a dropped one leaves the state
+        self.calls = []
+        self.execute(['one', 'TWO'], node_state)
+        self.assertEqual(self.calls, [('summary', 'TWO'), ('merge', 'summary(one)\n\n---\n\nsummary(TWO)')])
+        self.assertEqual(sorted(node_state), ['merge', 'summary@0', 'summary@1'])
+
+
+class TraceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        creator = User.objects.create_user(email='creator@example.com', role='creator')
+        self.project = Project.objects.create(name='Flow', url_name='flow', creator=creator)
+        replace_flow(self.project, flow_payload(
+            [('input', 'input_node'), ('fast', 'code_node'), ('slow', 'code_node'), ('output', 'output_node')],
+            [('input', 'fast'), ('input', 'slow'), ('fast', 'output'), ('slow', 'output')],
+        ))
+        bump_flow_version(self.project)
+
+    def test_sampling(self):
+        events = ExecutionEvents()
+        for enabled, rate, traced in ((True, 1.0, True), (True, 0.0, False), (False, 1.0, False)):
+            with self.subTest(enabled=enabled, rate=rate):
+                with override_settings(FLOW_TRACES={**settings.FLOW_TRACES, 'ENABLED': enabled, 'SAMPLE_RATE': rate}):
+                    wrapped = start_trace(self.project.id, None, events)
+                self.assertEqual(isinstance(wrapped, TracingEvents), traced)
+                self.assertIs(wrapped.events if traced else wrapped, events)
+
+    def test_traces_are_summarized(self):
+        plan = get_plan(self.project)
+
+        def run_code_node(step, inputs, context):
+            time.sleep(0.05 if step.node_id == 'slow' else 0)
+            return step.node_id
+
+        async def main(events):
+            with mock.patch('api.engine.executor.get_limits', return_value=ConcurrencyLimits(4, 4)):
+                return await execute_plan_async(plan, ['text'], events)
+
+        for run in range(2):
+            events = TracingEvents(self.project.id)
+            with mock.patch.dict('api.engine.executor.RUNNERS', {'code_node': run_code_node}), \
+                    mock.patch('api.engine.executor.get_memo', return_value=NodeOutputMemo(100, 1024 * 1024)):
+                asyncio.run(main(events))
+            events.save()
+
+        summary = trace_summary(self.project)
+        self.assertEqual(summary['runs'], 2)
+        self.assertEqual(summary['slowest_nodes'][0]['node_id'], 'slow')
+        self.assertEqual(summary['slowest_nodes'][0]['executions'], 2)
+        self.assertEqual([node['id'] for node in summary['critical_path']['nodes']], ['input', 'slow', 'output'])
+
+        NodeTrace.objects.update(created_at=timezone.now() - timedelta(days=settings.FLOW_TRACES['TTL_DAYS'] + 1))
+        self.assertEqual(prune_traces(), 8)
+
+
+class OutputAssemblerTests(SimpleTestCase):
+    def test_deltas_add_up_to_the_output(self):
+        plan = ExecutionPlan(1, 1, [
+            PlanStep(pk=1, node_id='input', type='input_node', label='Input', inputs=[], config={}),
+            PlanStep(pk=2, node_id='a', type='ai_node', label='A', inputs=['input'], config={}),
+            PlanStep(pk=3, node_id='b', type='ai_node', label='B', inputs=['input'], config={}),
+            PlanStep(pk=4, node_id='output', type='output_node', label='Output', inputs=['a', 'b'], config={}),
+        ])
+        assembler = OutputAssembler(plan)
+        deltas = [
+            assembler.token('a', 'Hel'),
+            # B is held back until A finishes
+            assembler.token('b', 'Second'),
+            assembler.token('a', 'lo'),
+            assembler.finish('a', 'Hello'),
+            assembler.finish('input', 'ignored'),
+            assembler.finish('b', 'Second part'),
+        ]
+        self.assertEqual(deltas, ['Hel', '', 'lo', '\n\nSecond', '', ' part'])
+        self.assertEqual(''.join(deltas), 'Hello\n\nSecond part')
+
+
+class JobStreamTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        creator = User.objects.create_user(email='creator@example.com', role='creator')
+        project = Project.objects.create(name='Flow', url_name='flow', creator=creator)
+        flow = flow_payload([('input', 'input_node'), ('report', 'template_node'), ('output', 'output_node')],
+                            [('input', 'report'), ('report', 'output')])
+        flow['nodes'][1]['data']['template'] = '# Report\n\n{{input}}'
+        replace_flow(project, flow)
+        bump_flow_version(project)
+
+        self.client_user = User.objects.create_user(email='client@example.com', role='client')
+        ProjectClient.objects.create(client=self.client_user, project=project)
+        self.job = ClientJob.objects.create(user=self.client_user, name='Job')
+        Transcript.objects.create(job=self.job, content='hello world')
+        self.url = reverse('client_job_run_stream', kwargs={'job_id': self.job.id})
+
+    def post(self, user=None):
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'} if user else {}
+
+        async def main():
+            response = await AsyncClient().post(self.url, headers=headers)
+            if not response.streaming:
+                return response, []
+            body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+            events = []
+            for block in body.strip().split('\n\n'):
+                event, data = block.split('\n')
+                events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+            return response, events
+
+        return async_to_sync(main)()
+
+    def test_progress_and_output_are_streamed(self):
+        response, events = self.post(self.client_user)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(events[0], ('started', {'job': self.job.id, 'nodes': 3}))
+        self.assertEqual(events[-1], ('done', {'output': '# Report\n\nhello world'}))
+        self.assertEqual(
+            [(data['id'], data['status']) for event, data in events if event == 'node'],
+            [('input', 'started'), ('input', 'finished'), ('report', 'started'), ('report', 'finished'),
+             ('output', 'started'), ('output', 'finished')],
+        )
+        self.assertEqual(''.join(data['delta'] for event, data in events if event == 'output'), '# Report\n\nhello world')
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.output_markdown, '# Report\n\nhello world')
+
+    def test_only_the_job_owner_can_stream(self):
+        self.assertEqual(self.post()[0].status_code, 401)
+        other = User.objects.create_user(email='other@example.com', role='client')
+        self.assertEqual(self.post(other)[0].status_code, 403)
+
+
+class TemplateCacheTests(SimpleTestCase):
+    def test_templates_are_cached_by_content(self):
+        templates = TemplateCache(max_entries=2)
+        first = templates.get('# {{Summary}}')
+        self.assertIs(templates.get('# {{Summary}}'), first)
+        self.assertEqual(first.render_to_string({'Summary': 'Done'}), '# Done')
+
+        templates.get('b')
+        templates.get('# {{Summary}}')  # Most recently used again
+        templates.get('c')
+        self.assertIs(templates.get('# {{Summary}}'), first)
+        self.assertEqual(len(templates._templates), 2)
+
+
+class NodeOutputPruneTests(TestCase):
+    @override_settings(FLOW_MEMO={**settings.FLOW_MEMO, 'PERSISTENT_TTL_DAYS': 7, 'PERSISTENT_MAX_ROWS': 3})
+    def test_prune_expired_and_excess_rows(self):
+        now = timezone.now()
+        for index in range(6):
+            NodeOutputCache.objects.create(key=f'key-{index}', output='out')
+        # created_at is set on insert; age the rows afterwards
+        for index, age in enumerate([30, 8, 3, 2, 1, 0]):
+            NodeOutputCache.objects.filter(key=f'key-{index}').update(created_at=now - timedelta(days=age))
+
+        self.assertEqual(prune_node_outputs(), 3)
+        self.assertEqual(
+            sorted(NodeOutputCache.objects.values_list('key', flat=True)),
+            ['key-3', 'key-4', 'key-5'],
+        )
+
+
+class LLMClientTests(SimpleTestCase):
+    class Provider:
+        def __init__(self, failures=0, error=RetryableProviderError):
+            self.calls = []
+            self.active = self.peak = 0
+            self.failures = failures
+            self.error = error
+
+        async def complete(self, messages):
+            self.calls.append(messages)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(0.02)
+            self.active -= 1
+            if len(self.calls) <= self.failures:
+                raise self.error('Unavailable')
+            return f"answer to {messages[-1]['content']}"
+
+        async def stream(self, messages):
+            self.calls.append(messages)
+            yield 'partial '
+            raise RetryableProviderError('Dropped')
+
+    def complete_all(self, make_client, prompts):
+        async def main():
+            # Created on the loop it runs on, like get_llm_client() on the flow loop
+            client = make_client()
+            return await asyncio.gather(*(client.complete([{'role': 'user', 'content': prompt}]) for prompt in prompts))
+        return asyncio.run(main())
+
+    def test_identical_prompts_share_a_call(self):
+        provider = self.Provider()
+        answers = self.complete_all(lambda: LLMClient(provider, max_concurrency=4), ['a', 'a', 'b', 'a'])
+        self.assertEqual(answers, ['answer to a', 'answer to a', 'answer to b', 'answer to a'])
+        self.assertEqual(len(provider.calls), 2)
+
+    def test_concurrency_and_rate_limits(self):
+        provider = self.Provider()
+        started = time.perf_counter()
+        self.complete_all(lambda: LLMClient(provider, max_concurrency=2, requests_per_second=50, burst=2), [str(i) for i in range(7)])
+        self.assertEqual(provider.peak, 2)
+        # Two calls go in the burst, the other five are paced at 50 per second
+        self.assertGreaterEqual(time.perf_counter() - started, 0.09)
+
+    def test_retries(self):
+        provider = self.Provider(failures=2)
+        self.assertEqual(self.complete_all(lambda: LLMClient(provider, 1, max_retries=2, backoff_base=0.001), ['a']), ['answer to a'])
+        self.assertEqual(len(provider.calls), 3)
+
+        provider = self.Provider(failures=2)
+        with self.assertRaises(RetryableProviderError):
+            self.complete_all(lambda: LLMClient(provider, 1, max_retries=1, backoff_base=0.001), ['a'])
+
+        provider = self.Provider(failures=1, error=ProviderError)
+        with self.assertRaises(ProviderError):
+            self.complete_all(lambda: LLMClient(provider, 1, backoff_base=0.001), ['a'])
+        self.assertEqual(len(provider.calls), 1)
+
+    def test_started_stream_is_not_retried(self):
+        provider = self.Provider()
+        pieces = []
+
+        async def main():
+            return await LLMClient(provider, 1, backoff_base=0.001).complete([{'role': 'user', 'content': 'a'}], on_token=pieces.append)
+
+        with self.assertRaises(RetryableProviderError):
+            asyncio.run(main())
+        self.assertEqual((pieces, len(provider.calls)), (['partial '], 1))
+
+
+class MockLLMTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MockLLMHandler)
+        self.server.daemon_threads = True
+        self.server.latency_ms = self.server.jitter_ms = self.server.token_ms = 0
+        self.server.error_rate = 0
+        self.server.echo_chars = 200
+        self.server.verbose = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def call(self, method, messages):
+        async def main():
+            provider = OpenAIChatProvider(f'http://127.0.0.1:{self.server.server_address[1]}/v1')
+            try:
+                if method == 'stream':
+                    return [piece async for piece in provider.stream(messages)]
+                return await provider.complete(messages)
+            finally:
+                await provider.aclose()
+        return asyncio.run(main())
+
+    def test_answers_are_deterministic(self):
+        messages = [{'role': 'user', 'content': 'Summarize the meeting'}]
+        answer = self.call('complete', messages)
+        self.assertRegex(answer, r'^\[mock [0-9a-f]{12}\] Summarize the meeting$')
+        self.assertEqual(self.call('complete', messages), answer)
+        self.assertNotEqual(self.call('complete', [{'role': 'user', 'content': 'Something else'}]), answer)
+
+        pieces = self.call('stream', messages)
+        self.assertGreater(len(pieces), 1)
+        # The request differs by its stream flag, so only the echoed prompt is the same
+        self.assertTrue(''.join(pieces).endswith('] Summarize the meeting'))
+
+    def test_simulated_rate_limit_is_retryable(self):
+        self.server.error_rate = 1
+        with self.assertRaisesRegex(RetryableProviderError, 'status 429'):
+            self.call('complete', [{'role': 'user', 'content': 'Hello'}])
+
+
+class PromptBudgetTests(SimpleTestCase):
+    def setUp(self):
+        self.step = PlanStep(
+            pk=1, node_id='summary', type='ai_node', label='Summary', inputs=['input', 'notes'],
+            config={'prompt': 'Summarize {{Transcripts}}', 'examples': [
+                {'input': 'first example input', 'output': 'first example output'},
+                {'input': 'second example input', 'output': 'second example output'},
+            ]},
+        )
+        self.tokenizer = get_tokenizer()
+
+    def window(self, budget, min_chunk_tokens=1):
+        context = settings.FLOW_AI_CONTEXT
+        return override_settings(FLOW_AI_CONTEXT={
+            **context, 'CONTEXT_WINDOW': context['RESERVED_OUTPUT_TOKENS'] + budget, 'MIN_CHUNK_TOKENS': min_chunk_tokens,
+        })
+
+    def tokens(self, messages):
+        return sum(self.tokenizer.count(message['content']) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+    def test_prompt_is_prepared_once(self):
+        self.assertIs(get_prepared_prompt(self.step), get_prepared_prompt(self.step))
+
+    def test_examples_fill_the_remaining_budget(self):
+        inputs = [('Transcripts', 'the transcript'), ('Notes', 'some notes')]
+        with self.window(4096):
+            [messages] = budget_requests(self.step, inputs)
+        self.assertEqual(len(messages), 5)
+        # Inputs the prompt does not reference are appended
+        self.assertEqual(messages[-1], {'role': 'user', 'content': 'Summarize the transcript\n\nsome notes'})
+
+        # Room for the message and the first example only
+        with self.window(self.tokens(messages[:2] + messages[-1:]) + 1):
+            [messages] = budget_requests(self.step, inputs)
+        self.assertEqual([message['content'] for message in messages[:2]], ['first example input', 'first example output'])
+        self.assertEqual(len(messages), 3)
+
+    def test_oversized_input_is_split(self):
+        text = ' '.join(f'word{i}' for i in range(400))
+        with self.window(100):
+            requests = budget_requests(self.step, [('Transcripts', text), ('Notes', 'notes')])
+        self.assertGreater(len(requests), 4)
+        for messages in requests:
+            self.assertEqual(len(messages), 1)
+            self.assertLessEqual(self.tokens(messages), 100)
+            self.assertTrue(messages[0]['content'].startswith('Summarize '))
+            self.assertTrue(messages[0]['content'].endswith('\n\nnotes'))
+        chunks = [messages[0]['content'][len('Summarize '):-len('\n\nnotes')] for messages in requests]
+        self.assertEqual(''.join(chunks).split(), text.split())
+
+        with self.window(100, min_chunk_tokens=200), self.assertRaises(PromptBudgetError):
+            budget_requests(self.step, [('Transcripts', text)])
+
+
+class MapReduceTests(TestCase):
+    REDUCE_PROMPT = 'Combine these summaries'
+
+    def setUp(self):
+        self.step = PlanStep(
+            pk=1, node_id='summary', type='ai_node', label='Summary', inputs=['input'],
+            config={'prompt': 'Summarize {{Transcripts}}', 'chunk_size': 5, 'chunk_overlap': 0,
+                    'max_parallel_chunks': 4, 'reduce_prompt': self.REDUCE_PROMPT, 'examples': []},
+        )
+        self.inputs = [('Transcripts', 'word ' * 100)]
+        self.reduce_calls = 0
+
+    async def run_single(self, step, inputs):
+        return 'partial'
+
+    async def complete(self, messages):
+        self.reduce_calls += 1
+        return 'combined'
+
+    def context(self, available):
+        # A context window leaving exactly `available` tokens for the partials of a reduce request
+        context = settings.FLOW_AI_CONTEXT
+        tokenizer = get_tokenizer()
+        window = context['RESERVED_OUTPUT_TOKENS'] + tokenizer.count(self.REDUCE_PROMPT) + MESSAGE_OVERHEAD_TOKENS + available
+        return override_settings(FLOW_AI_CONTEXT={**context, 'CONTEXT_WINDOW': window})
+
+    def test_reduce_combines_partials(self):
+        with self.context(4096):
+            output = asyncio.run(run_map_reduce(self.step, self.inputs, self.run_single, self.complete))
+        self.assertEqual(output, 'combined')
+        self.assertEqual(self.reduce_calls, 1)
+
+    def test_reduce_without_room_for_two_partials_fails(self):
+        # One partial and its separator fit a reduce request, two do not
+        available = get_tokenizer().count('partial') + get_tokenizer().count(PARTIAL_SEPARATOR) + 1
+        with self.context(available):
+            with self.assertRaises(PromptBudgetError):
+                asyncio.run(run_map_reduce(self.step, self.inputs, self.run_single, self.complete))
+        self.assertEqual(self.reduce_calls, 0)
+
+
+class JobQueueTests(TestCase):
+    def add_runs(self, name, count, available_at):
+        creator = User.objects.create_user(email=f'{name}@example.com', role='creator')
+        client = User.objects.create_user(email=f'{name}-client@example.com', role='client')
+        project = Project.objects.create(name=name, url_name=name, creator=creator)
+        job = ClientJob.objects.create(user=client, name=name)
+        JobRun.objects.bulk_create([
+            JobRun(job=job, project=project, available_at=available_at) for _ in range(count)
+        ])
+        return project
+
+    @override_settings(FLOW_JOB_QUEUE={**settings.FLOW_JOB_QUEUE, 'CLAIM_SCAN': 100})
+    def test_deep_backlog_does_not_starve_other_projects(self):
+        now = timezone.now()
+        busy = self.add_runs('busy', 250, now - timedelta(hours=1))
+        quiet = self.add_runs('quiet', 2, now)
+
+        claimed = claim_runs('worker', 4)
+        self.assertEqual(
+            sorted(run.project_id for run in claimed),
+            sorted([busy.id, busy.id, quiet.id, quiet.id]),
+        )
+
+
+    def test_enqueue_reuses_the_waiting_run(self):
+        creator = User.objects.create_user(email='creator@example.com', role='creator')
+        client = User.objects.create_user(email='client@example.com', role='client')
+        project = Project.objects.create(name='Queue', url_name='queue', creator=creator)
+        ProjectClient.objects.create(client=client, project=project)
+        job = ClientJob.objects.create(user=client, name='Job')
+
+        run = enqueue_run(job)
+        self.assertEqual(enqueue_run(job), run)
+        JobRun.objects.filter(id=run.id).update(status=JobRun.RUNNING)
+        self.assertNotEqual(enqueue_run(job), run)
+        self.assertEqual(JobRun.objects.filter(job=job, status=JobRun.QUEUED).count(), 1)
+
+
+class BatchLeaseTests(TestCase):
+    def setUp(self):
+        creator = User.objects.create_user(email='creator@example.com', role='creator')
+        self.project = Project.objects.create(name='Batch', url_name='batch', creator=creator)
+
+    def test_batch_created_by_a_worker_is_not_claimable(self):
+        batch = create_batch(self.project, None, {}, worker_id='command')
+        self.assertEqual(batch.status, BatchRun.RUNNING)
+        self.assertIsNotNone(batch.locked_until)
+        self.assertIsNone(claim_batch('worker'))
+
+    def test_expired_batch_fails_after_max_attempts(self):
+        batch = create_batch(self.project, None, {})
+        for attempt in range(1, batch.max_attempts + 1):
+            claimed = claim_batch('worker')
+            self.assertEqual((claimed.id, claimed.attempts), (batch.id, attempt))
+            # The worker dies: its lease runs out
+            BatchRun.objects.filter(id=batch.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        self.assertIsNone(claim_batch('worker'))
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, BatchRun.FAILED)
+
+    def test_lost_lease_is_reported(self):
+        replace_flow(self.project, {
+            'nodes': [
+                {'id': 'input', 'type': 'input_node', 'data': {'label': 'Transcripts'}},
+                {'id': 'output', 'type': 'output_node', 'data': {'label': 'Output'}},
+            ],
+            'edges': [{'source': 'input', 'target': 'output'}],
+        })
+        client = User.objects.create_user(email='client@example.com', role='client')
+        ProjectClient.objects.create(client=client, project=self.project)
+        job = ClientJob.objects.create(user=client, name='Job')
+        Transcript.objects.create(job=job, content='hello')
+
+        batch = create_batch(self.project, None, {}, worker_id='command')
+        # Another worker took the batch over after this lease expired
+        BatchRun.objects.filter(id=batch.id).update(locked_by='worker')
+        with self.assertRaises(BatchLeaseLost):
+            run_batch(batch, 'command')
+        job.refresh_from_db()
+        self.assertIsNone(job.output_markdown)
+
+
+class NodeStateTests(TestCase):
+    def test_rows_not_written_by_the_latest_run_are_deleted(self):
+        client = User.objects.create_user(email='client@example.com', role='client')
+        job = ClientJob.objects.create(user=client, name='Job')
+        previous = {'summary@0': ('k0', 'a'), 'summary@1': ('k1', 'b'), 'summary@2': ('k2', 'c'), 'merged': ('k3', 'd')}
+        save_node_state({job.id: previous}, {})
+
+        # The job now has a single transcript
+        save_node_state({job.id: {'summary@0': ('k0', 'a'), 'merged': ('k4', 'e')}}, {job.id: previous})
+        self.assertEqual(
+            dict(JobNodeOutput.objects.filter(job=job).values_list('node_id', 'key')),
+            {'summary@0': 'k0', 'merged': 'k4'},
+        )
+
+
+class TranscriptEditTests(TestCase):
+    def setUp(self):
+        client = User.objects.create_user(email='client@example.com', role='client')
+        job = ClientJob.objects.create(user=client, name='Job')
+        self.transcript = Transcript.objects.create(job=job, content='hello world')
+
+    def patch(self, version, operations):
+        return patch_transcript(Transcript.objects.get(pk=self.transcript.pk), version, operations=operations)
+
+    @override_settings(TRANSCRIPT_EDITS={'COMPACT_EVERY': 3})
+    def test_edits_are_appended_and_compacted(self):
+        self.assertEqual(self.patch(1, [{'op': 'insert', 'offset': 5, 'text': ','}]), 2)
+        self.assertEqual(self.patch(2, [{'op': 'delete', 'offset': 0, 'length': 1}, {'op': 'insert', 'offset': 0, 'text': 'H'}]), 3)
+        # The content column is untouched until COMPACT_EVERY edits
+        transcript = Transcript.objects.get(pk=self.transcript.pk)
+        self.assertEqual((transcript.content, transcript.content_version), ('hello world', 1))
+        self.assertEqual(current_contents([transcript]), ['Hello, world'])
+        with self.assertRaises(VersionConflict):
+            self.patch(2, [{'op': 'insert', 'offset': 0, 'text': '!'}])
+
+        self.assertEqual(self.patch(3, [{'op': 'insert', 'offset': 12, 'text': '!'}]), 4)
+        transcript.refresh_from_db()
+        self.assertEqual((transcript.content, transcript.content_version), ('Hello, world!', 4))
+
+    def test_compact_transcripts(self):
+        self.patch(1, [{'op': 'insert', 'offset': 11, 'text': '!'}])
+        self.assertEqual(compact_transcripts(), 1)
+        transcript = Transcript.objects.get(pk=self.transcript.pk)
+        self.assertEqual((transcript.content, transcript.version, transcript.content_version), ('hello world!', 2, 2))
+        self.assertFalse(TranscriptEdit.objects.exists())
+
+    def test_job_transcripts_are_resolved_together(self):
+        job = self.transcript.job
+
+        def serialize():
+            with CaptureQueriesContext(connection) as queries:
+                data = ClientJobDetailedSerializer(ClientJob.objects.get(pk=job.pk)).data
+            return [transcript['content'] for transcript in data['transcripts']], len(queries)
+
+        self.patch(1, [{'op': 'insert', 'offset': 11, 'text': '!'}])
+        contents, one_transcript = serialize()
+        self.assertEqual(contents, ['hello world!'])
+
+        for i in range(5):
+            transcript = Transcript.objects.create(job=job, content=f'transcript {i}')
+            patch_transcript(transcript, 1, operations=[{'op': 'insert', 'offset': 0, 'text': '>'}])
+        contents, six_transcripts = serialize()
+        self.assertEqual(contents[1:], [f'>transcript {i}' for i in range(5)])
+        self.assertEqual(six_transcripts, one_transcript)
+
+
+@override_settings(FLOW_CODE_TIMEOUT=2)
+class SandboxTests(SimpleTestCase):
+    SECRET = 'sandbox-test-secret'
+    POOL = {'WORKERS': 1, 'CPU_SECONDS': 1, 'MEMORY_MB': 256, 'MAX_TASKS_PER_WORKER': 100, 'USER': 'nobody'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Workers are started with this in the server's environment
+        with mock.patch.dict(os.environ, {'FLOW_SANDBOX_SECRET': cls.SECRET}):
+            cls.pool = CodeWorkerPool(cls.POOL)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        super().tearDownClass()
+
+    def run_code(self, code, input_data=None):
+        code_hash = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        return json.loads(self.pool.run(code_hash, code, json.dumps(input_data)))
+
+    def test_environment_is_not_inherited(self):
+        code = (
+            "import os\n"
+            "def process_data(server_pid):\n"
+            "    found = ['environ'] if 'FLOW_SANDBOX_SECRET' in os.environ else []\n"
+            "    for pid in ('self', os.getppid(), server_pid):\n"
+            "        try:\n"
+            "            with open(f'/proc/{pid}/environ', 'rb') as environ:\n"
+            "                if b'" + self.SECRET + "' in environ.read():\n"
+            "                    found.append(str(pid))\n"
+            "        except OSError:\n"
+            "            pass\n"
+            "    return {'found': found, 'uid': os.getuid()}\n"
+        )
+        result = json.loads(self.run_code(code, os.getpid())['output'])
+        self.assertEqual(result['found'], [])
+        if os.getuid() == 0:
+            self.assertNotEqual(result['uid'], 0)
+
+    def test_cpu_limit(self):
+        response = self.run_code("def process_data(input_data):\n    while True:\n        pass\n")
+        self.assertEqual(response, {'error': 'Code used more than 1 seconds of CPU time.'})
+        # The limit only took down that call
+        self.assertEqual(self.run_code("def process_data(input_data):\n    return 'ok'\n"), {'output': 'ok'})
+
+    def test_memory_limit(self):
+        response = self.run_code("def process_data(input_data):\n    return len(bytearray(512 * 1024 * 1024))\n")
+        self.assertEqual(response, {'error': 'Code ran out of memory.'})
+
+    def test_wall_clock_timeout(self):
+        response = self.run_code("import time\ndef process_data(input_data):\n    time.sleep(10)\n")
+        self.assertEqual(response, {'error': 'Code ran longer than 2 seconds.'})
+        self.assertEqual(self.run_code("def process_data(input_data):\n    return input_data\n", [1]), {'output': '[1]'})
+
+
+class CompiledCodeCacheTests(SimpleTestCase):
+    def setUp(self):
+        sandbox_worker._compiled.clear()
+        self.addCleanup(sandbox_worker._compiled.clear)
+
+    @mock.patch.object(sandbox_worker, 'COMPILED_CACHE_SIZE', 2)
+    def test_code_is_compiled_once_per_hash(self):
+        first = sandbox_worker._compile('a', 'x = 1')
+        self.assertIs(sandbox_worker._compile('a', 'x = 1'), first)
+
+        sandbox_worker._compile('b', 'x = 2')
+        sandbox_worker._compile('a', 'x = 1')  # Most recently used again
+        sandbox_worker._compile('c', 'x = 3')
+        self.assertEqual(list(sandbox_worker._compiled), ['a', 'c'])
+
+
+def write_wav(path, seconds, rate=8000):
+    with wave.open(path, 'wb') as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(rate)
+        audio.writeframes(b'\0\0' * int(seconds * rate))
+
+
+class SpeechToTextTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user(email='client@example.com', role='client'))
+        self.url = reverse('speech_to_text')
+        self.received = []
+
+    def transcribe(self, path, filename=None, language=None):
+        with open(path, 'rb') as audio:
+            self.received.append((path, audio.read(), filename, language))
+        return ' hello '
+
+    def test_audio_is_streamed_to_a_temporary_file(self):
+        audio = SimpleUploadedFile('clip.wav', b'RIFF' + os.urandom(4096))
+        with mock.patch('api.views.client.transcribe_file', side_effect=self.transcribe):
+            response = self.api.post(self.url, {'audio_file': audio, 'language': 'en'}, format='multipart')
+        self.assertEqual((response.status_code, response.json()), (200, {'transcription': ' hello '}))
+
+        [(path, data, filename, language)] = self.received
+        audio.seek(0)
+        self.assertEqual((data, filename, language), (audio.read(), 'clip.wav', 'en'))
+        # The temporary file is removed with the request
+        self.assertFalse(os.path.exists(path))
+
+    def test_errors(self):
+        self.assertEqual(self.api.post(self.url, {}, format='multipart').status_code, 400)
+        with mock.patch('api.views.client.transcribe_file', side_effect=TranscriptionError('Unavailable')):
+            response = self.api.post(self.url, {'audio_file': SimpleUploadedFile('clip.wav', b'RIFF')}, format='multipart')
+        self.assertEqual((response.status_code, response.json()), (502, {'error': 'Unavailable'}))
+
+    @override_settings(TRANSCRIBER={'BACKEND': 'api.transcription.backends.FakeTranscriber'})
+    def test_transcriber_is_created_once(self):
+        with mock.patch.object(backends, '_transcriber', None):
+            transcriber = get_transcriber()
+            self.assertIsInstance(transcriber, FakeTranscriber)
+            self.assertIs(get_transcriber(), transcriber)
+
+
+class AudioUploadTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        uploads = override_settings(AUDIO_UPLOADS={
+            **settings.AUDIO_UPLOADS, 'ROOT': self.root, 'SEGMENT_SECONDS': 1, 'SILENCE_SEARCH_SECONDS': 0.2,
+        })
+        uploads.enable()
+        self.addCleanup(uploads.disable)
+        scheduler = mock.patch('api.transcription.segments.get_scheduler', return_value=DirectScheduler(FakeTranscriber()))
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+
+        self.client_user = User.objects.create_user(email='client@example.com', role='client')
+        self.job = ClientJob.objects.create(user=self.client_user, name='Job')
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+
+        audio = os.path.join(self.root, 'audio.wav')
+        write_wav(audio, 3)
+        with open(audio, 'rb') as source:
+            self.audio = source.read()
+
+    def upload(self):
+        chunk_size = 64 * 1024
+        response = self.api.post(reverse('audio_uploads'), {
+            'job': self.job.id, 'filename': 'audio.wav', 'size': len(self.audio), 'chunk_size': chunk_size,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()['id']
+        for index in range(response.json()['chunk_count']):
+            response = self.api.put(
+                reverse('audio_upload_chunk', kwargs={'upload_id': upload_id, 'index': index}),
+                self.audio[index * chunk_size:(index + 1) * chunk_size], content_type='application/octet-stream',
+            )
+            self.assertEqual(response.status_code, 204)
+        return upload_id
+
+    def finalize(self, upload_id):
+        return self.api.post(reverse('audio_upload_finalize', kwargs={'upload_id': upload_id}))
+
+    def test_finalize_transcribes_every_segment_once(self):
+        upload_id = self.upload()
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, 201)
+        self.assertGreater(response.json()['content'].count('[transcript'), 1)
+        self.assertEqual(self.finalize(upload_id).status_code, 409)
+        self.assertEqual(self.job.transcripts.count(), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.root, upload_id)))
+
+    def test_concurrent_finalize_is_refused(self):
+        upload_id = self.upload()
+        concurrent = []
+
+        def transcribe(path, filename=None, language=None):
+            # A second finalize arriving while the first one transcribes
+            concurrent.append(self.finalize(upload_id))
+            return transcribe_file(path, filename, language)
+
+        with mock.patch('api.views.client.transcribe_file', side_effect=transcribe):
+            self.assertEqual(self.finalize(upload_id).status_code, 201)
+        self.assertEqual(concurrent[0].status_code, 409)
+        self.assertEqual(concurrent[0].json(), {'error': 'This upload is finalizing.'})
+        self.assertEqual(self.job.transcripts.count(), 1)
+
+    def test_failed_transcription_releases_the_upload(self):
+        upload_id = self.upload()
+        with mock.patch('api.views.client.transcribe_file', side_effect=TranscriptionError('Unavailable')):
+            self.assertEqual(self.finalize(upload_id).status_code, 502)
+        self.assertEqual(self.api.get(reverse('audio_upload', kwargs={'upload_id': upload_id})).json()['status'], 'uploading')
+        self.assertEqual(self.finalize(upload_id).status_code, 201)
+
+
+class SegmentTranscriptionTests(SimpleTestCase):
+    @override_settings(AUDIO_UPLOADS={**settings.AUDIO_UPLOADS, 'SEGMENT_SECONDS': 1, 'SILENCE_SEARCH_SECONDS': 0.2})
+    def test_failure_waits_for_running_segments(self):
+        seen = []
+
+        class Transcriber:
+            def transcribe(self, path, filename=None, language=None):
+                if filename == 'segment-0000.wav':
+                    raise TranscriptionError('Unavailable')
+                time.sleep(0.2)
+                seen.append(os.path.exists(path))
+                return ''
+
+        with tempfile.TemporaryDirectory() as workdir:
+            audio = os.path.join(workdir, 'audio.wav')
+            write_wav(audio, 6)
+            scheduler = DirectScheduler(Transcriber(), workers=2)
+            with mock.patch('api.transcription.segments.get_scheduler', return_value=scheduler):
+                with self.assertRaises(TranscriptionError):
+                    transcribe_file(audio)
+
+        # Segments still running were not pulled from under the transcriber, the others never started
+        self.assertTrue(seen)
+        self.assertTrue(all(seen))
+        self.assertLess(len(seen), 5)
+        self.assertEqual(scheduler.metrics.snapshot()['queue_depth'], 0)
+
+
+class BatchSchedulerTests(SimpleTestCase):
+    class Transcriber:
+        def __init__(self, drop=0):
+            self.batches = []
+            self.drop = drop
+            self.release = threading.Event()
+            self.release.set()
+
+        def transcribe_batch(self, clips):
+            self.release.wait()
+            self.batches.append([path for path, _, _ in clips])
+            return [path.upper() for path, _, _ in clips][self.drop:]
+
+    def test_clips_are_batched(self):
+        transcriber = self.Transcriber()
+        scheduler = BatchScheduler(transcriber, max_batch_size=4, max_wait_ms=200, workers=1)
+        futures = [scheduler.submit(f'clip-{i}') for i in range(5)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [f'CLIP-{i}' for i in range(5)])
+        self.assertEqual(transcriber.batches, [['clip-0', 'clip-1', 'clip-2', 'clip-3'], ['clip-4']])
+        self.assertEqual(scheduler.metrics.snapshot()['batch_sizes'], {'1': 1, '4': 1})
+
+    def test_missing_results_fail_the_whole_batch(self):
+        scheduler = BatchScheduler(self.Transcriber(drop=1), max_batch_size=2, max_wait_ms=200)
+        futures = [scheduler.submit(f'clip-{i}') for i in range(2)]
+        for future in futures:
+            with self.assertRaisesRegex(TranscriptionError, '1 results for 2 clips'):
+                future.result(timeout=5)
+        self.assertEqual(scheduler.metrics.snapshot()['failed'], 2)
+
+    def test_cancelled_clips_are_not_transcribed(self):
+        transcriber = self.Transcriber()
+        transcriber.release.clear()
+        scheduler = BatchScheduler(transcriber, max_batch_size=1, max_wait_ms=0, workers=1)
+        running = scheduler.submit('running')
+        cancelled = scheduler.submit('cancelled')
+        queued = scheduler.submit('queued')
+        self.assertTrue(cancelled.cancel())
+        transcriber.release.set()
+        self.assertEqual((running.result(timeout=5), queued.result(timeout=5)), ('RUNNING', 'QUEUED'))
+        self.assertEqual(transcriber.batches, [['running'], ['queued']])
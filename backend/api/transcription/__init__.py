@@ -0,0 +1 @@
+# transcription/__init__.py
@@ -0,0 +1,184 @@
+# transcription/backends.py
+import hashlib
+import os
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+try:
+    import numpy as np
+    from faster_whisper import WhisperModel
+    from faster_whisper.audio import decode_audio
+    from faster_whisper.tokenizer import Tokenizer
+except ImportError:  # Optional; only needed by WhisperTranscriber
+    WhisperModel = None
+
+# Beam width used when decoding batches, faster-whisper's default for transcribe()
+BEAM_SIZE = 5
+
+
+class TranscriptionError(Exception):
+    """
+    Raised when audio cannot be transcribed.
+    """
+
+
+class WhisperAPITranscriber:
+    """
+    Transcribes through an OpenAI-compatible `/audio/transcriptions` endpoint.
+    The audio file is streamed from disk, never read into memory at once.
+    """
+    def __init__(self, base_url, api_key='', model='whisper-1', timeout=600):
+        self.model = model
+        self.client = httpx.Client(
+            base_url=base_url.rstrip('/'),
+            headers={'Authorization': f'Bearer {api_key}'} if api_key else {},
+            timeout=timeout,
+        )
+
+    def transcribe(self, path, filename=None, language=None):
+        data = {'model': self.model}
+        if language:
+            data['language'] = language
+        try:
+            with open(path, 'rb') as audio:
+                # The endpoint detects the audio format from the file name
+                files = {'file': (filename or os.path.basename(path), audio)}
+                response = self.client.post('/audio/transcriptions', data=data, files=files)
+        except httpx.TransportError as e:
+            raise TranscriptionError(f"Transcription request failed: {e}")
+
+        if response.status_code >= 400:
+            raise TranscriptionError(f"Transcription failed with status {response.status_code}: {response.text[:200]}")
+        try:
+            return response.json()['text']
+        except (ValueError, KeyError, TypeError):
+            raise TranscriptionError("Transcription response did not contain any text.")
+
+
+class WhisperTranscriber:
+    """
+    Runs a local Whisper model (faster-whisper). Loading the model is slow and
+    memory hungry, so it happens once per process; `num_workers` sets how many
+    transcriptions (or batches) the model runs in parallel.
+
+    Clips of up to 30 seconds, Whisper's window and the longest segment
+    split_audio() cuts, are batched by transcribe_batch: their features go
+    through the encoder as one batch and are decoded together.
+    """
+    def __init__(self, model='base', device='auto', compute_type='default', num_workers=1):
+        if WhisperModel is None:
+            raise ImproperlyConfigured("WhisperTranscriber requires the faster-whisper package.")
+        self.model = WhisperModel(model, device=device, compute_type=compute_type, num_workers=num_workers)
+
+    def transcribe(self, path, filename=None, language=None):
+        try:
+            segments, _ = self.model.transcribe(path, language=language)
+            return ' '.join(segment.text.strip() for segment in segments)
+        except Exception as e:
+            raise TranscriptionError(f"Transcription failed: {e}")
+
+    def transcribe_batch(self, clips):
+        """
+        Transcribe (path, filename, language) clips, returning a text or a
+        TranscriptionError per clip. Clips longer than one window are
+        transcribed on their own.
+        """
+        extractor = self.model.feature_extractor
+        results = [None] * len(clips)
+        windows = []  # (index, audio, language)
+        for index, (path, filename, language) in enumerate(clips):
+            try:
+                audio = decode_audio(path, sampling_rate=extractor.sampling_rate)
+            except Exception as e:
+                results[index] = TranscriptionError(f"Transcription failed: {e}")
+                continue
+            if audio.shape[0] > extractor.n_samples:
+                try:
+                    results[index] = self.transcribe(path, filename, language)
+                except TranscriptionError as e:
+                    results[index] = e
+            else:
+                windows.append((index, audio, language))
+
+        if windows:
+            try:
+                texts = self.decode_windows([audio for _, audio, _ in windows], [language for _, _, language in windows])
+            except Exception as e:
+                texts = [TranscriptionError(f"Transcription failed: {e}")] * len(windows)
+            for (index, _, _), text in zip(windows, texts):
+                results[index] = text
+        return results
+
+    def decode_windows(self, audios, languages):
+        extractor = self.model.feature_extractor
+        # Pad every clip with silence to a full window, as Whisper was trained on
+        features = np.stack([
+            extractor(np.pad(audio, (0, extractor.n_samples - audio.shape[0])))[:, :extractor.nb_max_frames]
+            for audio in audios
+        ])
+        encoded = self.model.encode(features)
+
+        whisper = self.model.model
+        if not all(languages):
+            detected = whisper.detect_language(encoded) if whisper.is_multilingual else [[('<|en|>', 1.0)]] * len(audios)
+            # Language tokens look like <|en|>
+            languages = [language or candidates[0][0][2:-2] for language, candidates in zip(languages, detected)]
+        tokenizers = [
+            Tokenizer(self.model.hf_tokenizer, whisper.is_multilingual, task='transcribe', language=language)
+            for language in languages
+        ]
+        prompts = [list(tokenizer.sot_sequence) + [tokenizer.no_timestamps] for tokenizer in tokenizers]
+        generated = whisper.generate(
+            encoded, prompts, beam_size=BEAM_SIZE, max_length=self.model.max_length, suppress_blank=True,
+        )
+        return [tokenizer.decode(result.sequences_ids[0]).strip() for tokenizer, result in zip(tokenizers, generated)]
+
+
+class FakeTranscriber:
+    """
+    Deterministic stand-in for tests and local development: the text is
+    derived from the audio bytes, after an optional fixed `latency` (seconds)
+    per call. It implements transcribe_batch, where a batch costs a single
+    latency like a batched model pass, so it is also used to exercise batching.
+    """
+    def __init__(self, latency=0):
+        self.latency = latency
+
+    def transcribe(self, path, filename=None, language=None):
+        time.sleep(self.latency)
+        return self.fake_text(path)
+
+    def transcribe_batch(self, clips):
+        time.sleep(self.latency)
+        return [self.fake_text(path) for path, _, _ in clips]
+
+    def fake_text(self, path):
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as audio:
+            for block in iter(lambda: audio.read(64 * 1024), b''):
+                digest.update(block)
+                size += len(block)
+        return f"[transcript {digest.hexdigest()[:12]}: {size} bytes]"
+
+
+_transcriber = None
+_lock = threading.Lock()
+
+
+def get_transcriber():
+    """
+    Return the process-wide transcriber configured in TRANSCRIBER, creating it
+    on first use.
+    """
+    global _transcriber
+    with _lock:
+        if _transcriber is None:
+            config = settings.TRANSCRIBER
+            _transcriber = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _transcriber
@@ -0,0 +1,224 @@
+# transcription/batching.py
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+
+from api.transcription.backends import TranscriptionError, get_transcriber
+
+
+class BatchMetrics:
+    """
+    Counters describing how clips were batched, safe to read from any thread.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.batches = 0
+        self.clips = 0
+        self.failed = 0
+        self.batch_sizes = Counter()
+        self.wait_ms = 0.0
+        self.batch_ms = 0.0
+
+    def queued(self, depth):
+        with self.lock:
+            self.queue_depth = depth
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def dispatched(self, size, depth, wait_ms, batch_ms, failed):
+        with self.lock:
+            self.queue_depth = depth
+            self.batches += 1
+            self.clips += size
+            self.failed += failed
+            self.batch_sizes[size] += 1
+            self.wait_ms += wait_ms
+            self.batch_ms += batch_ms
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'batches': self.batches,
+                'clips': self.clips,
+                'failed': self.failed,
+                'average_batch_size': round(self.clips / self.batches, 2) if self.batches else 0,
+                'batch_sizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+                # Time a clip waited in the queue before its batch started
+                'average_wait_ms': round(self.wait_ms / self.clips, 1) if self.clips else 0,
+                'average_batch_ms': round(self.batch_ms / self.batches, 1) if self.batches else 0,
+            }
+
+
+class BatchScheduler:
+    """
+    Collects clips submitted from many request threads and hands them to a
+    transcriber implementing transcribe_batch in batches. A batch is
+    dispatched once `max_batch_size` clips are waiting or `max_wait_ms` have
+    passed since its first clip arrived; up to `workers` batches run at once,
+    and each caller then gets its own result back.
+    """
+    def __init__(self, transcriber, max_batch_size=8, max_wait_ms=10, workers=4):
+        self.transcriber = transcriber
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.metrics = BatchMetrics()
+        self.pending = deque()  # (future, clip, submitted at)
+        self.condition = threading.Condition()
+        # Batches are only formed while a worker is free; until then clips keep
+        # queueing, so a busy scheduler sends fuller batches
+        self.free_workers = threading.Semaphore(workers)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcription-batch')
+        self.thread = threading.Thread(target=self.run, name='transcription-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, path, filename=None, language=None):
+        """
+        Queue a clip and return a Future resolving to its text.
+        """
+        future = Future()
+        with self.condition:
+            self.pending.append((future, (path, filename, language), time.perf_counter()))
+            self.metrics.queued(len(self.pending))
+            self.condition.notify()
+        return future
+
+    def transcribe(self, path, filename=None, language=None):
+        return self.submit(path, filename, language).result()
+
+    def next_batch(self):
+        with self.condition:
+            while True:
+                while not self.pending:
+                    self.condition.wait()
+                # Hold the batch open until it is full or its first clip has waited long enough
+                deadline = self.pending[0][2] + self.max_wait
+                while len(self.pending) < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                count = min(len(self.pending), self.max_batch_size)
+                taken = [self.pending.popleft() for _ in range(count)]
+                # Clips whose caller cancelled them are dropped; the others can no longer be cancelled
+                batch = [item for item in taken if item[0].set_running_or_notify_cancel()]
+                self.metrics.queued(len(self.pending))
+                if batch:
+                    return batch, len(self.pending)
+
+    def run(self):
+        while True:
+            self.free_workers.acquire()
+            batch, depth = self.next_batch()
+            self.pool.submit(self.dispatch, batch, depth)
+
+    def dispatch(self, batch, depth):
+        started = time.perf_counter()
+        try:
+            results = list(self.transcriber.transcribe_batch([clip for _, clip, _ in batch]))
+            if len(results) != len(batch):
+                raise TranscriptionError(f"The transcriber returned {len(results)} results for {len(batch)} clips.")
+        except Exception as e:
+            results = [e if isinstance(e, TranscriptionError) else TranscriptionError(f"Transcription failed: {e}")] * len(batch)
+        finally:
+            self.free_workers.release()
+
+        failed = 0
+        for (future, _, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                failed += 1
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        self.metrics.dispatched(
+            len(batch), depth,
+            wait_ms=sum(started - submitted for _, _, submitted in batch) * 1000,
+            batch_ms=(time.perf_counter() - started) * 1000,
+            failed=failed,
+        )
+
+
+class DirectScheduler:
+    """
+    Used for transcribers without batch support, or when batching is
+    disabled: every clip is transcribed on its own, up to `workers` at once,
+    with the same interface and metrics as BatchScheduler.
+    """
+    def __init__(self, transcriber, workers=4):
+        self.transcriber = transcriber
+        self.metrics = BatchMetrics()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcription')
+        self.lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, path, filename=None, language=None):
+        """
+        Start transcribing a clip and return a Future resolving to its text.
+        """
+        with self.lock:
+            self.pending += 1
+            self.metrics.queued(self.pending)
+        future = self.pool.submit(self.dispatch, (path, filename, language), time.perf_counter())
+        future.add_done_callback(self.cancelled)
+        return future
+
+    def cancelled(self, future):
+        # A cancelled clip never reaches dispatch, which counts the others out of the queue
+        if future.cancelled():
+            with self.lock:
+                self.pending -= 1
+                self.metrics.queued(self.pending)
+
+    def transcribe(self, path, filename=None, language=None):
+        return self.submit(path, filename, language).result()
+
+    def dispatch(self, clip, submitted):
+        started = time.perf_counter()
+        with self.lock:
+            self.pending -= 1
+            self.metrics.queued(self.pending)
+        failed = 0
+        try:
+            return self.transcriber.transcribe(*clip)
+        except TranscriptionError:
+            failed = 1
+            raise
+        except Exception as e:
+            failed = 1
+            raise TranscriptionError(f"Transcription failed: {e}")
+        finally:
+            # Under the lock, so a depth read here is not overwritten by an older one
+            with self.lock:
+                self.metrics.dispatched(1, self.pending, wait_ms=(started - submitted) * 1000,
+                                        batch_ms=(time.perf_counter() - started) * 1000, failed=failed)
+
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def get_scheduler():
+    """
+    Return the process-wide scheduler for the configured transcriber, set up
+    from TRANSCRIPTION_BATCHING on first use.
+
+    Only transcribers with real batch support, i.e. a
+    `transcribe_batch(clips)` returning a text or a TranscriptionError per
+    (path, filename, language) clip, go through the BatchScheduler; for the
+    others batching would only add waiting, so clips are sent directly.
+    """
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            config = settings.TRANSCRIPTION_BATCHING
+            transcriber = get_transcriber()
+            if config['ENABLED'] and hasattr(transcriber, 'transcribe_batch'):
+                _scheduler = BatchScheduler(transcriber, config['MAX_BATCH_SIZE'], config['MAX_WAIT_MS'], config['WORKERS'])
+            else:
+                _scheduler = DirectScheduler(transcriber, config['WORKERS'])
+    return _scheduler
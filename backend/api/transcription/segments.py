@@ -0,0 +1,139 @@
+# transcription/segments.py
+import os
+import shutil
+import subprocess
+import tempfile
+import wave
+from concurrent.futures import wait
+from django.conf import settings
+
+from api.transcription.batching import get_scheduler
+
+try:
+    import audioop
+except ImportError:  # Removed in Python 3.13; segments are then cut at fixed windows
+    audioop = None
+
+# Length of the blocks compared when looking for silence
+SILENCE_BLOCK_SECONDS = 0.02
+# Seconds ffmpeg may take to convert an upload
+CONVERT_TIMEOUT = 600
+
+
+def is_wav(path):
+    try:
+        with wave.open(path, 'rb'):
+            return True
+    except (wave.Error, EOFError):
+        return False
+
+
+def to_wav(path, workdir):
+    """
+    Return a WAV version of the audio at `path`: the file itself if it already
+    is one, a 16 kHz mono conversion made with ffmpeg otherwise. Returns None
+    when the file cannot be converted (no ffmpeg), so it is transcribed whole.
+    """
+    if is_wav(path):
+        return path
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return None
+
+    converted = os.path.join(workdir, 'converted.wav')
+    try:
+        subprocess.run(
+            [ffmpeg, '-nostdin', '-loglevel', 'error', '-y', '-i', path, '-ac', '1', '-ar', '16000', converted],
+            check=True, timeout=CONVERT_TIMEOUT,
+        )
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return None
+    return converted
+
+
+def quietest_frame(source, start, end):
+    """
+    Frame position of the quietest block between `start` and `end`.
+    """
+    if audioop is None or end <= start:
+        return end
+    block = max(int(source.getframerate() * SILENCE_BLOCK_SECONDS), 1)
+    width = source.getsampwidth()
+    source.setpos(start)
+    best, best_rms = end, None
+    for position in range(start, end, block):
+        frames = source.readframes(min(block, end - position))
+        rms = audioop.rms(frames, width)
+        if best_rms is None or rms < best_rms:
+            best, best_rms = position + block // 2, rms
+    return min(best, end)
+
+
+def split_wav(path, workdir, segment_seconds, search_seconds):
+    """
+    Cut a WAV file into segments of about `segment_seconds`, each ending at
+    the quietest point of the last `search_seconds` before its boundary, so
+    words are rarely cut in half. Returns the segment paths in order.
+    """
+    with wave.open(path, 'rb') as source:
+        rate = source.getframerate()
+        total = source.getnframes()
+        window = max(int(segment_seconds * rate), 1)
+        search = min(int(search_seconds * rate), window // 2)
+        if total <= window:
+            return [path]
+
+        segments = []
+        start = 0
+        while start < total:
+            end = total if total - start <= window else quietest_frame(source, start + window - search, start + window)
+            segment_path = os.path.join(workdir, f'segment-{len(segments):04d}.wav')
+            with wave.open(segment_path, 'wb') as segment:
+                segment.setparams(source.getparams())
+                source.setpos(start)
+                # Copy in blocks of at most one second to bound memory
+                position = start
+                while position < end:
+                    count = min(rate, end - position)
+                    segment.writeframes(source.readframes(count))
+                    position += count
+            segments.append(segment_path)
+            start = end
+    return segments
+
+
+def split_audio(path, workdir):
+    """
+    Return the paths of the segments to transcribe for an audio file; new
+    files are written to `workdir`.
+    """
+    config = settings.AUDIO_UPLOADS
+    wav = to_wav(path, workdir)
+    if wav is None:
+        return [path]
+    return split_wav(wav, workdir, config['SEGMENT_SECONDS'], config['SILENCE_SEARCH_SECONDS'])
+
+
+def transcribe_file(path, filename=None, language=None):
+    """
+    Split an audio file into segments, submit them all to the transcription
+    scheduler, so they are transcribed in parallel (and batched with other
+    requests' clips where the transcriber supports it), and join the texts in
+    order. Raises TranscriptionError; segments not started yet are then
+    cancelled, and running ones finish before their files are removed.
+    """
+    scheduler = get_scheduler()
+    with tempfile.TemporaryDirectory(prefix='segments-') as workdir:
+        segments = split_audio(path, workdir)
+        futures = [
+            scheduler.submit(segment, filename if segment == path else os.path.basename(segment), language)
+            for segment in segments
+        ]
+        try:
+            texts = [future.result().strip() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+            wait(futures)
+    return ' '.join(text for text in texts if text)
+
@@ -0,0 +1,129 @@
+# transcription/uploads.py
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from api.models import AudioUpload
+
+# Bytes copied at a time when streaming chunks to and from disk
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    Raised when a chunk or an upload is not acceptable.
+    """
+
+
+def upload_dir(upload):
+    return os.path.join(settings.AUDIO_UPLOADS['ROOT'], str(upload.id))
+
+
+def chunk_path(upload, index):
+    return os.path.join(upload_dir(upload), f'{index:06d}.part')
+
+
+def expected_chunk_size(upload, index):
+    if index == upload.chunk_count - 1:
+        return upload.size - index * upload.chunk_size
+    return upload.chunk_size
+
+
+def write_chunk(upload, index, stream):
+    """
+    Stream one chunk from `stream` to disk. The chunk is written to a temporary
+    file of its own and renamed once complete, so an interrupted request leaves
+    no partial chunk behind and concurrent retries of a chunk do not mix.
+    """
+    if not 0 <= index < upload.chunk_count:
+        raise UploadError(f"Chunk {index} is out of range; the upload has {upload.chunk_count} chunks.")
+
+    os.makedirs(upload_dir(upload), exist_ok=True)
+    path = chunk_path(upload, index)
+    fd, partial = tempfile.mkstemp(dir=upload_dir(upload), suffix='.tmp')
+    expected = expected_chunk_size(upload, index)
+    written = 0
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            while True:
+                data = stream.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                written += len(data)
+                if written > expected:
+                    break
+                destination.write(data)
+        if written != expected:
+            raise UploadError(f"Chunk {index} must be {expected} bytes, got {written}.")
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def received_chunks(upload):
+    """
+    Indices of the chunks stored so far, for clients resuming an upload.
+    """
+    try:
+        names = os.listdir(upload_dir(upload))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-len('.part')]) for name in names if name.endswith('.part'))
+
+
+def assemble(upload):
+    """
+    Concatenate all chunks into a single file and return its path. The file
+    is written under a temporary name and moved into place before the chunks
+    are removed, so an interrupted finalize leaves either the chunks or the
+    complete file. It is kept until the upload is discarded, so a failed
+    finalize can be retried.
+    """
+    extension = os.path.splitext(upload.filename)[1]
+    path = os.path.join(upload_dir(upload), f'audio{extension}')
+    if not os.path.exists(path):
+        missing = sorted(set(range(upload.chunk_count)) - set(received_chunks(upload)))
+        if missing:
+            raise UploadError(f"Missing chunks: {', '.join(map(str, missing[:20]))}.")
+
+        fd, partial = tempfile.mkstemp(dir=upload_dir(upload), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                for index in range(upload.chunk_count):
+                    with open(chunk_path(upload, index), 'rb') as source:
+                        shutil.copyfileobj(source, destination, COPY_BUFFER_SIZE)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    for index in received_chunks(upload):
+        os.remove(chunk_path(upload, index))
+    return path
+
+
+def discard(upload):
+    shutil.rmtree(upload_dir(upload), ignore_errors=True)
+
+
+def prune_uploads():
+    """
+    Drop the files of uploads that were never finalized within
+    AUDIO_UPLOADS['EXPIRE_HOURS'], or whose finalize never finished, and mark
+    them failed. Returns their number.
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.AUDIO_UPLOADS['EXPIRE_HOURS'])
+    expired = list(AudioUpload.objects.filter(
+        status__in=[AudioUpload.UPLOADING, AudioUpload.FINALIZING], updated_at__lt=cutoff,
+    ))
+    for upload in expired:
+        discard(upload)
+    AudioUpload.objects.filter(id__in=[upload.id for upload in expired]).update(
+        status=AudioUpload.FAILED, error='The upload expired before it was finalized.',
+    )
+    return len(expired)
@@ -6,7 +6,9 @@ from rest_framework.routers import DefaultRouter
 from .views.auth import CreatorTokenObtainPairView, ClientTokenObtainPairView, SystemClientTokenView
 from .views.flow import FlowViewSet
 from .views.projects import ProjectViewSet, GeneralSettingsView
-from .views.client import ClientSystemView, JobViewSet, TranscriptView
+from .views.client import (ClientSystemView, JobViewSet, JobRunView, TranscriptView, SpeechToTextView,
+                           SpeechToTextMetricsView, AudioUploadView, AudioUploadChunkView, AudioUploadFinalizeView)
+from .views.stream import stream_job_run
 
 # Create a router for project endpoints
 router = DefaultRouter()
@@ -29,8 +31,16 @@ urlpatterns = [
     # Client jobs
     path('jobs/<int:job_id>/', JobViewSet.as_view(), name='client_job'),
     path('jobs/', JobViewSet.as_view(), name='client_jobs'),
+    path('jobs/<int:job_id>/run/', JobRunView.as_view(), name='client_job_run'),
+    path('jobs/<int:job_id>/run/stream/', stream_job_run, name='client_job_run_stream'),
     # Transcript endpoints
-    #path('transcripts/<int:transcript_id>/', TranscriptView.as_view(), name='client_transcript'),
+    path('speech-to-text/', SpeechToTextView.as_view(), name='speech_to_text'),
+    path('speech-to-text/metrics/', SpeechToTextMetricsView.as_view(), name='speech_to_text_metrics'),
+    path('speech-to-text/uploads/', AudioUploadView.as_view(), name='audio_uploads'),
+    path('speech-to-text/uploads/<uuid:upload_id>/', AudioUploadView.as_view(), name='audio_upload'),
+    path('speech-to-text/uploads/<uuid:upload_id>/chunks/<int:index>/', AudioUploadChunkView.as_view(), name='audio_upload_chunk'),
+    path('speech-to-text/uploads/<uuid:upload_id>/finalize/', AudioUploadFinalizeView.as_view(), name='audio_upload_finalize'),
+    path('transcripts/<int:transcript_id>/', TranscriptView.as_view(), name='client_transcript'),
 
     # Include project routes from router
     path('', include(router.urls)),
@@ -41,4 +51,7 @@ urlpatterns = [
         'get': 'list',
         'post': 'save'
     }), name='project-flow'),
+    path('projects/<int:project_id>/flow/layout/', FlowViewSet.as_view({
+        'post': 'layout'
+    }), name='project-flow-layout'),
 ]
\ No newline at end of file
@@ -1,11 +1,18 @@
-import io
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from api.permissions import IsClient
-from api.models import Project, ClientJob, Transcript, User, ProjectClient
+from api.permissions import IsClient, IsCreator
+from api.models import Project, ClientJob, Transcript, User, ProjectClient, JobRun, AudioUpload
 from django.shortcuts import get_object_or_404
-from api.serializers import ClientJobSerializer, ClientJobDetailedSerializer, TranscriptSerializer
+from api.serializers import ClientJobSerializer, ClientJobDetailedSerializer, TranscriptSerializer, TranscriptPatchSerializer, JobRunSerializer, AudioUploadSerializer
+from api.services.job_queue import enqueue_run
+from api.services.transcript_patches import PatchError, VersionConflict, patch_transcript
+from api.transcription.backends import TranscriptionError
+from api.transcription.batching import get_scheduler
+from api.transcription.segments import transcribe_file
+from api.transcription.uploads import UploadError, assemble, discard, received_chunks, write_chunk
 
 class SpeechToTextView(APIView):
     """
@@ -17,18 +24,109 @@ class SpeechToTextView(APIView):
         """
         Accepts audio data and returns transcription.
         """
+        # Stream the upload to a temporary file in fixed-size chunks instead of
+        # holding it in memory; must be set before the body is parsed
+        request._request.upload_handlers = [TemporaryFileUploadHandler(request._request)]
+
         audio_file = request.FILES.get('audio_file')
         if not audio_file:
             return Response({'error': 'No audio file provided.'}, status=400)
-        audio_buffer = BytesIO()
-        audio_buffer.name = audio_file.filename
-        audio_buffer.write(audio_file.read())
 
-        transcriber = WhisperTranscriber()
-        raw_transcription = transcriber(audio_buffer)
+        try:
+            raw_transcription = transcribe_file(
+                audio_file.temporary_file_path(),
+                filename=audio_file.name,
+                language=request.data.get('language') or None,
+            )
+        except TranscriptionError as e:
+            return Response({'error': str(e)}, status=502)
+        finally:
+            audio_file.close()  # Removes the temporary file
 
         return Response({'transcription': raw_transcription}, status=200)
 
+class SpeechToTextMetricsView(APIView):
+    """
+    Queue depth and batch sizes of this process' transcription scheduler.
+    """
+    permission_classes = [IsAuthenticated, IsCreator]
+
+    def get(self, request):
+        return Response(get_scheduler().metrics.snapshot())
+
+class AudioUploadView(APIView):
+    """
+    Resumable uploads of long recordings: create an upload, PUT its chunks
+    (in any order, retrying failed ones), then finalize it to transcribe the
+    audio into a new transcript of the job.
+    """
+    permission_classes = [IsAuthenticated, IsClient]
+
+    def post(self, request):
+        serializer = AudioUploadSerializer(data=request.data, context={'request': request})
+        if serializer.is_valid():
+            serializer.save(user=request.user)
+            return Response(serializer.data, status=201)
+        return Response(serializer.errors, status=400)
+
+    def get(self, request, upload_id):
+        # Status and received chunks, so an interrupted client knows what to resend
+        upload = get_object_or_404(AudioUpload, id=upload_id, user=request.user)
+        data = AudioUploadSerializer(upload).data
+        data['received_chunks'] = received_chunks(upload) if upload.status == AudioUpload.UPLOADING else []
+        return Response(data)
+
+class AudioUploadChunkView(APIView):
+    permission_classes = [IsAuthenticated, IsClient]
+
+    def put(self, request, upload_id, index):
+        upload = get_object_or_404(AudioUpload, id=upload_id, user=request.user)
+        if upload.status != AudioUpload.UPLOADING:
+            return Response({'error': f'This upload is {upload.status}.'}, status=409)
+
+        # The chunk is the raw request body, streamed to disk without being parsed
+        try:
+            write_chunk(upload, index, request._request)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=400)
+
+        AudioUpload.objects.filter(id=upload.id).update(updated_at=timezone.now())
+        return Response(status=204)
+
+class AudioUploadFinalizeView(APIView):
+    permission_classes = [IsAuthenticated, IsClient]
+
+    def post(self, request, upload_id):
+        upload = get_object_or_404(AudioUpload, id=upload_id, user=request.user)
+        # Claim the upload, so concurrent finalize requests cannot both transcribe it
+        claimed = AudioUpload.objects.filter(id=upload.id, status=AudioUpload.UPLOADING).update(
+            status=AudioUpload.FINALIZING, updated_at=timezone.now(),
+        )
+        if not claimed:
+            upload.refresh_from_db(fields=['status'])
+            return Response({'error': f'This upload is {upload.status}.'}, status=409)
+
+        try:
+            path = assemble(upload)
+            content = transcribe_file(path, filename=upload.filename, language=upload.language or None)
+        except (UploadError, TranscriptionError) as e:
+            # Release the upload; failed transcriptions keep the assembled audio, so finalize can be retried
+            upload.status = AudioUpload.UPLOADING
+            upload.error = str(e)
+            upload.save(update_fields=['status', 'error', 'updated_at'])
+            return Response({'error': str(e)}, status=400 if isinstance(e, UploadError) else 502)
+        except BaseException:
+            AudioUpload.objects.filter(id=upload.id).update(status=AudioUpload.UPLOADING, updated_at=timezone.now())
+            raise
+
+        transcript = Transcript.objects.create(job=upload.job, content=content)
+        upload.status = AudioUpload.COMPLETED
+        upload.transcript = transcript
+        upload.error = ''
+        upload.save(update_fields=['status', 'transcript', 'error', 'updated_at'])
+        discard(upload)
+        return Response(TranscriptSerializer(transcript).data, status=201)
+
 class ClientSystemView(APIView):
     permission_classes = [AllowAny]
     
@@ -87,9 +185,15 @@ class JobViewSet(APIView):
     def post(self, request):
         serializer = ClientJobDetailedSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=201)
-        print('ERR', serializer.errors, request.data, flush=True)
+            job = serializer.save(user=request.user)
+            data = serializer.data
+            # ?run=true queues a run right away; poll jobs/<id>/run/ for its status
+            if request.query_params.get('run') in ('1', 'true'):
+                try:
+                    data['run'] = JobRunSerializer(enqueue_run(job)).data
+                except ProjectClient.DoesNotExist:
+                    data['run'] = None
+            return Response(data, status=201)
         return Response(serializer.errors, status=400)
     
     def put(self, request, job_id):
@@ -101,7 +205,6 @@ class JobViewSet(APIView):
             return Response({'error': 'You do not have permission to update this job.'}, status=403)
 
         # Update the job data
-        print('PUT', request.data, flush=True)
         serializer = ClientJobDetailedSerializer(job, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -120,6 +223,31 @@ class JobViewSet(APIView):
         job.delete()
         return Response({'message': 'Job deleted successfully.'}, status=204)
     
+class JobRunView(APIView):
+    permission_classes = [IsAuthenticated, IsClient]
+
+    def get(self, request, job_id):
+        # Latest run of the job; a single query, cheap enough to poll
+        run = JobRun.objects.filter(job_id=job_id, job__user=request.user).order_by('-id').first()
+        if run is None:
+            return Response({'error': 'This job has not been run.'}, status=404)
+        return Response(JobRunSerializer(run).data)
+
+    def post(self, request, job_id):
+        # Find the job by ID
+        job = get_object_or_404(ClientJob, id=job_id)
+
+        # Check if the user is authorized to run this job
+        if job.user != request.user:
+            return Response({'error': 'You do not have permission to run this job.'}, status=403)
+
+        # Queue the run for a worker (manage.py run_job_worker) and return right away
+        try:
+            run = enqueue_run(job)
+        except ProjectClient.DoesNotExist:
+            return Response({'error': 'You are not a client of any project.'}, status=400)
+        return Response(JobRunSerializer(run).data, status=202)
+
 class TranscriptView(APIView):
     permission_classes = [IsAuthenticated, IsClient]
 
@@ -128,7 +256,7 @@ class TranscriptView(APIView):
         transcript = get_object_or_404(Transcript, id=transcript_id)
 
         # Check if the user is authorized to view this transcript
-        if transcript.user != request.user:
+        if transcript.job.user != request.user:
             return Response({'error': 'You do not have permission to view this transcript.'}, status=403)
 
         # Serialize the transcript data
@@ -139,8 +267,27 @@ class TranscriptView(APIView):
         # Find the transcript by ID
         transcript = get_object_or_404(Transcript, id=transcript_id)
         # Check if the user is authorized to delete this transcript
-        if transcript.user != request.user:
+        if transcript.job.user != request.user:
             return Response({'error': 'You do not have permission to delete this transcript.'}, status=403)
         # Delete the transcript
         transcript.delete()
-        return Response({'message': 'Transcript deleted successfully.'}, status=204)
\ No newline at end of file
+        return Response({'message': 'Transcript deleted successfully.'}, status=204)
+
+    def patch(self, request, transcript_id):
+        # Edits are sent as operations or a diff instead of the whole content,
+        # and only the new version is returned
+        transcript = get_object_or_404(Transcript, id=transcript_id)
+        if transcript.job.user != request.user:
+            return Response({'error': 'You do not have permission to edit this transcript.'}, status=403)
+
+        serializer = TranscriptPatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        try:
+            version = patch_transcript(transcript, **serializer.validated_data)
+        except VersionConflict as e:
+            return Response({'error': str(e), 'version': e.version}, status=409)
+        except PatchError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({'id': transcript.id, 'version': version})
\ No newline at end of file
@@ -1,4 +1,4 @@
-from rest_framework import viewsets
+from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
@@ -6,8 +6,9 @@ from api.permissions import IsCreator, IsClient, IsCreatorOrClient
 from django.shortcuts import get_object_or_404
 from django.db import transaction
 
-from api.models import Project, Node, Edge, AINode, CodeNode, Example, TemplateNode
-from api.serializers import ProjectFlowSerializer, NodeSerializer, EdgeSerializer
+from api.models import Project, Node
+from api.services.flow_persistence import sync_flow, replace_flow, flow_hash
+from api.services.flow_cache import flow_etag, etag_matches, get_flow_representation, bump_flow_version, bump_layout_version
 
 class FlowViewSet(viewsets.ViewSet):
     """
@@ -20,96 +21,102 @@ class FlowViewSet(viewsets.ViewSet):
         #return get_object_or_404(Project, id=project_id, creator=self.request.user)
         return get_object_or_404(Project, id=project_id)
 
+    def precondition_failed(self, project):
+        return Response(
+            {'error': 'The flow has been modified since it was loaded.'},
+            status=status.HTTP_412_PRECONDITION_FAILED,
+            headers={'ETag': flow_etag(project)}
+        )
+
     def list(self, request, project_id=None):
         """
         Get all nodes and edges for a project.
-        Uses the serializers to ensure consistent formatting.
+        Responds with 304 when the client's If-None-Match matches the current flow version.
         """
         project = self.get_project()
-        serializer = ProjectFlowSerializer(project)
-        return Response(serializer.data)
+        etag = flow_etag(project)
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        return Response(get_flow_representation(project), headers={'ETag': etag})
 
     @action(detail=False, methods=['post'])
     def save(self, request, project_id=None):
         """
         Save the entire flow state (nodes and edges).
+
+        By default the submitted flow is diffed against the stored one and only
+        the changed rows are written. Pass `?mode=replace` to rewrite the flow
+        from scratch instead. An If-Match header that does not match the current
+        flow version is rejected with 412 before any node table is touched, and
+        a payload identical to the stored flow returns without writing anything.
         """
         project = self.get_project()
         flow_data = request.data
-        print(flow_data, flush=True)
+        if_match = request.headers.get('If-Match')
+
+        if if_match and not etag_matches(if_match, flow_etag(project)):
+            return self.precondition_failed(project)
+
+        submitted_hash = flow_hash(flow_data)
+        if submitted_hash == project.flow_hash:
+            return Response(get_flow_representation(project), headers={'ETag': flow_etag(project)})
 
-        # Start a transaction
         with transaction.atomic():
-            # Clear existing nodes and edges
-            Node.objects.filter(project=project).delete()
-            Edge.objects.filter(project=project).delete()
-
-            nodes_map = {}  # To store node references for creating edges
-            
-            # Create new nodes
-            for node_data in flow_data['nodes']:
-                # Use the top-level id instead of looking in data
-                node_id = str(node_data['id'])
-                position = node_data.get('position', {})
-                data = node_data.get('data', {})
-                
-                # Create base node
-                node = Node.objects.create(
-                    project=project,
-                    node_internal_id=node_id,
-                    type=node_data['type'],
-                    label=data.get('label', ''),
-                    position_x=position.get('x', 0),
-                    position_y=position.get('y', 0)
-                )
-                
-                nodes_map[node_id] = node
-
-                # Handle node-specific data
-                if node.type == 'ai_node':
-                    ai_node = AINode.objects.create(
-                        node=node,
-                        prompt=data.get('prompt', '')
-                    )
-                    
-                    # Create examples
-                    for example in data.get('examples', []):
-                        Example.objects.create(
-                            ai_node=ai_node,
-                            name=example.get('name', ''),
-                            input_text=example.get('input', ''),
-                            output_text=example.get('output', '')
-                        )
-                
-                elif node.type == 'code_node':
-                    CodeNode.objects.create(
-                        node=node,
-                        code=data.get('code', '')
-                    )
-                
-                elif node.type == 'template_node':
-                    TemplateNode.objects.create(
-                        node=node,
-                        template=data.get('template', '')
-                    )
-
-            # Create new edges using foreign keys
-            for edge_data in flow_data['edges']:
-                source_id = str(edge_data['source'])
-                target_id = str(edge_data['target'])
-                
-                # Get the actual node instances
-                source_node = nodes_map.get(source_id)
-                target_node = nodes_map.get(target_id)
-                
-                if source_node and target_node:  # Only create edge if both nodes exist
-                    Edge.objects.create(
-                        project=project,
-                        edge_internal_id=edge_data.get('id', f"xy-edge__{source_id}-{target_id}"),
-                        source=source_node,  # Use the actual node instance
-                        target=target_node,  # Use the actual node instance
-                    )
+            # Lock the project so concurrent saves are serialized and versions stay monotonic
+            project = Project.objects.select_for_update().get(pk=project.pk)
+            if if_match and not etag_matches(if_match, flow_etag(project)):
+                return self.precondition_failed(project)
+
+            if request.query_params.get('mode') == 'replace':
+                replace_flow(project, flow_data)
+            else:
+                sync_flow(project, flow_data)
+            bump_flow_version(project, flow_hash=submitted_hash)
 
         # Return the updated flow
-        serializer = ProjectFlowSerializer(project)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(get_flow_representation(project), headers={'ETag': flow_etag(project)})
+
+
+    @action(detail=False, methods=['post'])
+    def layout(self, request, project_id=None):
+        """
+        Update node positions only.
+
+        Accepts `{"positions": [{"id": <node id>, "x": .., "y": ..}, ..]}` and
+        applies it with a single bulk update on Node; prompts, code, templates
+        and examples are left untouched. Only the layout version moves, so the
+        compiled execution plan stays cached.
+        """
+        project = self.get_project()
+        if_match = request.headers.get('If-Match')
+
+        if if_match and not etag_matches(if_match, flow_etag(project)):
+            return self.precondition_failed(project)
+
+        items = request.data.get('positions') if isinstance(request.data, dict) else None
+        if not isinstance(items, list):
+            return Response({'error': 'Send {"positions": [{"id": .., "x": .., "y": ..}, ..]}.'}, status=400)
+
+        positions = {}
+        for item in items:
+            try:
+                positions[str(item['id'])] = (float(item['x']), float(item['y']))
+            except (KeyError, TypeError, ValueError):
+                return Response({'error': 'Each position needs an id and numeric x and y.'}, status=400)
+
+        with transaction.atomic():
+            project = Project.objects.select_for_update().get(pk=project.pk)
+            if if_match and not etag_matches(if_match, flow_etag(project)):
+                return self.precondition_failed(project)
+
+            nodes = list(
+                Node.objects.filter(project=project, node_internal_id__in=positions)
+                .only('id', 'node_internal_id', 'position_x', 'position_y')
+            )
+            for node in nodes:
+                node.position_x, node.position_y = positions[node.node_internal_id]
+            Node.objects.bulk_update(nodes, ['position_x', 'position_y'])
+            bump_layout_version(project, {node.node_internal_id: positions[node.node_internal_id] for node in nodes})
+
+        return Response({'updated': len(nodes)}, headers={'ETag': flow_etag(project)})
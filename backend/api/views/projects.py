@@ -4,9 +4,12 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
+from django.shortcuts import get_object_or_404
 from api.permissions import IsCreator
 from api.models import Project, SupportedTranscriptLanguage
-from api.serializers import ProjectSerializer
+from api.serializers import ProjectSerializer, BatchRunSerializer, BatchRunCreateSerializer
+from api.services.batch_runs import create_batch
+from api.services.traces import trace_summary
 
 class ProjectViewSet(viewsets.ModelViewSet):
     """
@@ -64,7 +67,45 @@ class ProjectViewSet(viewsets.ModelViewSet):
         
         exists = Project.objects.filter(url_name=url_name).exists()
         return Response({"available": not exists})
-    
+
+    @action(detail=True, methods=['get', 'post'])
+    def batches(self, request, pk=None):
+        """
+        List the project's batch runs, or queue a new one over the jobs
+        matching the posted filters. Workers (run_job_worker) execute batches.
+        """
+        project = self.get_object()
+
+        if request.method == 'GET':
+            batches = project.batch_runs.order_by('-created_at')[:50]
+            return Response(BatchRunSerializer(batches, many=True).data)
+
+        serializer = BatchRunCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        batch = create_batch(project, request.user, serializer.get_filters(), serializer.validated_data['chunk_size'])
+        return Response(BatchRunSerializer(batch).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def traces(self, request, pk=None):
+        """
+        Slowest nodes and critical path over the project's recent runs
+        """
+        project = self.get_object()
+        try:
+            runs = min(max(int(request.query_params.get('runs', 50)), 1), 500)
+        except ValueError:
+            return Response({"error": "runs must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(trace_summary(project, runs))
+
+    @action(detail=True, methods=['get'], url_path=r'batches/(?P<batch_id>\d+)')
+    def batch(self, request, pk=None, batch_id=None):
+        """
+        Progress of a batch run
+        """
+        project = self.get_object()
+        batch = get_object_or_404(project.batch_runs, id=batch_id)
+        return Response(BatchRunSerializer(batch).data)
+
 class GeneralSettingsView(APIView):
     """
     API endpoint for general settings
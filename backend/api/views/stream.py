@@ -0,0 +1,97 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from api.engine.executor import NodeExecutionError, prepare_job, run_job_async
+from api.engine.loop import get_loop
+from api.engine.plan import FlowValidationError
+from api.engine.streaming import StreamingEvents, format_event
+from api.models import ClientJob
+
+
+def authenticate_client(request):
+    """
+    Resolve the JWT user of a plain Django request; None unless it is a client.
+    """
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    if result is None or not result[0].is_client:
+        return None
+    return result[0]
+
+
+def load_job(job_id):
+    return ClientJob.objects.filter(id=job_id).first()
+
+
+@csrf_exempt
+@require_POST
+async def stream_job_run(request, job_id):
+    """
+    Run a job and stream its progress as Server-Sent Events:
+
+    - `node`: a node started or finished (`cached` tells if it was memoized)
+    - `output`: the next piece of `output_markdown`
+    - `done`: the full output, also stored on the job
+    - `error`: the run failed (`node` is the failing node, if any)
+
+    The run continues and its output is stored even if the client disconnects.
+    Must be served by the ASGI application.
+    """
+    user = await sync_to_async(authenticate_client)(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided.'}, status=401)
+
+    job = await sync_to_async(load_job)(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Not found.'}, status=404)
+    if job.user_id != user.id:
+        return JsonResponse({'error': 'You do not have permission to run this job.'}, status=403)
+
+    try:
+        plan, transcripts = await sync_to_async(prepare_job)(job)
+    except FlowValidationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    queue = asyncio.Queue()
+    events = StreamingEvents(plan, asyncio.get_event_loop(), queue)
+    # The flow runs on its own loop; this only wraps the handle, so a
+    # disconnecting client does not cancel the run
+    run = asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+        run_job_async(job, plan, transcripts, events), get_loop()
+    ))
+
+    async def stream():
+        yield format_event('started', {'job': job.id, 'nodes': len(plan.steps)})
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, run}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield format_event(*getter.result())
+                continue
+
+            getter.cancel()
+            # Drain what was queued before the run ended
+            while not queue.empty():
+                yield format_event(*queue.get_nowait())
+            try:
+                output = run.result()
+            except NodeExecutionError as e:
+                yield format_event('error', {'error': str(e), 'node': e.step.node_id})
+            except Exception as e:
+                yield format_event('error', {'error': str(e), 'node': None})
+            else:
+                yield format_event('done', {'output': output})
+            return
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
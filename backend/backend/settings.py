@@ -37,6 +37,7 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'project_logos')
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # runserver serves the ASGI application (streaming endpoints)
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -99,6 +100,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
 
 
 # Database
@@ -157,3 +159,133 @@ STATIC_URL = '/staticfiles/'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Flow editor
+# Seconds a serialized flow version stays in the cache
+FLOW_CACHE_TIMEOUT = 60 * 60
+
+# Flow execution
+# LLM used by AI nodes; any OpenAI-compatible chat completions endpoint works.
+# Point LLM_BASE_URL at `manage.py run_mock_llm` to run flows offline
+FLOW_AI_PROVIDER = {
+    'BACKEND': 'api.engine.providers.OpenAIChatProvider',
+    'OPTIONS': {
+        'base_url': os.environ.get('LLM_BASE_URL', 'https://api.openai.com/v1'),
+        'api_key': os.environ.get('LLM_API_KEY', ''),
+        'model': os.environ.get('LLM_MODEL', 'gpt-4o-mini'),
+        'max_connections': 20,
+    },
+}
+# Concurrency, rate limit and retry policy for LLM calls, per process
+FLOW_AI_CLIENT = {
+    'MAX_CONCURRENCY': 16,
+    'REQUESTS_PER_SECOND': 10,
+    'BURST': 20,
+    'MAX_RETRIES': 4,
+    'BACKOFF_BASE': 0.5,
+    'BACKOFF_MAX': 20,
+}
+# Token budget for AI node requests. Examples are truncated to MAX_EXAMPLE_TOKENS
+# and dropped when they do not fit; oversized inputs are split into chunks of at
+# least MIN_CHUNK_TOKENS. Token counts use tiktoken when installed
+FLOW_AI_CONTEXT = {
+    'CONTEXT_WINDOW': 16384,
+    'RESERVED_OUTPUT_TOKENS': 1024,
+    'MAX_EXAMPLE_TOKENS': 1024,
+    'MIN_CHUNK_TOKENS': 256,
+    'TOKENIZER_ENCODING': 'cl100k_base',
+}
+# Seconds (wall clock) a code node may run before it is stopped
+FLOW_CODE_TIMEOUT = 10
+# Pre-warmed worker processes that run code nodes. Each call runs in a child of a
+# worker with CPU_SECONDS of CPU time and MEMORY_MB of memory; workers are
+# recycled after MAX_TASKS_PER_WORKER calls. Workers get an empty environment
+# and, when the server runs as root, switch to USER
+FLOW_CODE_POOL = {
+    'WORKERS': 4,
+    'CPU_SECONDS': 5,
+    'MEMORY_MB': 512,
+    'MAX_TASKS_PER_WORKER': 500,
+    'USER': 'nobody',
+}
+# Maximum AI/code nodes running at once in a process, and per project
+FLOW_MAX_CONCURRENCY = 32
+FLOW_MAX_PROJECT_CONCURRENCY = 8
+# Memo of AI/code node outputs keyed by node content and inputs. The in-process
+# LRU is bounded by entries and bytes; PERSISTENT adds a database tier shared by
+# workers, whose rows expire after PERSISTENT_TTL_DAYS and are capped at
+# PERSISTENT_MAX_ROWS by the pruning pass of run_job_worker
+FLOW_MEMO = {
+    'MAX_ENTRIES': 10000,
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'PERSISTENT': False,
+    'PERSISTENT_TTL_DAYS': 7,
+    'PERSISTENT_MAX_ROWS': 100000,
+}
+# Background job runs (`manage.py run_job_worker`). A claimed run is leased for
+# VISIBILITY_TIMEOUT seconds, renewed while it runs, and claimed again by another
+# worker if the lease expires. Failed runs are retried after RETRY_DELAY * 2^attempt seconds
+FLOW_JOB_QUEUE = {
+    'VISIBILITY_TIMEOUT': 300,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 30,
+    'POLL_INTERVAL': 1,
+    # Queued runs considered per claim when balancing projects
+    'CLAIM_SCAN': 100,
+}
+# Per-node execution traces of job runs, kept for TTL_DAYS. SAMPLE_RATE is the
+# fraction of runs traced
+FLOW_TRACES = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,
+    'TTL_DAYS': 14,
+    # Seconds between pruning passes of run_job_worker
+    'PRUNE_INTERVAL': 60 * 60,
+}
+
+# Speech to text
+# WhisperAPITranscriber posts audio to an OpenAI-compatible /audio/transcriptions
+# endpoint; WhisperTranscriber runs a local faster-whisper model instead and
+# FakeTranscriber returns deterministic text for tests and local development.
+# The transcriber is created once per process
+TRANSCRIBER = {
+    'BACKEND': 'api.transcription.backends.WhisperAPITranscriber',
+    'OPTIONS': {
+        'base_url': os.environ.get('TRANSCRIPTION_BASE_URL', os.environ.get('LLM_BASE_URL', 'https://api.openai.com/v1')),
+        'api_key': os.environ.get('TRANSCRIPTION_API_KEY', os.environ.get('LLM_API_KEY', '')),
+        'model': os.environ.get('TRANSCRIPTION_MODEL', 'whisper-1'),
+    },
+}
+# For transcribers with batch support (transcribe_batch: the local
+# WhisperTranscriber, not the API one), clips from concurrent
+# speech-to-text requests are collected for up to MAX_WAIT_MS or MAX_BATCH_SIZE
+# clips and transcribed as one batch. Other transcribers, or all of them with
+# ENABLED off, get every clip on its own. WORKERS bounds the batches (or single
+# clips) being transcribed at once per process
+TRANSCRIPTION_BATCHING = {
+    'ENABLED': True,
+    'MAX_BATCH_SIZE': 8,
+    'MAX_WAIT_MS': 10,
+    'WORKERS': 8,
+}
+# Resumable audio uploads (speech-to-text/uploads/). Chunks are kept under ROOT
+# until the upload is finalized or EXPIRE_HOURS have passed. On finalize the audio
+# is cut into SEGMENT_SECONDS windows, at the quietest point within
+# SILENCE_SEARCH_SECONDS of each boundary, and the segments go through the
+# transcription scheduler. Formats other than WAV are converted with ffmpeg when installed
+AUDIO_UPLOADS = {
+    'ROOT': os.path.join(BASE_DIR, 'audio_uploads'),
+    'CHUNK_SIZE': 5 * 1024 * 1024,
+    'MAX_CHUNK_SIZE': 64 * 1024 * 1024,
+    'MAX_SIZE': 2 * 1024 * 1024 * 1024,
+    'EXPIRE_HOURS': 24,
+    'SEGMENT_SECONDS': 30,
+    'SILENCE_SEARCH_SECONDS': 5,
+}
+# Transcript patches (PATCH transcripts/<id>/) are stored as edit rows, so an
+# edit writes only its own operations. Every COMPACT_EVERY edits, and in the
+# pruning pass of run_job_worker, pending edits are folded into the content
+TRANSCRIPT_EDITS = {
+    'COMPACT_EVERY': 50,
+}
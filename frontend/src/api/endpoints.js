@@ -6,6 +6,7 @@ export const endpoints = {
   flow: {
     get: (projectId) => api.get(`/projects/${projectId}/flow/`),
     save: (projectId, data) => api.post(`/projects/${projectId}/flow/`, data),
+    layout: (projectId, positions) => api.post(`/projects/${projectId}/flow/layout/`, { positions }),
   },
   
   // Projects endpoints